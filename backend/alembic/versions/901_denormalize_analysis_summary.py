@@ -0,0 +1,84 @@
+"""Denormalize analysis summary, view flags and measurements onto analyses
+
+Revision ID: 901denormsummary
+Revises: 900updateuser
+Create Date: 2025-05-02 10:00:00.000000
+
+"""
+import os
+import json
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import text, inspect
+from typing import Sequence, Union
+
+
+# revision identifiers, used by Alembic.
+revision: str = '901denormsummary'
+down_revision: Union[str, None] = '900updateuser'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+RESULTS_DIR = "static/results"
+
+
+def _load_result(analysis_id, result_path):
+    """Find and parse the result file of an analysis, None if it is missing or unreadable"""
+    for path in (result_path, os.path.join(RESULTS_DIR, f"{analysis_id}.json")):
+        if not path or not os.path.exists(path):
+            continue
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            print(f"Skipping unreadable result file {path}")
+            return None
+    return None
+
+
+def upgrade():
+    conn = op.get_bind()
+    inspector = inspect(conn)
+
+    existing = {column['name'] for column in inspector.get_columns('analyses')}
+
+    with op.batch_alter_table('analyses') as batch_op:
+        if 'summary' not in existing:
+            batch_op.add_column(sa.Column('summary', sa.Text(), nullable=True))
+        if 'has_ap' not in existing:
+            batch_op.add_column(sa.Column('has_ap', sa.Boolean(), nullable=False, server_default=sa.false()))
+        if 'has_lat' not in existing:
+            batch_op.add_column(sa.Column('has_lat', sa.Boolean(), nullable=False, server_default=sa.false()))
+        if 'measurements' not in existing:
+            batch_op.add_column(sa.Column('measurements', sa.JSON(), nullable=True))
+
+    # Backfill from the result files of existing analyses
+    rows = conn.execute(text(
+        "SELECT id, result_path, ap_image_path, lat_image_path FROM analyses WHERE summary IS NULL"
+    )).fetchall()
+
+    update = text(
+        "UPDATE analyses SET summary = :summary, has_ap = :has_ap, has_lat = :has_lat, "
+        "measurements = :measurements WHERE id = :id"
+    )
+
+    for analysis_id, result_path, ap_image_path, lat_image_path in rows:
+        result = _load_result(analysis_id, result_path)
+        if result is None:
+            continue
+
+        conn.execute(update, {
+            "id": analysis_id,
+            "summary": result.get("summary", "No summary available"),
+            "has_ap": bool(result.get("has_ap", ap_image_path is not None)),
+            "has_lat": bool(result.get("has_lat", lat_image_path is not None)),
+            "measurements": json.dumps(result.get("measurements", []))
+        })
+
+
+def downgrade():
+    with op.batch_alter_table('analyses') as batch_op:
+        batch_op.drop_column('measurements')
+        batch_op.drop_column('has_lat')
+        batch_op.drop_column('has_ap')
+        batch_op.drop_column('summary')
@@ -0,0 +1,39 @@
+"""Track background analysis job state on analyses
+
+Revision ID: 902jobstatus
+Revises: 901denormsummary
+Create Date: 2025-05-06 09:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+from typing import Sequence, Union
+
+
+# revision identifiers, used by Alembic.
+revision: str = '902jobstatus'
+down_revision: Union[str, None] = '901denormsummary'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    inspector = inspect(conn)
+
+    existing = {column['name'] for column in inspector.get_columns('analyses')}
+
+    if 'error' not in existing:
+        with op.batch_alter_table('analyses') as batch_op:
+            batch_op.add_column(sa.Column('error', sa.Text(), nullable=True))
+
+    # Analyses created before the job queue were processed inline
+    op.execute(sa.text("UPDATE analyses SET status = 'done' WHERE status = 'new'"))
+
+
+def downgrade():
+    op.execute(sa.text("UPDATE analyses SET status = 'new' WHERE status = 'done'"))
+
+    with op.batch_alter_table('analyses') as batch_op:
+        batch_op.drop_column('error')
@@ -0,0 +1,43 @@
+"""Add composite indexes for role-filtered history listings
+
+Revision ID: 903listingindexes
+Revises: 902jobstatus
+Create Date: 2025-05-14 11:00:00.000000
+
+"""
+from alembic import op
+from sqlalchemy import inspect
+from typing import Sequence, Union
+
+
+# revision identifiers, used by Alembic.
+revision: str = '903listingindexes'
+down_revision: Union[str, None] = '902jobstatus'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = {
+    'ix_analyses_timestamp_id': ['timestamp', 'id'],
+    'ix_analyses_user_id_timestamp': ['user_id', 'timestamp', 'id'],
+    'ix_analyses_patient_id_timestamp': ['patient_id', 'timestamp', 'id'],
+}
+
+
+def upgrade():
+    conn = op.get_bind()
+    existing = {index['name'] for index in inspect(conn).get_indexes('analyses')}
+
+    for name, columns in INDEXES.items():
+        if name not in existing:
+            op.create_index(name, 'analyses', columns, unique=False)
+
+    # Superseded by ix_analyses_timestamp_id
+    if 'ix_analyses_timestamp' in existing:
+        op.drop_index('ix_analyses_timestamp', table_name='analyses')
+
+
+def downgrade():
+    op.create_index('ix_analyses_timestamp', 'analyses', ['timestamp'], unique=False)
+
+    for name in INDEXES:
+        op.drop_index(name, table_name='analyses')
@@ -0,0 +1,53 @@
+"""Add materialized analysis counters for the dashboard statistics
+
+Revision ID: 904analysiscounters
+Revises: 903listingindexes
+Create Date: 2025-05-16 09:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+from typing import Sequence, Union
+
+
+# revision identifiers, used by Alembic.
+revision: str = '904analysiscounters'
+down_revision: Union[str, None] = '903listingindexes'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    if 'analysis_counters' not in inspect(conn).get_table_names():
+        op.create_table(
+            'analysis_counters',
+            sa.Column('dimension', sa.String(), nullable=False),
+            sa.Column('key', sa.String(), nullable=False),
+            sa.Column('count', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('dimension', 'key')
+        )
+
+    # Backfill with one aggregate pass per dimension
+    conn.execute(sa.text("DELETE FROM analysis_counters"))
+    conn.execute(sa.text(
+        "INSERT INTO analysis_counters (dimension, key, count) "
+        "SELECT 'total', 'total', COUNT(*) FROM analyses"
+    ))
+    conn.execute(sa.text(
+        "INSERT INTO analysis_counters (dimension, key, count) "
+        "SELECT 'user', CAST(user_id AS VARCHAR), COUNT(*) FROM analyses GROUP BY user_id"
+    ))
+    conn.execute(sa.text(
+        "INSERT INTO analysis_counters (dimension, key, count) "
+        "SELECT 'patient', patient_id, COUNT(*) FROM analyses WHERE patient_id IS NOT NULL GROUP BY patient_id"
+    ))
+    conn.execute(sa.text(
+        "INSERT INTO analysis_counters (dimension, key, count) "
+        "SELECT 'status', status, COUNT(*) FROM analyses WHERE status IS NOT NULL GROUP BY status"
+    ))
+
+
+def downgrade():
+    op.drop_table('analysis_counters')
@@ -0,0 +1,62 @@
+"""Add content-addressed image blobs and the inference result cache
+
+Revision ID: 905imageblobs
+Revises: 904analysiscounters
+Create Date: 2025-05-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+from typing import Sequence, Union
+
+
+# revision identifiers, used by Alembic.
+revision: str = '905imageblobs'
+down_revision: Union[str, None] = '904analysiscounters'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    inspector = inspect(conn)
+    tables = inspector.get_table_names()
+
+    if 'image_blobs' not in tables:
+        op.create_table(
+            'image_blobs',
+            sa.Column('sha256', sa.String(length=64), nullable=False),
+            sa.Column('path', sa.String(), nullable=False),
+            sa.Column('size', sa.Integer(), nullable=False),
+            sa.Column('ref_count', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('sha256')
+        )
+
+    if 'inference_cache' not in tables:
+        op.create_table(
+            'inference_cache',
+            sa.Column('study_key', sa.String(), nullable=False),
+            sa.Column('engine_version', sa.String(), nullable=False),
+            sa.Column('result', sa.JSON(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('study_key', 'engine_version')
+        )
+
+    # Existing analyses keep their per-analysis image files and have no hash
+    columns = {column['name'] for column in inspector.get_columns('analyses')}
+    with op.batch_alter_table('analyses') as batch_op:
+        if 'ap_image_hash' not in columns:
+            batch_op.add_column(sa.Column('ap_image_hash', sa.String(length=64), nullable=True))
+        if 'lat_image_hash' not in columns:
+            batch_op.add_column(sa.Column('lat_image_hash', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('analyses') as batch_op:
+        batch_op.drop_column('lat_image_hash')
+        batch_op.drop_column('ap_image_hash')
+
+    op.drop_table('inference_cache')
+    op.drop_table('image_blobs')
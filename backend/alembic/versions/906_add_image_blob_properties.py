@@ -0,0 +1,42 @@
+"""Record format, dimensions and bit depth of uploaded images
+
+Revision ID: 906blobproperties
+Revises: 905imageblobs
+Create Date: 2025-05-21 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+from typing import Sequence, Union
+
+
+# revision identifiers, used by Alembic.
+revision: str = '906blobproperties'
+down_revision: Union[str, None] = '905imageblobs'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = {
+    'format': sa.String(),
+    'width': sa.Integer(),
+    'height': sa.Integer(),
+    'bit_depth': sa.Integer(),
+}
+
+
+def upgrade():
+    conn = op.get_bind()
+    existing = {column['name'] for column in inspect(conn).get_columns('image_blobs')}
+
+    # Blobs stored before this revision keep NULL properties
+    with op.batch_alter_table('image_blobs') as batch_op:
+        for name, column_type in COLUMNS.items():
+            if name not in existing:
+                batch_op.add_column(sa.Column(name, column_type, nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('image_blobs') as batch_op:
+        for name in reversed(list(COLUMNS)):
+            batch_op.drop_column(name)
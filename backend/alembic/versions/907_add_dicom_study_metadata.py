@@ -0,0 +1,48 @@
+"""Index study metadata of DICOM uploads on analyses
+
+Revision ID: 907dicommetadata
+Revises: 906blobproperties
+Create Date: 2025-05-28 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+from typing import Sequence, Union
+
+
+# revision identifiers, used by Alembic.
+revision: str = '907dicommetadata'
+down_revision: Union[str, None] = '906blobproperties'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = {
+    'study_date': sa.Date(),
+    'modality': sa.String(length=16),
+    'ap_pixel_spacing': sa.JSON(),
+    'lat_pixel_spacing': sa.JSON(),
+}
+
+
+def upgrade():
+    conn = op.get_bind()
+    inspector = inspect(conn)
+    existing = {column['name'] for column in inspector.get_columns('analyses')}
+    indexes = {index['name'] for index in inspector.get_indexes('analyses')}
+
+    # Analyses of non-DICOM uploads keep NULL metadata
+    with op.batch_alter_table('analyses') as batch_op:
+        for name, column_type in COLUMNS.items():
+            if name not in existing:
+                batch_op.add_column(sa.Column(name, column_type, nullable=True))
+
+    if 'ix_analyses_patient_id_study_date' not in indexes:
+        op.create_index('ix_analyses_patient_id_study_date', 'analyses', ['patient_id', 'study_date'])
+
+
+def downgrade():
+    op.drop_index('ix_analyses_patient_id_study_date', table_name='analyses')
+    with op.batch_alter_table('analyses') as batch_op:
+        for name in reversed(list(COLUMNS)):
+            batch_op.drop_column(name)
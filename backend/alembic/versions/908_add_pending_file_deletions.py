@@ -0,0 +1,34 @@
+"""Queue file deletions of deleted analyses for the background file cleaner
+
+Revision ID: 908filedeletions
+Revises: 907dicommetadata
+Create Date: 2025-06-04 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+from typing import Sequence, Union
+
+
+# revision identifiers, used by Alembic.
+revision: str = '908filedeletions'
+down_revision: Union[str, None] = '907dicommetadata'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    if 'pending_file_deletions' not in inspect(conn).get_table_names():
+        op.create_table(
+            'pending_file_deletions',
+            sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column('key', sa.String(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id')
+        )
+
+
+def downgrade():
+    op.drop_table('pending_file_deletions')
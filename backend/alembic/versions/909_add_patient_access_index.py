@@ -0,0 +1,46 @@
+"""Add the maintained patient index behind the patient picker
+
+Revision ID: 909patientaccess
+Revises: 908filedeletions
+Create Date: 2025-06-10 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+from typing import Sequence, Union
+
+
+# revision identifiers, used by Alembic.
+revision: str = '909patientaccess'
+down_revision: Union[str, None] = '908filedeletions'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    if 'patient_access' not in inspect(conn).get_table_names():
+        op.create_table(
+            'patient_access',
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('patient_id', sa.String(), nullable=False),
+            sa.Column('study_count', sa.Integer(), nullable=False),
+            sa.Column('last_study_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('user_id', 'patient_id')
+        )
+        op.create_index('ix_patient_access_patient_id', 'patient_access', ['patient_id'])
+
+    # Backfill with one aggregate pass
+    conn.execute(sa.text("DELETE FROM patient_access"))
+    conn.execute(sa.text(
+        "INSERT INTO patient_access (user_id, patient_id, study_count, last_study_at) "
+        "SELECT user_id, patient_id, COUNT(*), MAX(timestamp) FROM analyses "
+        "WHERE patient_id IS NOT NULL GROUP BY user_id, patient_id"
+    ))
+
+
+def downgrade():
+    op.drop_index('ix_patient_access_patient_id', table_name='patient_access')
+    op.drop_table('patient_access')
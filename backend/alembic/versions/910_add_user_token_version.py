@@ -0,0 +1,32 @@
+"""Add the token version of users, bumped to revoke their access tokens
+
+Revision ID: 910tokenversion
+Revises: 909patientaccess
+Create Date: 2025-06-16 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+from typing import Sequence, Union
+
+
+# revision identifiers, used by Alembic.
+revision: str = '910tokenversion'
+down_revision: Union[str, None] = '909patientaccess'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    existing = {column['name'] for column in inspect(conn).get_columns('users')}
+
+    if 'token_version' not in existing:
+        with op.batch_alter_table('users') as batch_op:
+            batch_op.add_column(sa.Column('token_version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('token_version')
@@ -0,0 +1,45 @@
+"""Add refresh tokens, stored hashed and rotated on every use
+
+Revision ID: 911refreshtokens
+Revises: 910tokenversion
+Create Date: 2025-06-20 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+from typing import Sequence, Union
+
+
+# revision identifiers, used by Alembic.
+revision: str = '911refreshtokens'
+down_revision: Union[str, None] = '910tokenversion'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    if 'refresh_tokens' not in inspect(conn).get_table_names():
+        op.create_table(
+            'refresh_tokens',
+            sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column('token_hash', sa.String(length=64), nullable=False),
+            sa.Column('family_id', sa.String(length=32), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('token_version', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('expires_at', sa.DateTime(), nullable=False),
+            sa.Column('used_at', sa.DateTime(), nullable=True),
+            sa.Column('revoked_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('token_hash')
+        )
+        op.create_index('ix_refresh_tokens_family_id', 'refresh_tokens', ['family_id'])
+        op.create_index('ix_refresh_tokens_user_id', 'refresh_tokens', ['user_id'])
+        op.create_index('ix_refresh_tokens_expires_at', 'refresh_tokens', ['expires_at'])
+
+
+def downgrade():
+    op.drop_table('refresh_tokens')
@@ -0,0 +1,33 @@
+"""Add a row version to analyses, keying their cached responses
+
+Revision ID: 912analysisupdatedat
+Revises: 911refreshtokens
+Create Date: 2025-06-27 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+from typing import Sequence, Union
+
+
+# revision identifiers, used by Alembic.
+revision: str = '912analysisupdatedat'
+down_revision: Union[str, None] = '911refreshtokens'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    existing = {column['name'] for column in inspect(conn).get_columns('analyses')}
+
+    # Existing rows keep NULL until their next change
+    if 'updated_at' not in existing:
+        with op.batch_alter_table('analyses') as batch_op:
+            batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('analyses') as batch_op:
+        batch_op.drop_column('updated_at')
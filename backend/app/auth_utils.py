@@ -1,21 +1,181 @@
 # auth_utils.py
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import time
+from typing import Dict, Optional, Tuple
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from fastapi import Depends, status, HTTPException
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
 
+from app import database
 from app.database import get_db
 from app import schemas, models
+from app.cache import TTLCache
 from app.config import settings
 
-# Password hashing context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing context; hashes of another bcrypt cost need an update
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS)
+
+# bcrypt releases the GIL, so a few dedicated threads hash in parallel without
+# holding the event loop or slots of the default threadpool
+_hash_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    thread_name_prefix="password-hash"
+)
+_hash_slots = threading.BoundedSemaphore(settings.PASSWORD_HASH_MAX_PENDING)
 
 # OAuth2 setup for token authentication
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
 
+# Recently authenticated users, so most requests skip the user query
+user_cache = TTLCache(maxsize=settings.USER_CACHE_SIZE, ttl=settings.USER_CACHE_TTL_SECONDS)
+
+class CachedUser:
+    """Detached snapshot of the user fields needed by endpoints (no password hash)"""
+    __slots__ = ("id", "email", "username", "role", "is_active", "created_at")
+
+    def __init__(self, user: models.User):
+        self.id = user.id
+        self.email = user.email
+        self.username = user.username
+        self.role = user.role
+        self.is_active = user.is_active
+        self.created_at = user.created_at
+
+class TokenUser:
+    """The user an access token was issued to, from the token's claims alone"""
+    __slots__ = ("id", "username", "role", "is_active")
+
+    def __init__(self, token_data: schemas.TokenData):
+        self.id = token_data.id
+        self.username = token_data.username
+        self.role = models.UserRole(token_data.role)
+        self.is_active = True
+
+class TokenVersions:
+    """
+    Token version of every user and whether they are active, so access
+    tokens can be checked without the database.
+
+    Reloaded with one query when older than ttl seconds; users created
+    since are looked up on first use, and changes committed by this process
+    are applied right away by update().
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._versions: Dict[int, Tuple[int, bool]] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._refreshing = threading.Lock()
+
+    def lookup(self, user_id: int) -> Optional[Tuple[int, bool]]:
+        """
+        Get the current token version of a user and whether they are active,
+        None for users that do not exist.
+        """
+        loaded_at = self._loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at > self.ttl:
+            # One thread reloads, the others go on with what is loaded
+            if self._refreshing.acquire(blocking=loaded_at is None):
+                try:
+                    self.refresh()
+                finally:
+                    self._refreshing.release()
+
+        with self._lock:
+            found = self._versions.get(user_id)
+        if found is None:
+            found = self._load(user_id)
+        return found
+
+    def refresh(self) -> None:
+        """Reload the versions from the users table"""
+        db = database.SessionLocal()
+        try:
+            rows = db.query(models.User.id, models.User.token_version, models.User.is_active).all()
+        finally:
+            db.close()
+
+        with self._lock:
+            self._versions = {row.id: (row.token_version or 0, bool(row.is_active)) for row in rows}
+            self._loaded_at = time.monotonic()
+
+    def _load(self, user_id: int) -> Optional[Tuple[int, bool]]:
+        # A user created since the last reload, or none at all
+        db = database.SessionLocal()
+        try:
+            row = db.query(models.User.token_version, models.User.is_active).filter(
+                models.User.id == user_id
+            ).first()
+        finally:
+            db.close()
+
+        if row is None:
+            return None
+        self.update(user_id, row.token_version, row.is_active)
+        return (row.token_version or 0, bool(row.is_active))
+
+    def update(self, user_id: int, version: int, is_active: bool) -> None:
+        """Apply a change to a user committed by this process"""
+        with self._lock:
+            self._versions[user_id] = (version or 0, bool(is_active))
+
+    def forget(self, user_id: int) -> None:
+        """Drop a deleted user, whose ID may be given to a new one"""
+        with self._lock:
+            self._versions.pop(user_id, None)
+
+    def clear(self) -> None:
+        """Forget everything, so the next lookup reloads"""
+        with self._lock:
+            self._versions = {}
+            self._loaded_at = None
+
+token_versions = TokenVersions(settings.TOKEN_VERSION_REFRESH_SECONDS)
+
+def invalidate_user(user_id: int):
+    """Drop a user from the cache after their role or status changed"""
+    user_cache.invalidate(user_id)
+
+def revoke_tokens(user: models.User):
+    """
+    Revoke every access token issued to a user so far, when the user's
+    transaction commits. Part of the caller's transaction.
+    """
+    user.token_version = (user.token_version or 0) + 1
+
+# Changed and deleted users of a session, applied to the caches on commit
+_CHANGED_USERS = "changed_users"
+
+@event.listens_for(models.User, "after_update")
+def _record_updated_user(mapper, connection, target):
+    changes = object_session(target).info.setdefault(_CHANGED_USERS, {})
+    changes[target.id] = (target.token_version, target.is_active)
+
+@event.listens_for(models.User, "after_delete")
+def _record_deleted_user(mapper, connection, target):
+    object_session(target).info.setdefault(_CHANGED_USERS, {})[target.id] = None
+
+@event.listens_for(Session, "after_commit")
+def _apply_user_changes(session):
+    for user_id, change in session.info.pop(_CHANGED_USERS, {}).items():
+        invalidate_user(user_id)
+        if change is None:
+            token_versions.forget(user_id)
+        else:
+            token_versions.update(user_id, *change)
+
+@event.listens_for(Session, "after_rollback")
+def _drop_user_changes(session):
+    session.info.pop(_CHANGED_USERS, None)
+
 def hash_password(password: str):
     """Hash a password using bcrypt"""
     return pwd_context.hash(password)
@@ -24,6 +184,43 @@ def verify_password(plain_password, hashed_password):
     """Verify a password against its hash"""
     return pwd_context.verify(plain_password, hashed_password)
 
+async def _run_hashing(func, *args):
+    # Beyond PASSWORD_HASH_MAX_PENDING waiting requests, shed load instead of queueing
+    if not _hash_slots.acquire(blocking=False):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many sign-ins in progress, try again shortly",
+            headers={"Retry-After": "1"}
+        )
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_hash_executor, functools.partial(func, *args))
+    finally:
+        _hash_slots.release()
+
+async def hash_password_async(password: str) -> str:
+    """Hash a password on the password hashing threads"""
+    return await _run_hashing(pwd_context.hash, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verify a password on the password hashing threads.
+
+    Returns:
+        Tuple[bool, Optional[str]]: Whether the password matches and, if its
+            hash has another bcrypt cost than BCRYPT_ROUNDS, a new hash to store
+    """
+    return await _run_hashing(pwd_context.verify_and_update, plain_password, hashed_password)
+
+def token_claims(user: models.User) -> dict:
+    """Claims of an access token for a user, enough to authorize requests without the database"""
+    return {
+        "user_id": user.id,
+        "username": user.username,
+        "role": user.role.value,
+        "ver": user.token_version or 0
+    }
+
 def create_access_token(data: dict):
     """Create a JWT access token with expiration time"""
     to_encode = data.copy()
@@ -49,8 +246,13 @@ def verify_access_token(token: str, credentials_exception):
         if id is None:
             raise credentials_exception
         
-        token_data = schemas.TokenData(id=id)
-    except JWTError:
+        token_data = schemas.TokenData(
+            id=id,
+            username=payload.get("username"),
+            role=payload.get("role"),
+            version=payload.get("ver")
+        )
+    except (JWTError, ValueError):
         raise credentials_exception
     
     return token_data
@@ -66,11 +268,37 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     # Verify token
     token_data = verify_access_token(token, credentials_exception)
     
-    # Get user from database
-    user = db.query(models.User).filter(models.User.id == token_data.id).first()
+    # Tokens with a version are checked against the version table only
+    if token_data.version is not None:
+        found = token_versions.lookup(token_data.id)
+        
+        # Users deleted since the token was issued have no version
+        if found is None:
+            raise credentials_exception
+        
+        version, active = found
+        if token_data.version != version:
+            raise credentials_exception
+        
+        if not active:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Inactive user account"
+            )
+        
+        return TokenUser(token_data)
+    
+    # Tokens issued before token versions: get user from the cache, falling back to the database
+    user = user_cache.get(token_data.id)
     
     if user is None:
-        raise credentials_exception
+        db_user = db.query(models.User).filter(models.User.id == token_data.id).first()
+        
+        if db_user is None:
+            raise credentials_exception
+        
+        user = CachedUser(db_user)
+        user_cache.set(user.id, user)
         
     if not user.is_active:
         raise HTTPException(
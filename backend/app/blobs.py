@@ -0,0 +1,182 @@
+import os
+import uuid
+import hashlib
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple, Optional
+from fastapi import UploadFile
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.config import settings
+from app import file_io
+from app.storage import get_storage
+from app.ingest import UploadValidator, ImageInfo, EXTENSIONS, inspect_image
+from app.models import ImageBlob
+
+class Upload(NamedTuple):
+    """An upload received into the blob store's staging area, or a local file to import"""
+    sha256: str
+    tmp_path: str
+    size: int
+    info: ImageInfo
+
+def blob_path(digest: str, fmt: str = "JPEG") -> str:
+    """Storage key of the blob with the given SHA-256, fanned out by hash prefix"""
+    return f"{settings.BLOBS_DIR}/{digest[:2]}/{digest}.{EXTENSIONS[fmt]}"
+
+async def receive_upload(file: UploadFile, label: str) -> Upload:
+    """
+    Stream an upload to a local staging file, hashing and validating it on
+    the way. Non-image and oversized uploads are rejected as soon as that is
+    known; accepted ones have their image header checked.
+
+    The upload has already been spooled to a temporary file by the multipart
+    parser. For POST /analyses, UploadValidationMiddleware ran the same
+    checks while it arrived; batch uploads are only checked here, so that
+    a bad file rejects its studies rather than the whole request.
+
+    Args:
+        file: The uploaded file
+        label: Name of the upload in error messages, e.g. "ap_image"
+
+    Raises:
+        HTTPException: 413, 415 or 422 for rejected uploads, see app/ingest.py
+
+    Returns:
+        Upload: Content hash, staging path, size and image properties of the upload
+    """
+    hasher = hashlib.sha256()
+    validator = UploadValidator(label)
+    tmp_path = os.path.join(settings.UPLOAD_TMP_DIR, uuid.uuid4().hex)
+    size = await file_io.stream_upload(file, tmp_path, hasher=hasher, validator=validator)
+
+    try:
+        info = await file_io.run_blocking(inspect_image, tmp_path, label, validator.finish())
+    except BaseException:
+        await file_io.run_blocking(os.remove, tmp_path)
+        raise
+
+    return Upload(hasher.hexdigest(), tmp_path, size, info)
+
+def receive_file(path: str, label: str) -> Upload:
+    """
+    Hash and validate a local image file in place, like receive_upload does
+    for uploads (blocking). Used by the bulk importer.
+
+    Raises:
+        HTTPException: 413, 415 or 422 for rejected files, see app/ingest.py
+
+    Returns:
+        Upload: Content hash, the file's own path, size and image properties
+    """
+    hasher = hashlib.sha256()
+    validator = UploadValidator(label)
+    size = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(settings.UPLOAD_CHUNK_SIZE), b""):
+            validator(chunk)
+            hasher.update(chunk)
+            size += len(chunk)
+
+    info = inspect_image(path, label, validator.finish())
+    return Upload(hasher.hexdigest(), path, size, info)
+
+def store_file(upload: Upload, move: bool = True) -> str:
+    """
+    Put the file of an upload into the blob store, unless an identical blob
+    is stored already (blocking). Without move the file is copied.
+
+    Call once the reference to the blob (add_reference) has committed: the
+    file cleaner only deletes blobs that no committed row references, so an
+    object found here stays, and one it deleted before the commit is
+    written again.
+
+    Returns:
+        str: Storage key of the blob
+    """
+    key = blob_path(upload.sha256, upload.info.format)
+    storage = get_storage()
+    if storage.exists(key):
+        # Already stored by an earlier upload of the same file
+        if move:
+            os.remove(upload.tmp_path)
+        return key
+
+    storage.put_file(key, upload.tmp_path, move=move)
+    return key
+
+def add_reference(db: Session, upload: Upload) -> str:
+    """
+    Count one more reference to the blob of a stored upload, recording the
+    blob on first use. The reference is part of the caller's transaction.
+
+    Returns:
+        str: Storage key of the blob
+    """
+    path = blob_path(upload.sha256, upload.info.format)
+    values = {
+        "sha256": upload.sha256,
+        "path": path,
+        "size": upload.size,
+        "format": upload.info.format,
+        "width": upload.info.width,
+        "height": upload.info.height,
+        "bit_depth": upload.info.bit_depth,
+        "ref_count": 1
+    }
+    dialect = db.get_bind().dialect.name
+
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        stmt = insert(ImageBlob).values(**values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ImageBlob.sha256],
+            set_={"ref_count": ImageBlob.ref_count + 1}
+        )
+        db.execute(stmt)
+        return path
+
+    updated = db.query(ImageBlob).filter(ImageBlob.sha256 == upload.sha256).update(
+        {"ref_count": ImageBlob.ref_count + 1}, synchronize_session=False
+    )
+    if not updated:
+        db.add(ImageBlob(**values))
+    return path
+
+def release(db: Session, digests: Iterable[Optional[str]]) -> List[str]:
+    """
+    Drop one reference to each blob, with set-based statements however many
+    digests are given. A digest listed n times drops n references. Blobs
+    nobody references any more are removed from the table; queue their
+    objects for the file cleaner (retention.enqueue_file_deletions) in the
+    same transaction.
+
+    Args:
+        db: Database session
+        digests: SHA-256 of the released blobs, None entries are ignored
+
+    Returns:
+        List[str]: Storage keys of the orphaned blobs
+    """
+    counts = Counter(digest for digest in digests if digest)
+    if not counts:
+        return []
+
+    by_count: Dict[int, List[str]] = {}
+    for digest, count in counts.items():
+        by_count.setdefault(count, []).append(digest)
+    for count, group in by_count.items():
+        db.query(ImageBlob).filter(ImageBlob.sha256.in_(group)).update(
+            {"ref_count": ImageBlob.ref_count - count}, synchronize_session=False
+        )
+
+    orphaned = db.query(ImageBlob.sha256, ImageBlob.path).filter(
+        ImageBlob.sha256.in_(list(counts)),
+        ImageBlob.ref_count <= 0
+    ).all()
+    if orphaned:
+        db.query(ImageBlob).filter(
+            ImageBlob.sha256.in_([blob.sha256 for blob in orphaned])
+        ).delete(synchronize_session=False)
+
+    return [blob.path for blob in orphaned]
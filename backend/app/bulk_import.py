@@ -0,0 +1,382 @@
+"""
+Bulk import of studies, e.g. when onboarding a clinic.
+
+Usage:
+    python -m app.bulk_import SOURCE --user USERNAME [--workers 4] [--batch-size 200]
+
+SOURCE is a CSV manifest with patient_id, ap_path and lat_path columns
+(paths relative to the manifest; any of them may be empty), or a directory
+in which every folder holding an ap.* and/or lat.* image is one study of the
+patient named by its top-level folder, e.g. PATIENT-001/2024-03-01/ap.dcm.
+DICOM studies take the patient from their header when none is given.
+
+Studies whose images were imported for the same patient before are skipped,
+so an interrupted import is resumed by running it again.
+"""
+import os
+import csv
+import time
+import logging
+import argparse
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional
+from fastapi import HTTPException
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from app import database, counters, blobs, retention
+from app.config import settings
+from app.models import Analysis, AnalysisStatus, User
+from app.storage import get_storage
+from app.dicom import study_patient, study_values, index_patient
+from app.utils import generate_analysis_id, get_result_path, summarize_analysis_result
+from app.inference import load_engine
+from app.inference import cache as inference_cache
+from app.jobs.runner import run_analysis_batch
+
+logger = logging.getLogger(__name__)
+
+VIEWS = ("ap", "lat")
+
+class Study(NamedTuple):
+    """One study to import: local image files of an AP and/or lateral view"""
+    patient_id: Optional[str]
+    ap_path: Optional[str]
+    lat_path: Optional[str]
+
+@dataclass
+class ImportReport:
+    """Outcome of an import run"""
+    imported: int = 0  # Analyses created
+    skipped: int = 0  # Imported by an earlier run, or listed twice
+    rejected: int = 0  # Studies whose images were refused
+    failed: int = 0  # Analyses that failed, already counted as imported or skipped
+    elapsed: float = 0.0
+
+    @property
+    def studies(self) -> int:
+        return self.imported + self.skipped + self.rejected
+
+    @property
+    def studies_per_second(self) -> float:
+        return self.studies / self.elapsed if self.elapsed else 0.0
+
+def read_manifest(path: str) -> Iterator[Study]:
+    """Studies listed in a CSV manifest"""
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            paths = {}
+            for view in VIEWS:
+                path = (row.get(f"{view}_path") or "").strip()
+                paths[view] = os.path.join(base, path) if path else None
+            yield Study((row.get("patient_id") or "").strip() or None, paths["ap"], paths["lat"])
+
+def walk_directory(root: str) -> Iterator[Study]:
+    """Studies found in a directory tree, in a stable order"""
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories.sort()
+        views = {}
+        for name in sorted(files):
+            view = os.path.splitext(name)[0].lower()
+            if view in VIEWS:
+                views.setdefault(view, os.path.join(directory, name))
+        if not views:
+            continue
+
+        relative = os.path.relpath(directory, root)
+        patient_id = None if relative == "." else relative.split(os.sep)[0]
+        yield Study(patient_id, views.get("ap"), views.get("lat"))
+
+def discover_studies(source: str) -> Iterator[Study]:
+    """Studies of a manifest file or directory, see the module docstring"""
+    return walk_directory(source) if os.path.isdir(source) else read_manifest(source)
+
+def ingest_study(study: Study) -> Dict[str, Any]:
+    """
+    Validate, hash and store the images of one study. Runs in a worker
+    process, so it only returns plain data and must not touch the database.
+
+    Returns:
+        Dict[str, Any]: patient_id and uploads by view, or error
+    """
+    try:
+        uploads = {}
+        for view in VIEWS:
+            path = getattr(study, f"{view}_path")
+            if path:
+                uploads[view] = blobs.receive_file(path, path)
+        if not uploads:
+            return {"error": "Study has no images"}
+
+        headers = {view: upload.info.dicom for view, upload in uploads.items() if upload.info.dicom}
+        patient_id = study_patient(study.patient_id, headers)
+
+        # Copy into the blob store; files stored by an earlier run are reused
+        for upload in uploads.values():
+            blobs.store_file(upload, move=False)
+
+    except HTTPException as e:
+        return {"error": e.detail}
+    except OSError as e:
+        return {"error": str(e)}
+
+    return {"patient_id": patient_id, "uploads": uploads}
+
+def _chunks(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+@contextmanager
+def _pool(workers: int) -> Iterator[Callable]:
+    # A map function running on a process pool, or inline without workers
+    if workers <= 0:
+        load_engine()
+        yield lambda func, items: list(map(func, items))
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=load_engine) as executor:
+        yield lambda func, items: list(executor.map(func, items))
+
+def _existing_analyses(db: Session, ingested: List[Dict[str, Any]]) -> Dict[tuple, Any]:
+    ap_hashes = {item["uploads"]["ap"].sha256 for item in ingested if "ap" in item["uploads"]}
+    lat_hashes = {item["uploads"]["lat"].sha256 for item in ingested if "lat" in item["uploads"]}
+
+    rows = db.query(
+        Analysis.id, Analysis.patient_id, Analysis.ap_image_hash, Analysis.lat_image_hash,
+        Analysis.ap_image_path, Analysis.lat_image_path, Analysis.status
+    ).filter(
+        Analysis.patient_id.in_({item["patient_id"] for item in ingested}),
+        or_(Analysis.ap_image_hash.in_(ap_hashes), Analysis.lat_image_hash.in_(lat_hashes))
+    ).all()
+
+    return {(row.patient_id, row.ap_image_hash, row.lat_image_hash): row for row in rows}
+
+def _study_hashes(item: Dict[str, Any]) -> tuple:
+    uploads = item["uploads"]
+    return tuple(uploads[view].sha256 if view in uploads else None for view in VIEWS)
+
+def record_batch(db: Session, user: User, studies: List[Study], ingested: List[Dict[str, Any]], report: ImportReport) -> List[Dict[str, Any]]:
+    """
+    Create the analyses of a batch of ingested studies in one transaction.
+
+    Studies imported before are skipped, unless their analysis never
+    finished; cached results are reused.
+
+    Returns:
+        List[Dict[str, Any]]: Job messages of the analyses still to run
+    """
+    accepted = []
+    for study, item in zip(studies, ingested):
+        if "error" in item:
+            logger.warning(f"Rejected study {study.ap_path or study.lat_path}: {item['error']}")
+            report.rejected += 1
+        else:
+            accepted.append(item)
+    if not accepted:
+        return []
+
+    existing = _existing_analyses(db, accepted)
+    pending, seen, referenced = [], set(), []
+
+    try:
+        for item in accepted:
+            ap_hash, lat_hash = _study_hashes(item)
+            key = (item["patient_id"], ap_hash, lat_hash)
+            study_key = inference_cache.study_key(ap_hash, lat_hash)
+            if key in seen:
+                report.skipped += 1
+                continue
+            seen.add(key)
+
+            row = existing.get(key)
+            if row is not None:
+                if row.status in (AnalysisStatus.QUEUED.value, AnalysisStatus.RUNNING.value):
+                    # Interrupted before its analysis finished
+                    pending.append({
+                        "analysis_id": row.id,
+                        "ap_path": row.ap_image_path,
+                        "lat_path": row.lat_image_path,
+                        "study_key": study_key,
+                        "status": row.status
+                    })
+                report.skipped += 1
+                continue
+
+            uploads = item["uploads"]
+            headers = {view: upload.info.dicom for view, upload in uploads.items() if upload.info.dicom}
+            paths = {view: blobs.add_reference(db, upload) for view, upload in uploads.items()}
+            referenced += uploads.values()
+            for header in headers.values():
+                index_patient(db, header)
+
+            analysis_id = generate_analysis_id()
+            values = {
+                "status": AnalysisStatus.QUEUED.value,
+                "has_ap": "ap" in paths,
+                "has_lat": "lat" in paths,
+                **study_values(headers)
+            }
+
+            cached = inference_cache.lookup(db, study_key) if settings.INFERENCE_CACHE else None
+            if cached is not None:
+                values.update(summarize_analysis_result(cached))
+                values["status"] = AnalysisStatus.DONE.value
+                values["result_path"] = get_storage().write_json(get_result_path(analysis_id), cached)
+
+            analysis = Analysis(
+                id=analysis_id,
+                patient_id=item["patient_id"],
+                ap_image_path=paths.get("ap"),
+                lat_image_path=paths.get("lat"),
+                ap_image_hash=ap_hash,
+                lat_image_hash=lat_hash,
+                user_id=user.id,
+                **values
+            )
+            db.add(analysis)
+            counters.record_created(db, analysis)
+            report.imported += 1
+
+            if cached is None:
+                pending.append({
+                    "analysis_id": analysis_id,
+                    "ap_path": paths.get("ap"),
+                    "lat_path": paths.get("lat"),
+                    "study_key": study_key,
+                    "status": AnalysisStatus.QUEUED.value
+                })
+
+        db.commit()
+
+    except Exception:
+        # The file cleaner keeps the blobs that other analyses reference
+        db.rollback()
+        uploads = [upload for item in accepted for upload in item["uploads"].values()]
+        retention.enqueue_file_deletions(db, {blobs.blob_path(u.sha256, u.info.format) for u in uploads})
+        db.commit()
+        raise
+
+    # Copied by the workers before the references committed; stored again
+    # if the file cleaner removed an earlier copy in between
+    for upload in referenced:
+        blobs.store_file(upload, move=False)
+
+    return pending
+
+def analyse_batch(db: Session, pool_map: Callable, pending: List[Dict[str, Any]], report: ImportReport) -> None:
+    """
+    Run the analyses of a batch on the pool and record their outcomes in one
+    transaction.
+    """
+    if not pending:
+        return
+
+    jobs = list(_chunks(pending, settings.INFERENCE_BATCH_SIZE))
+    outcomes = [outcome for batch in pool_map(run_analysis_batch, jobs) for outcome in batch]
+
+    mappings, results, transitions = [], {}, {}
+    for message, outcome in zip(pending, outcomes):
+        if "error" in outcome:
+            logger.warning(f"Analysis {message['analysis_id']} failed: {outcome['error']}")
+            report.failed += 1
+            values = {"status": AnalysisStatus.FAILED.value, "error": outcome["error"]}
+        else:
+            values = {
+                "status": AnalysisStatus.DONE.value,
+                "result_path": outcome["result_path"],
+                "error": None,
+                **summarize_analysis_result(outcome["result"])
+            }
+            if message["study_key"]:
+                results[message["study_key"]] = outcome["result"]
+
+        mappings.append({"id": message["analysis_id"], **values})
+        transition = (message["status"], values["status"])
+        transitions[transition] = transitions.get(transition, 0) + 1
+
+    db.bulk_update_mappings(Analysis, mappings)
+    for (old_status, new_status), count in transitions.items():
+        counters.record_status_change(db, old_status, new_status, count)
+    db.commit()
+
+    if settings.INFERENCE_CACHE:
+        try:
+            inference_cache.store_many(db, results)
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Could not cache results: {str(e)}")
+
+def import_studies(
+    db: Session,
+    studies: Iterable[Study],
+    user: User,
+    workers: int = 0,
+    batch_size: int = 200
+) -> ImportReport:
+    """
+    Import studies: images are validated, hashed and stored and the studies
+    analysed on a pool of worker processes, while the database is written
+    once per batch of batch_size studies.
+
+    Args:
+        db: Database session
+        studies: Studies to import, e.g. from discover_studies
+        user: Owner of the created analyses
+        workers: Worker processes, 0 to run everything in this process
+        batch_size: Studies per database transaction
+
+    Returns:
+        ImportReport: Counts and throughput
+    """
+    report = ImportReport()
+    start = time.perf_counter()
+
+    with _pool(workers) as pool_map:
+        for chunk in _chunks(studies, batch_size):
+            ingested = pool_map(ingest_study, chunk)
+            pending = record_batch(db, user, chunk, ingested, report)
+            analyse_batch(db, pool_map, pending, report)
+
+            report.elapsed = time.perf_counter() - start
+            logger.info(
+                f"{report.studies} studies: {report.imported} imported, {report.skipped} skipped, "
+                f"{report.rejected} rejected, {report.failed} failed analysis ({report.studies_per_second:.1f} studies/sec)"
+            )
+
+    report.elapsed = time.perf_counter() - start
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="Directory or CSV manifest of studies")
+    parser.add_argument("--user", required=True, help="Username owning the imported analyses")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=200, help="Studies per database transaction")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    db = database.SessionLocal()
+    try:
+        user = db.query(User).filter(User.username == args.user).first()
+        if user is None:
+            parser.error(f"Unknown user {args.user}")
+
+        report = import_studies(db, discover_studies(args.source), user, args.workers, args.batch_size)
+        logger.info(
+            f"Imported {report.imported} studies ({report.skipped} skipped, {report.rejected} rejected, "
+            f"{report.failed} failed analysis) in {report.elapsed:.1f}s, {report.studies_per_second:.1f} studies/sec"
+        )
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -11,11 +11,138 @@ class Settings:
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60
 
+    # Refresh tokens renew access tokens without the password; each is used
+    # once and replaced by a new one (POST /api/auth/refresh)
+    REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "14"))
+
+    # Authenticated user cache; role and status changes made through the API
+    # invalidate entries immediately, other processes pick them up after the TTL
+    USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1024"))
+    USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "30"))
+
+    # Access tokens carry the user's role and token version and are verified
+    # without the database; versions of revoked and deactivated users are
+    # reloaded this often (changes made in the same process apply at once)
+    TOKEN_VERSION_REFRESH_SECONDS = float(os.getenv("TOKEN_VERSION_REFRESH_SECONDS", "10"))
+
+    # bcrypt cost of new password hashes; hashes of another cost are rehashed
+    # on the next successful login. Hashing runs on its own PASSWORD_HASH_WORKERS
+    # threads, with at most PASSWORD_HASH_MAX_PENDING requests waiting (503 beyond)
+    BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+    PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "32"))
+
+    # Login attempts: token buckets per account and per client IP (burst, then
+    # attempts per minute), kept in "memory" or shared in "sqlite:///./ratelimit.db"
+    LOGIN_RATE_LIMIT_URL = os.getenv("LOGIN_RATE_LIMIT_URL", "memory")
+    LOGIN_ACCOUNT_BURST = float(os.getenv("LOGIN_ACCOUNT_BURST", "5"))
+    LOGIN_ACCOUNT_PER_MINUTE = float(os.getenv("LOGIN_ACCOUNT_PER_MINUTE", "5"))
+    LOGIN_IP_BURST = float(os.getenv("LOGIN_IP_BURST", "30"))
+    LOGIN_IP_PER_MINUTE = float(os.getenv("LOGIN_IP_PER_MINUTE", "60"))
+
     DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./wristsight.db")
 
+    # Connection pool per process (not used for in-memory SQLite); metrics are
+    # served at /api/system/db-pool
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "True").lower() == "true"
+
+    # SQLite database files: WAL journal so reads never wait for writers, the
+    # pragmas below on every connection, and write transactions of a process
+    # serialized through one writer lock instead of failing with "database is locked"
+    SQLITE_TUNING = os.getenv("SQLITE_TUNING", "True").lower() == "true"
+    SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", str(64 * 1024)))
+    SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    SQLITE_WRITE_TIMEOUT = float(os.getenv("SQLITE_WRITE_TIMEOUT", "30"))
+
+    # Run the queries of read endpoints on an async engine (aiosqlite/asyncpg)
+    # instead of a thread pool
+    DATABASE_ASYNC = os.getenv("DATABASE_ASYNC", "False").lower() == "true"
+
+    # Where images and results are kept: "file://." (paths below relative to the
+    # working directory) or an S3-compatible bucket, "s3://bucket/prefix?endpoint_url=..."
+    STORAGE_URL = os.getenv("STORAGE_URL", "file://.")
+
+    # Local scratch space for uploads being received and files being rendered
+    UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR", "static/tmp")
+
+    # Image URLs never change content, so browsers and CDNs may keep them long
+    IMAGE_CACHE_MAX_AGE = int(os.getenv("IMAGE_CACHE_MAX_AGE", str(365 * 24 * 3600)))
+
     IMAGES_DIR = "static/images"
     RESULTS_DIR = "static/results"
 
+    # Content-addressed store of uploaded images, shared by analyses of the same file
+    BLOBS_DIR = "static/blobs"
+
+    # Rendered responses of finished analyses, per process and optionally in a
+    # shared tier ("sqlite:///./response_cache.db"), keyed by row version
+    RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "2048"))
+    RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "60"))
+    RESPONSE_CACHE_URL = os.getenv("RESPONSE_CACHE_URL", "")
+
+    # Reuse results of studies whose images were analysed before by the same model version
+    INFERENCE_CACHE = os.getenv("INFERENCE_CACHE", "True").lower() == "true"
+
+    # Downscaled copies of uploads (longest side in pixels) served to list pages
+    THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", "256"))
+    PREVIEW_SIZE = int(os.getenv("PREVIEW_SIZE", "1024"))
+    DERIVATIVE_QUALITY = int(os.getenv("DERIVATIVE_QUALITY", "85"))
+
+    # Upload limits: bytes per image, bytes per request body and pixels per image
+    MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+    MAX_REQUEST_BYTES = int(os.getenv("MAX_REQUEST_BYTES", str(110 * 1024 * 1024)))
+    MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", str(64 * 1024 * 1024)))
+
+    # Batch submissions (POST /analyses/batch): studies and bytes per request
+    MAX_BATCH_STUDIES = int(os.getenv("MAX_BATCH_STUDIES", "100"))
+    MAX_BATCH_REQUEST_BYTES = int(os.getenv("MAX_BATCH_REQUEST_BYTES", str(2 * 1024 * 1024 * 1024)))
+
+    # File I/O offload (uploads are streamed to disk in chunks of this size)
+    UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+    FILE_IO_WORKERS = int(os.getenv("FILE_IO_WORKERS", "8"))
+
+    # Background analysis jobs: "memory" or "sqlite:///./jobs.db" broker, and the
+    # number of inference worker processes (0 runs jobs in the dispatcher thread).
+    # The memory broker is for a single server process: on start it re-queues
+    # every unfinished analysis. With several workers use the SQLite broker, which
+    # delivers a job again when it is not finished within JOB_LEASE_SECONDS of
+    # being claimed (longer than the slowest inference batch)
+    JOB_BROKER_URL = os.getenv("JOB_BROKER_URL", "memory")
+    JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "600"))
+    INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2"))
+
+    # Inference backend and micro-batching: jobs arriving within the window are
+    # sent to the engine together, up to INFERENCE_BATCH_SIZE studies
+    INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "mock")
+    INFERENCE_BATCH_SIZE = int(os.getenv("INFERENCE_BATCH_SIZE", "8"))
+    INFERENCE_BATCH_WINDOW_MS = int(os.getenv("INFERENCE_BATCH_WINDOW_MS", "20"))
+
+    # Retention: analyses older than RETENTION_DAYS are removed by
+    # `python -m app.maintenance purge` (0 keeps them forever). Purges delete
+    # PURGE_BATCH_SIZE rows per transaction and pause between transactions
+    RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "0"))
+    PURGE_BATCH_SIZE = int(os.getenv("PURGE_BATCH_SIZE", "500"))
+    PURGE_PAUSE_SECONDS = float(os.getenv("PURGE_PAUSE_SECONDS", "0.2"))
+
+    # Files of deleted analyses are removed in the background, in batches with
+    # a pause between them; an idle cleaner polls every interval
+    FILE_CLEANUP_BATCH_SIZE = int(os.getenv("FILE_CLEANUP_BATCH_SIZE", "200"))
+    FILE_CLEANUP_PAUSE_SECONDS = float(os.getenv("FILE_CLEANUP_PAUSE_SECONDS", "0.1"))
+    FILE_CLEANUP_INTERVAL_SECONDS = float(os.getenv("FILE_CLEANUP_INTERVAL_SECONDS", "5"))
+
+    # Research exports (GET /api/history/export, python -m app.export) fetch
+    # and write this many analyses at a time
+    EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+    # Pixel spacing (mm per pixel) used when an image does not provide one
+    DEFAULT_PIXEL_SPACING_MM = float(os.getenv("DEFAULT_PIXEL_SPACING_MM", "0.1"))
+
     DEBUG = os.getenv("DEBUG", "True").lower() == "true"
     
     # Use mock analysis (for development without AI model)
@@ -0,0 +1,142 @@
+from typing import Dict, Iterable, Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.models import Analysis, AnalysisCounter, User
+from app import patient_index
+
+# Counter dimensions; "total" has a single key
+TOTAL = "total"
+BY_USER = "user"
+BY_PATIENT = "patient"
+BY_STATUS = "status"
+
+def _adjust(db: Session, dimension: str, key: str, delta: int) -> None:
+    values = {"dimension": dimension, "key": key, "count": delta}
+    dialect = db.get_bind().dialect.name
+
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        stmt = insert(AnalysisCounter).values(**values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[AnalysisCounter.dimension, AnalysisCounter.key],
+            set_={"count": AnalysisCounter.count + delta}
+        )
+        db.execute(stmt)
+        return
+
+    updated = db.query(AnalysisCounter).filter(
+        AnalysisCounter.dimension == dimension,
+        AnalysisCounter.key == key
+    ).update({"count": AnalysisCounter.count + delta}, synchronize_session=False)
+    if not updated:
+        db.add(AnalysisCounter(**values))
+
+def record_created(db: Session, analysis: Analysis) -> None:
+    """
+    Count a new analysis, also in the patient index. Call before committing
+    the analysis itself.
+    """
+    _record(db, analysis.user_id, analysis.patient_id, analysis.status, 1)
+    patient_index.record_created(db, analysis.user_id, analysis.patient_id)
+
+def record_deleted(db: Session, analysis: Analysis) -> None:
+    """
+    Uncount a deleted analysis, also in the patient index. Call once the
+    delete has been flushed, before committing it.
+    """
+    _record(db, analysis.user_id, analysis.patient_id, analysis.status, -1)
+    patient_index.record_deleted(db, [(analysis.user_id, analysis.patient_id)])
+
+def record_deleted_rows(db: Session, rows: Iterable) -> None:
+    """
+    Uncount analyses removed with a set-based DELETE, also in the patient
+    index. Call after the DELETE.
+
+    Args:
+        db: Database session
+        rows: (user_id, patient_id, status) tuples of the deleted analyses
+    """
+    rows = list(rows)
+    patient_index.record_deleted(db, [(user_id, patient_id) for user_id, patient_id, _ in rows])
+
+    deltas: Dict[tuple, int] = {}
+    total = 0
+    for user_id, patient_id, status in rows:
+        total += 1
+        for key in ((BY_USER, str(user_id)), (BY_PATIENT, patient_id), (BY_STATUS, status)):
+            deltas[key] = deltas.get(key, 0) - 1
+
+    if total:
+        _adjust(db, TOTAL, TOTAL, -total)
+    for (dimension, key), delta in deltas.items():
+        if key is not None:
+            _adjust(db, dimension, key, delta)
+
+def record_status_change(db: Session, old_status: Optional[str], new_status: str, count: int = 1) -> None:
+    """
+    Move analyses from one status counter to another.
+    """
+    if old_status == new_status:
+        return
+    if old_status is not None:
+        _adjust(db, BY_STATUS, old_status, -count)
+    _adjust(db, BY_STATUS, new_status, count)
+
+def _record(db, user_id, patient_id, status, delta):
+    _adjust(db, TOTAL, TOTAL, delta)
+    _adjust(db, BY_USER, str(user_id), delta)
+    if patient_id is not None:
+        _adjust(db, BY_PATIENT, patient_id, delta)
+    if status is not None:
+        _adjust(db, BY_STATUS, status, delta)
+
+def read_stats(db: Session) -> Dict:
+    """
+    Read dashboard statistics from the counters, independent of table size.
+    """
+    counts: Dict[str, Dict[str, int]] = {TOTAL: {}, BY_USER: {}, BY_PATIENT: {}, BY_STATUS: {}}
+    for dimension, key, count in db.query(
+        AnalysisCounter.dimension, AnalysisCounter.key, AnalysisCounter.count
+    ).filter(AnalysisCounter.count > 0):
+        counts.setdefault(dimension, {})[key] = count
+
+    usernames = dict(db.query(User.id, User.username).filter(
+        User.id.in_([int(user_id) for user_id in counts[BY_USER]])
+    ).all()) if counts[BY_USER] else {}
+
+    return {
+        "total_analyses": counts[TOTAL].get(TOTAL, 0),
+        "by_user": {usernames.get(int(user_id), user_id): count for user_id, count in counts[BY_USER].items()},
+        "by_patient": counts[BY_PATIENT],
+        "by_status": counts[BY_STATUS]
+    }
+
+def recompute(db: Session) -> Dict:
+    """
+    Rebuild every counter and the patient index from the analyses table with
+    one aggregate pass each.
+
+    Returns:
+        Dict: The recomputed statistics
+    """
+    rows = db.query(
+        Analysis.user_id, Analysis.patient_id, Analysis.status, func.count(Analysis.id)
+    ).group_by(Analysis.user_id, Analysis.patient_id, Analysis.status).all()
+
+    totals: Dict[tuple, int] = {}
+    for user_id, patient_id, status, count in rows:
+        for key in ((TOTAL, TOTAL), (BY_USER, str(user_id)), (BY_PATIENT, patient_id), (BY_STATUS, status)):
+            if key[1] is not None:
+                totals[key] = totals.get(key, 0) + count
+
+    db.query(AnalysisCounter).delete(synchronize_session=False)
+    db.add_all([
+        AnalysisCounter(dimension=dimension, key=key, count=count)
+        for (dimension, key), count in totals.items()
+    ])
+    patient_index.recompute(db)
+    db.commit()
+
+    return read_stats(db)
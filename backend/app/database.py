@@ -1,13 +1,199 @@
-from sqlalchemy import create_engine
+import time
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 
 from app.config import settings
 
-engine = create_engine(
-    settings.DATABASE_URL, 
-    connect_args={"check_same_thread": False} if settings.DATABASE_URL.startswith("sqlite") else {}
-)
+class PoolMetrics:
+    """
+    Counters of a connection pool, for sizing it under load: checkouts, how
+    long they waited for a free connection and how many timed out waiting.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record_wait(self, seconds: float, timed_out: bool = False) -> None:
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+    def snapshot(self, pool) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "overflow": max(pool.overflow(), 0),
+                "idle": pool.checkedin(),
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_seconds_total": round(self.wait_seconds_total, 6),
+                "wait_seconds_max": round(self.wait_seconds_max, 6),
+                "wait_seconds_avg": round(self.wait_seconds_total / self.checkouts, 6) if self.checkouts else 0.0
+            }
+
+class _MeteredPool:
+    # Times every checkout of a queue pool, including the wait for a free connection
+    metrics: PoolMetrics
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            self.metrics.record_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        self.metrics.record_wait(time.perf_counter() - start)
+        return connection
+
+class MeteredQueuePool(_MeteredPool, QueuePool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+class MeteredAsyncQueuePool(_MeteredPool, AsyncAdaptedQueuePool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+def _is_memory_sqlite(url: str) -> bool:
+    parsed = make_url(url)
+    return parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:")
+
+def engine_options(url: str, pool_class=MeteredQueuePool) -> Dict[str, Any]:
+    """
+    Keyword arguments of create_engine for a database URL: the pool settings
+    of Settings, except for in-memory SQLite, which keeps SQLAlchemy's
+    single-connection pool.
+    """
+    options: Dict[str, Any] = {}
+    if url.startswith("sqlite"):
+        options["connect_args"] = {"check_same_thread": False}
+    if _is_memory_sqlite(url):
+        return options
+
+    options.update(
+        poolclass=pool_class,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING
+    )
+    return options
+
+# Statements with which a SQLite connection starts writing
+_SQLITE_WRITES = ("INSERT", "UPDATE", "DELETE", "REPLACE", "CREATE", "DROP", "ALTER")
+
+def sqlite_pragmas() -> List[str]:
+    """Pragmas run on every new connection to a SQLite database file"""
+    return [
+        "PRAGMA journal_mode=WAL",
+        f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}",
+        f"PRAGMA cache_size=-{settings.SQLITE_CACHE_SIZE_KB}",
+        f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE}",
+        f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}"
+    ]
+
+class SQLiteWriteLock:
+    """
+    Lets one connection of the process write to a SQLite file at a time.
+
+    A connection takes the lock before its first write statement, which is
+    where SQLite opens the write transaction, and gives it back when the
+    transaction commits or rolls back, or when the connection returns to the
+    pool. Writers wait here in turn instead of failing on SQLite's file lock;
+    reads never take the lock and run in parallel under WAL.
+    """
+    _HELD = "sqlite_write_lock"
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+
+    def acquire(self, info: Dict) -> None:
+        if info.get(self._HELD):
+            return
+        if not self._lock.acquire(timeout=self.timeout):
+            raise exc.TimeoutError(f"Waited more than {self.timeout}s to write to the database")
+        info[self._HELD] = True
+
+    def release(self, info: Dict) -> None:
+        if info.pop(self._HELD, False):
+            self._lock.release()
+
+def configure_sqlite(engine, serialize_writes: bool = True) -> Optional[SQLiteWriteLock]:
+    """
+    Tune an engine on a SQLite database file: WAL and the sqlite_pragmas on
+    every connection and, unless disabled, a SQLiteWriteLock.
+
+    Returns:
+        Optional[SQLiteWriteLock]: The write lock, if any
+    """
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in sqlite_pragmas():
+            cursor.execute(pragma)
+        cursor.close()
+
+    if not serialize_writes:
+        return None
+
+    lock = SQLiteWriteLock(settings.SQLITE_WRITE_TIMEOUT)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def acquire_for_writes(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip()[:7].upper().startswith(_SQLITE_WRITES):
+            lock.acquire(conn.info)
+
+    @event.listens_for(engine, "commit")
+    def release_on_commit(conn):
+        lock.release(conn.info)
+
+    @event.listens_for(engine, "rollback")
+    def release_on_rollback(conn):
+        lock.release(conn.info)
+
+    @event.listens_for(engine, "checkin")
+    def release_on_checkin(dbapi_connection, connection_record):
+        lock.release(connection_record.info)
+
+    return lock
+
+def _is_sqlite_file(url: str) -> bool:
+    return url.startswith("sqlite") and not _is_memory_sqlite(url)
+
+engine = create_engine(settings.DATABASE_URL, **engine_options(settings.DATABASE_URL))
+
+if settings.SQLITE_TUNING and _is_sqlite_file(settings.DATABASE_URL):
+    configure_sqlite(engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -17,5 +203,89 @@ def get_db():
     db = SessionLocal()
     try:
         yield db
-    finally: 
+    finally:
+        db.close()
+
+# Async drivers by sync URL scheme
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+def async_database_url(url: str) -> str:
+    """The URL of the async driver (aiosqlite, asyncpg) for a database URL"""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver for database URL {url}")
+    return parsed.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+_async_engine = None
+_async_sessionmaker = None
+
+def get_async_sessionmaker():
+    """
+    Session factory of the async engine, created on first use. Only used
+    with DATABASE_ASYNC; requires aiosqlite or asyncpg.
+    """
+    global _async_engine, _async_sessionmaker
+    if _async_sessionmaker is None:
+        from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+        url = async_database_url(settings.DATABASE_URL)
+        _async_engine = create_async_engine(url, **engine_options(url, MeteredAsyncQueuePool))
+        if settings.SQLITE_TUNING and _is_sqlite_file(url):
+            # Only reads run on the async engine
+            configure_sqlite(_async_engine.sync_engine, serialize_writes=False)
+        _async_sessionmaker = sessionmaker(_async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+    return _async_sessionmaker
+
+# Threads running ORM code of async handlers in sync mode; as many as the
+# pool has connections, so they never queue for one
+_db_executor = ThreadPoolExecutor(
+    max_workers=settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW,
+    thread_name_prefix="db"
+)
+
+class DbRunner:
+    """
+    Runs blocking ORM code, fn(session, *args), for an async handler without
+    blocking the event loop: through the async session's greenlet with
+    DATABASE_ASYNC, otherwise on the database thread pool.
+    """
+
+    def __init__(self, session):
+        self.session = session
+
+    async def __call__(self, fn: Callable, *args, **kwargs) -> Any:
+        if not isinstance(self.session, Session):
+            return await self.session.run_sync(fn, *args, **kwargs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_db_executor, functools.partial(fn, self.session, *args, **kwargs))
+
+async def get_db_runner():
+    """
+    Dependency providing a DbRunner over a session of the async engine with
+    DATABASE_ASYNC, or of the sync engine.
+    """
+    if settings.DATABASE_ASYNC:
+        async with get_async_sessionmaker()() as session:
+            yield DbRunner(session)
+        return
+
+    db = SessionLocal()
+    try:
+        yield DbRunner(db)
+    finally:
         db.close()
+
+def pool_stats() -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Metrics of the connection pools, None for engines that are not in use or
+    do not pool connections.
+    """
+    def stats(pool):
+        metrics = getattr(pool, "metrics", None)
+        return metrics.snapshot(pool) if metrics is not None else None
+
+    return {
+        "sync": stats(engine.pool),
+        "async": stats(_async_engine.sync_engine.pool) if _async_engine is not None else None
+    }
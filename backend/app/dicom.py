@@ -0,0 +1,197 @@
+import numpy as np
+from datetime import date, datetime
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+from PIL import Image
+from fastapi import HTTPException, status
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects import postgresql, sqlite
+
+import pydicom
+from pydicom.dataset import Dataset
+from pydicom.errors import InvalidDicomError
+from pydicom.multival import MultiValue
+from pydicom.pixels import pixel_array, apply_modality_lut
+
+from app.models import Patient
+
+class DicomHeader(NamedTuple):
+    """Study metadata and image geometry read from a DICOM header"""
+    patient_id: Optional[str]
+    patient_name: Optional[str]
+    study_date: Optional[date]
+    modality: Optional[str]
+    pixel_spacing: Optional[Tuple[float, float]]  # (row, column) mm per pixel
+    rows: int
+    columns: int
+    frames: int
+    bits_stored: int
+
+def _text(value) -> Optional[str]:
+    text = str(value).strip() if value is not None else ""
+    return text or None
+
+def _date(value) -> Optional[date]:
+    try:
+        return datetime.strptime(str(value).strip(), "%Y%m%d").date()
+    except (TypeError, ValueError):
+        return None
+
+def _spacing(ds: Dataset) -> Optional[Tuple[float, float]]:
+    # Projection radiographs often only carry the spacing at the detector
+    for keyword in ("PixelSpacing", "ImagerPixelSpacing"):
+        value = ds.get(keyword)
+        try:
+            row, column = (float(v) for v in value)
+        except (TypeError, ValueError):
+            continue
+        if row > 0 and column > 0:
+            return row, column
+    return None
+
+def read_header(path: str) -> DicomHeader:
+    """
+    Read the header of a DICOM file, stopping before the pixel data (blocking).
+
+    Raises:
+        OSError: If the file is not valid DICOM or has no image
+
+    Returns:
+        DicomHeader: Study metadata and image geometry
+    """
+    try:
+        ds = pydicom.dcmread(path, stop_before_pixels=True)
+        rows, columns = int(ds.Rows), int(ds.Columns)
+    except (InvalidDicomError, AttributeError, ValueError) as e:
+        raise OSError(f"Not a readable DICOM image: {str(e)}")
+
+    return DicomHeader(
+        patient_id=_text(ds.get("PatientID")),
+        patient_name=_text(ds.get("PatientName")),
+        study_date=_date(ds.get("StudyDate")),
+        modality=_text(ds.get("Modality")),
+        pixel_spacing=_spacing(ds),
+        rows=rows,
+        columns=columns,
+        frames=int(ds.get("NumberOfFrames") or 1),
+        bits_stored=int(ds.get("BitsStored") or 8)
+    )
+
+def _window(ds: Dataset, pixels: np.ndarray) -> Tuple[float, float]:
+    # First VOI window of the header, else the range of the frame itself
+    center, width = ds.get("WindowCenter"), ds.get("WindowWidth")
+    if center is not None and width is not None:
+        center = float(center[0] if isinstance(center, MultiValue) else center)
+        width = float(width[0] if isinstance(width, MultiValue) else width)
+        if width > 0:
+            return center - width / 2, center + width / 2
+    return float(pixels.min()), float(pixels.max())
+
+def decode_frame(path: str, frame: int = 0) -> Image.Image:
+    """
+    Decode one frame of a DICOM file and window it to 8 bits (blocking).
+
+    Only the requested frame is read from the file, so multi-frame files are
+    never loaded as a whole. Rescale slope and intercept are applied, then the
+    first VOI window of the header (or the frame's own range), and
+    MONOCHROME1 images are inverted so bone is always bright.
+
+    Raises:
+        OSError: If the pixel data cannot be decoded
+
+    Returns:
+        Image.Image: "L" image, or "RGB" for colour data; info["pixel_spacing"]
+        holds the (row, column) spacing in mm when the header has one
+    """
+    header = Dataset()
+    try:
+        pixels = pixel_array(path, ds_out=header, index=frame)
+    except (InvalidDicomError, AttributeError, ValueError, NotImplementedError, RuntimeError) as e:
+        raise OSError(f"Could not decode DICOM pixel data: {str(e)}")
+
+    if header.get("SamplesPerPixel", 1) == 3:
+        img = Image.fromarray(pixels.astype(np.uint8), mode="RGB")
+    else:
+        values = apply_modality_lut(pixels, header).astype(np.float32)
+        low, high = _window(header, values)
+        scale = 255.0 / (high - low) if high > low else 0.0
+        values = np.clip((values - low) * scale, 0, 255)
+        if header.get("PhotometricInterpretation") == "MONOCHROME1":
+            values = 255 - values
+        img = Image.fromarray(values.astype(np.uint8), mode="L")
+
+    spacing = read_header(path).pixel_spacing
+    if spacing is not None:
+        img.info["pixel_spacing"] = spacing
+    return img
+
+def study_patient(patient_id: Optional[str], headers: Dict[str, DicomHeader]) -> str:
+    """
+    Decide the patient of a study from the patient id given with it and the
+    DICOM headers of its images, keyed by view.
+
+    The DICOM PatientID is used unless a patient id is given; the two naming
+    different patients is refused rather than guessed.
+
+    Raises:
+        HTTPException: 422 for conflicting patients, 400 if there is none
+
+    Returns:
+        str: Patient id
+    """
+    dicom_patients = {header.patient_id for header in headers.values() if header.patient_id}
+    if len(dicom_patients) > 1:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="The DICOM images belong to different patients"
+        )
+    if patient_id and dicom_patients and patient_id not in dicom_patients:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"patient_id {patient_id} does not match the PatientID of the DICOM images"
+        )
+
+    patient_id = patient_id or next(iter(dicom_patients), None)
+    if not patient_id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="patient_id is required unless the DICOM images carry a PatientID"
+        )
+    return patient_id
+
+def study_values(headers: Dict[str, DicomHeader]) -> Dict[str, Any]:
+    """
+    Analysis column values indexed from the DICOM headers of a study's
+    images, keyed by view. The first view with a study date or modality
+    provides it.
+    """
+    values = {}
+    for view, header in headers.items():
+        values[f"{view}_pixel_spacing"] = list(header.pixel_spacing) if header.pixel_spacing else None
+        values["study_date"] = values.get("study_date") or header.study_date
+        values["modality"] = values.get("modality") or header.modality
+    return values
+
+def index_patient(db: Session, header: DicomHeader) -> None:
+    """
+    Make sure the patient of a DICOM study has a Patient record, keyed by
+    its DICOM PatientID. Existing records are left unchanged.
+
+    The insert is part of the caller's transaction.
+    """
+    if not header.patient_id:
+        return
+
+    values = {
+        "id": header.patient_id,
+        "medical_record_number": header.patient_id,
+        "name": header.patient_name
+    }
+    dialect = db.get_bind().dialect.name
+
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        db.execute(insert(Patient).values(**values).on_conflict_do_nothing())
+        return
+
+    if db.query(Patient.id).filter(Patient.id == header.patient_id).first() is None:
+        db.add(Patient(**values))
@@ -0,0 +1,276 @@
+"""
+Export of analyses and their measurements for research, streamed in one
+pass over the database with constant memory.
+
+Usage:
+    python -m app.export OUTPUT [--format csv|ndjson|parquet] [--patient ID] [--user USERNAME]
+                                [--start-date YYYY-MM-DD] [--end-date YYYY-MM-DD]
+
+Rows are read through a server-side cursor, EXPORT_BATCH_SIZE at a time,
+oldest first, and written as they come: CSV and Parquet have one row per
+measurement (analyses without measurements get one row with empty
+measurement columns), NDJSON one object per analysis with its list of
+measurements. Parquet needs pyarrow.
+"""
+import io
+import csv
+import json
+import time
+import logging
+import argparse
+from datetime import date, datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app import database
+from app.config import settings
+from app.models import Analysis, User
+
+logger = logging.getLogger(__name__)
+
+# Columns of CSV and Parquet exports
+COLUMNS = [
+    "analysis_id", "patient_id", "user_id", "timestamp", "study_date", "modality",
+    "status", "label", "value", "unit"
+]
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet"
+}
+
+def export_query(
+    db: Session,
+    user_id: Optional[int] = None,
+    patient_id: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None
+):
+    """
+    Query of the exported columns, filtered like the history listing and
+    ordered on (timestamp, id) so it follows ix_analyses_timestamp_id.
+    """
+    query = db.query(
+        Analysis.id, Analysis.patient_id, Analysis.user_id, Analysis.timestamp,
+        Analysis.study_date, Analysis.modality, Analysis.status, Analysis.measurements
+    )
+
+    if user_id is not None:
+        query = query.filter(Analysis.user_id == user_id)
+    if patient_id:
+        query = query.filter(Analysis.patient_id == patient_id)
+    if start_date:
+        query = query.filter(Analysis.timestamp >= start_date)
+    if end_date:
+        query = query.filter(Analysis.timestamp <= end_date)
+
+    return query.order_by(Analysis.timestamp, Analysis.id)
+
+def iter_analyses(db: Session, batch_size: Optional[int] = None, **filters) -> Iterator[Dict[str, Any]]:
+    """
+    Stream the matching analyses as dicts, fetching batch_size rows at a
+    time through a server-side cursor.
+    """
+    batch_size = batch_size or settings.EXPORT_BATCH_SIZE
+    query = export_query(db, **filters).execution_options(yield_per=batch_size)
+
+    for row in query:
+        yield {
+            "analysis_id": row.id,
+            "patient_id": row.patient_id,
+            "user_id": row.user_id,
+            "timestamp": row.timestamp,
+            "study_date": row.study_date,
+            "modality": row.modality,
+            "status": row.status,
+            "measurements": [
+                {"label": m.get("label"), "value": _number(m.get("value")), "unit": m.get("unit")}
+                for m in row.measurements or []
+            ]
+        }
+
+def _number(value: Any) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _flatten(analysis: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    # One row per measurement, or one without measurement columns
+    study = {key: value for key, value in analysis.items() if key != "measurements"}
+    for measurement in analysis["measurements"] or [{"label": None, "value": None, "unit": None}]:
+        yield {**study, **measurement}
+
+def _text(row: Dict[str, Any]) -> Dict[str, Any]:
+    # Dates as ISO 8601 in the text formats
+    return {key: value.isoformat() if isinstance(value, (date, datetime)) else value for key, value in row.items()}
+
+def _chunks(lines: Iterator[str], batch_size: int) -> Iterator[bytes]:
+    # Joins lines into chunks of about batch_size lines
+    buffer: List[str] = []
+    for line in lines:
+        buffer.append(line)
+        if len(buffer) >= batch_size:
+            yield "".join(buffer).encode()
+            buffer = []
+    if buffer:
+        yield "".join(buffer).encode()
+
+def _csv_lines(analyses: Iterator[Dict[str, Any]]) -> Iterator[str]:
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=COLUMNS)
+    writer.writeheader()
+    yield out.getvalue()
+    out.seek(0)
+    out.truncate()
+    for analysis in analyses:
+        for row in _flatten(analysis):
+            writer.writerow(_text(row))
+        yield out.getvalue()
+        out.seek(0)
+        out.truncate()
+
+def _ndjson_lines(analyses: Iterator[Dict[str, Any]]) -> Iterator[str]:
+    for analysis in analyses:
+        yield json.dumps(_text(analysis)) + "\n"
+
+class _ChunkSink(io.RawIOBase):
+    # Write-only file collecting what pyarrow writes until it is taken
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def take(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Parquet export requires pyarrow: pip install pyarrow")
+    return pyarrow, pyarrow.parquet
+
+def _parquet_chunks(analyses: Iterator[Dict[str, Any]], batch_size: int) -> Iterator[bytes]:
+    pa, pq = _import_pyarrow()
+    schema = pa.schema([
+        ("analysis_id", pa.string()), ("patient_id", pa.string()), ("user_id", pa.int64()),
+        ("timestamp", pa.timestamp("us")), ("study_date", pa.date32()), ("modality", pa.string()),
+        ("status", pa.string()), ("label", pa.string()), ("value", pa.float64()), ("unit", pa.string())
+    ])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+
+    def write(rows):
+        writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+
+    # One row group per batch_size rows
+    rows: List[Dict[str, Any]] = []
+    for analysis in analyses:
+        rows.extend(_flatten(analysis))
+        if len(rows) >= batch_size:
+            write(rows)
+            rows = []
+            yield sink.take()
+    if rows:
+        write(rows)
+    writer.close()
+    yield sink.take()
+
+def check_format(fmt: str) -> None:
+    """
+    Check that a format can be exported, before any output is sent.
+
+    Raises:
+        ValueError: If the format is unknown
+        RuntimeError: If Parquet is asked for without pyarrow
+    """
+    if fmt not in MEDIA_TYPES:
+        raise ValueError(f"Unknown export format {fmt}, expected one of {', '.join(MEDIA_TYPES)}")
+    if fmt == "parquet":
+        _import_pyarrow()
+
+def iter_export(analyses: Iterator[Dict[str, Any]], fmt: str, batch_size: Optional[int] = None) -> Iterator[bytes]:
+    """
+    Encode streamed analyses in an export format, as chunks of bytes.
+
+    Args:
+        analyses: Analyses from iter_analyses
+        fmt: "csv", "ndjson" or "parquet"
+        batch_size: Analyses (CSV, NDJSON) or rows (Parquet) per chunk
+
+    Raises:
+        ValueError: If the format is unknown
+        RuntimeError: If Parquet is asked for without pyarrow
+    """
+    check_format(fmt)
+    batch_size = batch_size or settings.EXPORT_BATCH_SIZE
+    if fmt == "csv":
+        return _chunks(_csv_lines(analyses), batch_size)
+    if fmt == "ndjson":
+        return _chunks(_ndjson_lines(analyses), batch_size)
+    return _parquet_chunks(analyses, batch_size)
+
+def stream_export(fmt: str, **filters) -> Iterator[bytes]:
+    """
+    Export with a session of its own, which lives as long as the stream.
+    """
+    db = database.SessionLocal()
+    try:
+        yield from iter_export(iter_analyses(db, **filters), fmt)
+    finally:
+        db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("output", help="File to write")
+    parser.add_argument("--format", choices=sorted(MEDIA_TYPES), default=None, help="Defaults to the output's extension")
+    parser.add_argument("--patient", default=None, help="Patient id")
+    parser.add_argument("--user", default=None, help="Username")
+    parser.add_argument("--start-date", type=date.fromisoformat, default=None)
+    parser.add_argument("--end-date", type=date.fromisoformat, default=None)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    fmt = args.format or args.output.rsplit(".", 1)[-1].lower()
+    if fmt not in MEDIA_TYPES:
+        parser.error(f"Cannot tell the format of {args.output}, pass --format")
+
+    user_id = None
+    if args.user is not None:
+        db = database.SessionLocal()
+        try:
+            user = db.query(User).filter(User.username == args.user).first()
+        finally:
+            db.close()
+        if user is None:
+            parser.error(f"Unknown user {args.user}")
+        user_id = user.id
+
+    start = time.perf_counter()
+    written = 0
+    with open(args.output, "wb") as f:
+        for chunk in stream_export(
+            fmt, user_id=user_id, patient_id=args.patient, start_date=args.start_date, end_date=args.end_date
+        ):
+            f.write(chunk)
+            written += len(chunk)
+    logger.info(f"Exported {written / 1e6:.1f} MB to {args.output} in {time.perf_counter() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import os
+import json
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+from fastapi import UploadFile
+
+from app.config import settings
+
+# Dedicated pool for disk I/O so uploads and result files never block the event
+# loop and do not compete with sync endpoints for the default threadpool
+_executor = ThreadPoolExecutor(
+    max_workers=settings.FILE_IO_WORKERS,
+    thread_name_prefix="file-io"
+)
+
+async def run_blocking(func: Callable, *args, **kwargs) -> Any:
+    """
+    Run a blocking function on the file I/O thread pool.
+
+    Args:
+        func: Blocking callable
+        *args, **kwargs: Arguments passed to the callable
+
+    Returns:
+        Any: Return value of the callable
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+def _remove_if_exists(path: str) -> None:
+    if os.path.exists(path):
+        os.remove(path)
+
+def _write_chunk(buffer, chunk: bytes, hasher) -> None:
+    buffer.write(chunk)
+    if hasher is not None:
+        hasher.update(chunk)
+
+async def stream_upload(
+    file: UploadFile,
+    destination: str,
+    chunk_size: int = None,
+    hasher=None,
+    validator: Optional[Callable[[bytes], None]] = None
+) -> int:
+    """
+    Stream an uploaded file to disk in chunks without blocking the event loop.
+
+    The data is written to a temporary file next to the destination and moved
+    into place once complete, so readers never see a partially written image.
+
+    Args:
+        file: The uploaded file
+        destination: Path where the file should be saved
+        chunk_size: Number of bytes read per chunk
+        hasher: Optional hashlib object updated with every chunk as it is written
+        validator: Optional callable checking every chunk before it is written;
+            an exception aborts the upload and removes the partial file
+
+    Returns:
+        int: Number of bytes written
+    """
+    chunk_size = chunk_size or settings.UPLOAD_CHUNK_SIZE
+    tmp_path = f"{destination}.part"
+
+    await run_blocking(os.makedirs, os.path.dirname(destination), exist_ok=True)
+    buffer = await run_blocking(open, tmp_path, "wb")
+
+    written = 0
+    try:
+        while True:
+            # UploadFile.read already offloads spooled-to-disk reads to a thread
+            chunk = await file.read(chunk_size)
+            if not chunk:
+                break
+            if validator is not None:
+                validator(chunk)
+            await run_blocking(_write_chunk, buffer, chunk, hasher)
+            written += len(chunk)
+    except BaseException:
+        await run_blocking(buffer.close)
+        await run_blocking(_remove_if_exists, tmp_path)
+        raise
+
+    await run_blocking(buffer.close)
+    await run_blocking(os.replace, tmp_path, destination)
+
+    return written
+
+def write_json(path: str, data: Dict[str, Any]) -> str:
+    """
+    Write a JSON document atomically (blocking).
+
+    Args:
+        path: Destination path
+        data: JSON-serializable document
+
+    Returns:
+        str: Path to the written file
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    tmp_path = f"{path}.part"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+    return path
+
+def read_json(path: str) -> Dict[str, Any]:
+    """
+    Read a JSON document (blocking).
+
+    Args:
+        path: Path to the file
+
+    Returns:
+        Dict[str, Any]: Parsed document
+    """
+    with open(path, "r") as f:
+        return json.load(f)
+
+async def write_json_async(path: str, data: Dict[str, Any]) -> str:
+    """
+    Write a JSON document atomically on the file I/O thread pool.
+    """
+    return await run_blocking(write_json, path, data)
+
+async def read_json_async(path: str) -> Dict[str, Any]:
+    """
+    Read a JSON document on the file I/O thread pool.
+    """
+    return await run_blocking(read_json, path)
@@ -0,0 +1,164 @@
+import os
+import re
+import logging
+import tempfile
+import numpy as np
+from typing import List, Optional
+from PIL import Image, features
+
+from app.config import settings
+from app.storage import get_storage
+from app.ingest import sniff_file, decode_image
+
+logger = logging.getLogger(__name__)
+
+# Longest side in pixels of each derivative
+DERIVATIVE_SIZES = {
+    "thumb": settings.THUMBNAIL_SIZE,
+    "preview": settings.PREVIEW_SIZE
+}
+
+VIEWS = ("ap", "lat")
+
+# Size name under which the uploaded image itself is served
+ORIGINAL = "original"
+
+MEDIA_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp", "png": "image/png", "tiff": "image/tiff", "dicom": "application/dicom"}
+
+_EXTENSIONS = {"jpeg": "jpg", "webp": "webp"}
+
+_ANALYSIS_ID = re.compile(r"^[A-Za-z0-9_-]+$")
+
+def webp_supported() -> bool:
+    """Whether this Pillow build can encode WebP"""
+    return features.check("webp")
+
+def derivative_formats() -> List[str]:
+    """Formats generated for every derivative"""
+    return ["jpeg", "webp"] if webp_supported() else ["jpeg"]
+
+def source_path(analysis_id: str, view: str) -> str:
+    """Storage key of the full-size image of a view for analyses created before the blob store"""
+    return f"{settings.IMAGES_DIR}/{analysis_id}/{view}.jpg"
+
+def derivative_path(analysis_id: str, view: str, size: str, fmt: str) -> str:
+    """Storage key of a cached derivative image"""
+    return f"{settings.IMAGES_DIR}/{analysis_id}/derived/{view}_{size}.{_EXTENSIONS[fmt]}"
+
+def derivative_url(analysis_id: str, view: str, size: str) -> str:
+    """URL serving a derivative image, see routers/images.py"""
+    return f"/api/images/{analysis_id}/{view}/{size}"
+
+def original_url(analysis_id: str, view: str) -> str:
+    """URL serving the full-size uploaded image, see routers/images.py"""
+    return derivative_url(analysis_id, view, ORIGINAL)
+
+def _to_8bit(img: Image.Image) -> Image.Image:
+    # JPEG and WebP only store 8-bit greyscale or RGB; stretch high bit depth
+    # radiographs over the full range instead of clipping them
+    if img.mode in ("I;16", "I;16B", "I;16L", "I", "F"):
+        pixels = np.asarray(img, dtype=np.float32)
+        low, high = float(pixels.min()), float(pixels.max())
+        scale = 255.0 / (high - low) if high > low else 0.0
+        return Image.fromarray(((pixels - low) * scale).astype(np.uint8), mode="L")
+    if img.mode in ("1", "LA"):
+        return img.convert("L")
+    if img.mode not in ("L", "RGB"):
+        return img.convert("RGB")
+    return img
+
+def _downscale(img: Image.Image, max_side: int) -> Image.Image:
+    # Returns a new image; the caller's image is left untouched
+    scaled = _to_8bit(img)
+    if scaled is img:
+        scaled = img.copy()
+    scaled.thumbnail((max_side, max_side), Image.LANCZOS, reducing_gap=3.0)
+    return scaled
+
+def _store(img: Image.Image, destination: str, fmt: str) -> None:
+    # Encode to scratch space, then move the file into storage
+    os.makedirs(settings.UPLOAD_TMP_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=settings.UPLOAD_TMP_DIR, suffix=f".{_EXTENSIONS[fmt]}")
+    os.close(fd)
+
+    try:
+        img.save(tmp_path, format=fmt.upper(), quality=settings.DERIVATIVE_QUALITY)
+        get_storage().put_file(destination, tmp_path, move=True)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def render_derivative(source: str, destination: str, max_side: int, fmt: str) -> str:
+    """
+    Render a downscaled copy of an image file into storage.
+
+    Args:
+        source: Path to a local copy of the full-size image
+        destination: Storage key of the derivative
+        max_side: Longest side of the derivative in pixels
+        fmt: "jpeg" or "webp"
+
+    Returns:
+        str: Storage key of the derivative
+    """
+    if sniff_file(source) == "DICOM":
+        _store(_downscale(decode_image(source), max_side), destination, fmt)
+        return destination
+
+    with Image.open(source) as img:
+        # Let the JPEG decoder skip detail we would throw away anyway
+        img.draft(img.mode, (max_side, max_side))
+        _store(_downscale(img, max_side), destination, fmt)
+
+    return destination
+
+def generate_derivatives(analysis_id: str, view: str, image: Image.Image) -> List[str]:
+    """
+    Create every size and format of derivative for one view.
+
+    Sizes are rendered largest first, each from the previous one, so the
+    full-size image is only resampled once.
+
+    Args:
+        analysis_id: Analysis identifier
+        view: "ap" or "lat"
+        image: The decoded full-size image
+
+    Returns:
+        List[str]: Storage keys of the generated derivatives
+    """
+    keys = []
+    for size, max_side in sorted(DERIVATIVE_SIZES.items(), key=lambda item: -item[1]):
+        image = _downscale(image, max_side)
+        for fmt in derivative_formats():
+            key = derivative_path(analysis_id, view, size, fmt)
+            _store(image, key, fmt)
+            keys.append(key)
+    return keys
+
+def get_derivative(analysis_id: str, view: str, size: str, fmt: str, source: Optional[str] = None) -> str:
+    """
+    Get a derivative from storage, rendering it on first request.
+
+    Args:
+        source: Storage key of the full-size image, defaults to the legacy upload location
+
+    Raises:
+        ValueError: For an unknown analysis id format, view, size or format
+        FileNotFoundError: If the analysis has no image for the view
+
+    Returns:
+        str: Storage key of the derivative
+    """
+    if not _ANALYSIS_ID.match(analysis_id) or view not in VIEWS or size not in DERIVATIVE_SIZES:
+        raise ValueError(f"Unknown image {analysis_id}/{view}/{size}")
+    if fmt not in derivative_formats():
+        raise ValueError(f"Unsupported image format {fmt}")
+
+    storage = get_storage()
+    path = derivative_path(analysis_id, view, size, fmt)
+    if storage.exists(path):
+        return path
+
+    with storage.local_path(source or source_path(analysis_id, view)) as local_source:
+        return render_derivative(local_source, path, DERIVATIVE_SIZES[size], fmt)
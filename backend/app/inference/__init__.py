@@ -0,0 +1,11 @@
+from app.inference.engine import (
+    InferenceEngine,
+    InferenceRequest,
+    register_engine,
+    get_engine,
+    engine_version,
+    load_engine
+)
+from app.inference.mock import MockInferenceEngine
+
+register_engine("mock", MockInferenceEngine)
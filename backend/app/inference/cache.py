@@ -0,0 +1,74 @@
+import logging
+from typing import Any, Dict, Optional
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.models import InferenceCacheEntry
+from app.inference.engine import engine_version
+
+logger = logging.getLogger(__name__)
+
+def study_key(ap_hash: Optional[str], lat_hash: Optional[str]) -> Optional[str]:
+    """
+    Cache key of a study from the content hashes of its views.
+
+    Returns:
+        Optional[str]: Key, or None for a study without images
+    """
+    if not ap_hash and not lat_hash:
+        return None
+    return f"{ap_hash or '-'}:{lat_hash or '-'}"
+
+def lookup(db: Session, key: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    Get the cached result of a study for the configured engine version.
+    """
+    if key is None:
+        return None
+
+    entry = db.query(InferenceCacheEntry.result).filter(
+        InferenceCacheEntry.study_key == key,
+        InferenceCacheEntry.engine_version == engine_version()
+    ).first()
+
+    return entry.result if entry else None
+
+def store(db: Session, key: Optional[str], result: Dict[str, Any]) -> None:
+    """
+    Cache the result of a study for the configured engine version and commit.
+
+    A result stored concurrently for the same study is kept.
+    """
+    if key is None:
+        return
+
+    db.add(InferenceCacheEntry(study_key=key, engine_version=engine_version(), result=result))
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        logger.debug(f"Result of study {key} was already cached")
+
+def store_many(db: Session, results: Dict[str, Dict[str, Any]]) -> None:
+    """
+    Cache the results of several studies, keyed by study key, in one
+    transaction and commit. Results already cached are kept.
+    """
+    if not results:
+        return
+
+    version = engine_version()
+    rows = [{"study_key": key, "engine_version": version, "result": result} for key, result in results.items()]
+    dialect = db.get_bind().dialect.name
+
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        db.execute(insert(InferenceCacheEntry).values(rows).on_conflict_do_nothing())
+    else:
+        cached = {key for key, in db.query(InferenceCacheEntry.study_key).filter(
+            InferenceCacheEntry.study_key.in_(list(results)),
+            InferenceCacheEntry.engine_version == version
+        )}
+        db.add_all(InferenceCacheEntry(**row) for row in rows if row["study_key"] not in cached)
+    db.commit()
@@ -0,0 +1,105 @@
+import logging
+import numpy as np
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class InferenceRequest:
+    """
+    One study to analyse: an AP and/or lateral view of the same wrist.
+
+    The job runner decodes every image once and passes the pixels as arrays
+    (height x width[ x channels], in the image's own bit depth); engines
+    should use them instead of reopening the files. DICOM images arrive
+    windowed to 8 bits, with the (row, column) PixelSpacing of their header
+    in mm; engines copy it to the result as ap_pixel_spacing and
+    lat_pixel_spacing so measurements are reported in real millimetres.
+    """
+    analysis_id: str
+    ap_path: Optional[str] = None
+    lat_path: Optional[str] = None
+    ap_image: Optional[np.ndarray] = None
+    lat_image: Optional[np.ndarray] = None
+    ap_pixel_spacing: Optional[Tuple[float, float]] = None
+    lat_pixel_spacing: Optional[Tuple[float, float]] = None
+
+class InferenceEngine:
+    """
+    Base class for analysis backends.
+
+    An engine is created and loaded once per process and then receives whole
+    batches of studies. predict_batch must return one result per request, in
+    order, using the result schema of generate_mock_analysis:
+    ap_landmarks, lat_landmarks, ap_reference_lines, lat_reference_lines,
+    measurements, has_ap, has_lat and summary.
+    """
+    name = "base"
+    version = "0"
+
+    def load(self) -> None:
+        """Load model weights; called once before the first batch"""
+        pass
+
+    def predict_batch(self, requests: List[InferenceRequest]) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+# Engine factories by backend name
+_registry: Dict[str, Callable[[], InferenceEngine]] = {}
+
+_engine: Optional[InferenceEngine] = None
+_engine_lock = threading.Lock()
+
+def register_engine(name: str, factory: Callable[[], InferenceEngine]) -> None:
+    """
+    Register an inference backend.
+
+    Args:
+        name: Backend name selected with INFERENCE_BACKEND
+        factory: Callable returning an unloaded engine
+    """
+    _registry[name] = factory
+
+def _backend() -> str:
+    backend = "mock" if settings.USE_MOCK else settings.INFERENCE_BACKEND
+    if backend not in _registry:
+        raise ValueError(f"Unknown inference backend: {backend}")
+    return backend
+
+def engine_version() -> str:
+    """
+    Get "{name}:{version}" of the configured engine without loading it.
+
+    Results are only reused (see inference/cache.py) for the same value.
+    """
+    engine = _engine or _registry[_backend()]()
+    return f"{engine.name}:{engine.version}"
+
+def get_engine() -> InferenceEngine:
+    """
+    Get the loaded engine of this process, loading it on first use.
+
+    The mock backend is always used while USE_MOCK is enabled.
+
+    Returns:
+        InferenceEngine: Loaded engine
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                engine = _registry[_backend()]()
+                engine.load()
+                logger.info(f"Loaded inference engine {engine.name} (version {engine.version})")
+                _engine = engine
+    return _engine
+
+def load_engine() -> None:
+    """
+    Load the engine eagerly, used as process pool initializer and at startup.
+    """
+    get_engine()
@@ -0,0 +1,34 @@
+import time
+from typing import Any, Dict, List
+
+from app.utils import generate_mock_analysis
+from app.inference.engine import InferenceEngine, InferenceRequest
+
+class MockInferenceEngine(InferenceEngine):
+    """
+    Deterministic CPU backend for development, tests and benchmarks.
+
+    Results come from generate_mock_analysis. The optional delays simulate a
+    model with a fixed cost per forward pass plus a cost per image, which is
+    what makes micro-batching pay off on real hardware.
+    """
+    name = "mock"
+    version = "mock-1"
+
+    def __init__(self, batch_overhead: float = 0.0, per_image: float = 0.0):
+        self.batch_overhead = batch_overhead
+        self.per_image = per_image
+        self.loaded = False
+
+    def load(self):
+        self.loaded = True
+
+    def predict_batch(self, requests: List[InferenceRequest]) -> List[Dict[str, Any]]:
+        images = sum((r.ap_path is not None) + (r.lat_path is not None) for r in requests)
+        if self.batch_overhead or self.per_image:
+            time.sleep(self.batch_overhead + self.per_image * images)
+
+        return [
+            generate_mock_analysis(r.ap_path, r.lat_path, r.ap_image, r.lat_image, r.ap_pixel_spacing, r.lat_pixel_spacing)
+            for r in requests
+        ]
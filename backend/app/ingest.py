@@ -0,0 +1,332 @@
+import logging
+from typing import Dict, Iterable, NamedTuple, Optional
+from PIL import Image
+from fastapi import HTTPException, status
+from fastapi.responses import JSONResponse
+from python_multipart.exceptions import FormParserError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+from app.config import settings
+from app.dicom import DicomHeader, read_header, decode_frame
+
+logger = logging.getLogger(__name__)
+
+# Accepted upload formats by leading magic bytes
+_SIGNATURES = (
+    (b"\xff\xd8\xff", "JPEG"),
+    (b"\x89PNG\r\n\x1a\n", "PNG"),
+    (b"II*\x00", "TIFF"),
+    (b"MM\x00*", "TIFF"),
+)
+
+# DICOM Part 10 files have "DICM" after a 128 byte preamble
+_DICOM_MAGIC_OFFSET = 128
+_DICOM_MAGIC = b"DICM"
+
+_SNIFF_BYTES = _DICOM_MAGIC_OFFSET + len(_DICOM_MAGIC)
+
+ACCEPTED_FORMATS = ("JPEG", "PNG", "TIFF", "DICOM")
+
+# File extension of stored images by format
+EXTENSIONS = {"JPEG": "jpg", "PNG": "png", "TIFF": "tif", "DICOM": "dcm"}
+
+# Bits per channel of Pillow image modes
+_BIT_DEPTHS = {
+    "1": 1,
+    "I;16": 16, "I;16B": 16, "I;16L": 16, "I;16N": 16,
+    "I": 32, "F": 32
+}
+
+class ImageInfo(NamedTuple):
+    """Properties of an uploaded image, read from its header"""
+    format: str
+    width: int
+    height: int
+    bit_depth: int
+    dicom: Optional[DicomHeader] = None  # Study metadata of DICOM uploads
+
+def _megabytes(size: int) -> str:
+    return f"{size / (1024 * 1024):g} MB"
+
+def sniff_format(head: bytes) -> Optional[str]:
+    """
+    Identify an accepted image format from the first bytes of a file.
+
+    Returns:
+        Optional[str]: "JPEG", "PNG", "TIFF" or "DICOM", None for anything else
+    """
+    for signature, fmt in _SIGNATURES:
+        if head.startswith(signature):
+            return fmt
+    if head[_DICOM_MAGIC_OFFSET:_SNIFF_BYTES] == _DICOM_MAGIC:
+        return "DICOM"
+    return None
+
+def sniff_file(path: str) -> Optional[str]:
+    """Identify the accepted image format of a local file, see sniff_format (blocking)"""
+    with open(path, "rb") as f:
+        return sniff_format(f.read(_SNIFF_BYTES))
+
+class UploadValidator:
+    """
+    Checks an upload chunk by chunk: the format from the first bytes, and
+    the size limit on every chunk. Runs while the request body arrives
+    (UploadValidationMiddleware) and again while the upload is copied to
+    staging, so bad uploads are rejected before they are stored.
+
+    Raises HTTPException 415 for unsupported content and 413 when the upload
+    is too large.
+    """
+
+    def __init__(self, label: str, max_bytes: Optional[int] = None):
+        self.label = label
+        self.max_bytes = max_bytes or settings.MAX_UPLOAD_BYTES
+        self.size = 0
+        self.format: Optional[str] = None
+        self._head = b""
+
+    def __call__(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"{self.label} exceeds the upload limit of {_megabytes(self.max_bytes)}"
+            )
+
+        if self.format is None:
+            self._head += chunk[:_SNIFF_BYTES - len(self._head)]
+            if len(self._head) >= _SNIFF_BYTES:
+                self._check_format()
+
+    def finish(self) -> str:
+        """
+        Check a completely received upload.
+
+        Returns:
+            str: The sniffed format
+        """
+        if self.format is None:
+            self._check_format()
+        return self.format
+
+    def _check_format(self) -> None:
+        self.format = sniff_format(self._head)
+        if self.format is None:
+            raise HTTPException(
+                status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                detail=f"{self.label} is not a supported image ({', '.join(ACCEPTED_FORMATS)})"
+            )
+
+def inspect_image(path: str, label: str, expected_format: str) -> ImageInfo:
+    """
+    Read and check the header of a received upload, without decoding pixels.
+
+    Args:
+        path: Local path of the upload
+        label: Name of the upload in error messages
+        expected_format: Format sniffed while streaming
+
+    Raises:
+        HTTPException: 422 if the header is unreadable, 415 if it does not match
+            the sniffed format, 413 if the image has too many pixels
+
+    Returns:
+        ImageInfo: Format, dimensions and bit depth, plus the study metadata
+        of DICOM files
+    """
+    if expected_format == "DICOM":
+        return _inspect_dicom(path, label)
+
+    try:
+        with Image.open(path) as img:
+            fmt, (width, height), mode = img.format, img.size, img.mode
+    except Image.DecompressionBombError:
+        fmt, width, height, mode = expected_format, None, None, None
+    except OSError as e:
+        logger.info(f"Rejected unreadable {label}: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"{label} could not be read as an image"
+        )
+
+    if width is None or width * height > settings.MAX_IMAGE_PIXELS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"{label} exceeds the limit of {settings.MAX_IMAGE_PIXELS} pixels"
+        )
+    if fmt != expected_format:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"{label} is not a valid {expected_format} image"
+        )
+
+    return ImageInfo(fmt, width, height, _BIT_DEPTHS.get(mode, 8))
+
+def _inspect_dicom(path: str, label: str) -> ImageInfo:
+    try:
+        header = read_header(path)
+    except OSError as e:
+        logger.info(f"Rejected unreadable {label}: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"{label} could not be read as a DICOM image"
+        )
+
+    # Only one frame is ever decoded, so the limit applies per frame
+    if header.rows * header.columns > settings.MAX_IMAGE_PIXELS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"{label} exceeds the limit of {settings.MAX_IMAGE_PIXELS} pixels"
+        )
+
+    return ImageInfo("DICOM", header.columns, header.rows, header.bits_stored, header)
+
+def decode_image(path: str) -> Image.Image:
+    """
+    Decode an image completely (blocking). The job runner calls this once per
+    image and shares the result between inference and derivative rendering.
+
+    DICOM files are decoded one frame at a time and windowed to 8 bits, see
+    app/dicom.py; their pixel spacing is in info["pixel_spacing"].
+
+    Raises:
+        OSError: If the file cannot be decoded
+
+    Returns:
+        Image.Image: Loaded image
+    """
+    if sniff_file(path) == "DICOM":
+        return decode_frame(path)
+
+    try:
+        img = Image.open(path)
+        img.load()
+    except Image.DecompressionBombError as e:
+        raise OSError(str(e))
+
+    if getattr(img, "fp", None) is not None:
+        # Multi-frame formats (TIFF) keep the file open after loading
+        loaded = img.copy()
+        img.close()
+        return loaded
+    return img
+
+class RequestSizeLimitMiddleware:
+    """
+    Rejects request bodies larger than max_bytes before they are parsed: from
+    Content-Length up front, or while the body arrives for chunked requests.
+    path_limits overrides the limit for requests to the given paths.
+    """
+
+    def __init__(self, app, max_bytes: int, path_limits: Optional[Dict[str, int]] = None):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_limits = path_limits or {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        max_bytes = self.path_limits.get(scope["path"], self.max_bytes)
+        detail = f"Request body exceeds the limit of {_megabytes(max_bytes)}"
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > max_bytes:
+            response = JSONResponse({"detail": detail}, status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+class _UploadPartChecker:
+    # Feeds a multipart body to an UploadValidator per file part, named by its field
+    def __init__(self, boundary: bytes):
+        self._header_name = b""
+        self._header_value = b""
+        self._disposition = b""
+        self._validator: Optional[UploadValidator] = None
+        self._parser: Optional[MultipartParser] = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+        })
+
+    def write(self, chunk: bytes) -> None:
+        if self._parser is None or not chunk:
+            return
+        try:
+            self._parser.write(chunk)
+        except FormParserError:
+            # Malformed bodies are left to the endpoint's form parser
+            self._parser = None
+
+    def _on_part_begin(self) -> None:
+        self._disposition = b""
+        self._validator = None
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_name += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        if self._header_name.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_name = self._header_value = b""
+
+    def _on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._disposition)
+        if options.get(b"filename") and b"name" in options:
+            self._validator = UploadValidator(options[b"name"].decode("utf-8", "replace"))
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._validator is not None:
+            self._validator(data[start:end])
+
+class UploadValidationMiddleware:
+    """
+    Checks the files of multipart POST requests to the given paths while
+    the body arrives, with an UploadValidator per file named by its form
+    field: an unsupported or oversized file ends the request with 415 or
+    413 before the rest of the body is received and spooled. The body is
+    passed on unchanged, and the endpoint checks what it receives again.
+    """
+
+    def __init__(self, app, paths: Iterable[str]):
+        self.app = app
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        content_type, options = parse_options_header(dict(scope["headers"]).get(b"content-type", b""))
+        if content_type != b"multipart/form-data" or not options.get(b"boundary"):
+            await self.app(scope, receive, send)
+            return
+
+        checker = _UploadPartChecker(options[b"boundary"])
+
+        async def checked_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                checker.write(message.get("body", b""))
+            return message
+
+        await self.app(scope, checked_receive, send)
@@ -0,0 +1,19 @@
+from typing import Optional
+
+from app.config import settings
+from app.jobs.broker import Broker, InProcessBroker, SQLiteBroker, create_broker
+from app.jobs.runner import JobRunner, run_analysis_batch
+
+_job_runner: Optional[JobRunner] = None
+
+def get_job_runner() -> JobRunner:
+    """
+    Get the process-wide job runner, creating it on first use.
+    """
+    global _job_runner
+    if _job_runner is None:
+        _job_runner = JobRunner(
+            create_broker(settings.JOB_BROKER_URL, settings.JOB_LEASE_SECONDS),
+            settings.INFERENCE_WORKERS
+        )
+    return _job_runner
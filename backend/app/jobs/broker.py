@@ -0,0 +1,172 @@
+import json
+import queue
+import itertools
+import sqlite3
+import time
+from contextlib import closing
+from typing import Any, Dict, List, Optional, Tuple
+
+class Broker:
+    """
+    Minimal message broker interface used by the job runner.
+
+    Messages are JSON-serializable dicts. fetch() hands out a delivery tag that
+    must be passed back to ack() once the job has been handled, or to requeue()
+    if it should be delivered again.
+    """
+    # Whether queued messages survive a process restart
+    durable = False
+
+    def publish(self, message: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def publish_many(self, messages: List[Dict[str, Any]]) -> None:
+        for message in messages:
+            self.publish(message)
+
+    def fetch(self, timeout: float = 1.0) -> Optional[Tuple[Any, Dict[str, Any]]]:
+        raise NotImplementedError
+
+    def ack(self, tag: Any) -> None:
+        raise NotImplementedError
+
+    def requeue(self, tag: Any) -> None:
+        raise NotImplementedError
+
+    def pending(self) -> int:
+        raise NotImplementedError
+
+class InProcessBroker(Broker):
+    """
+    Broker backed by an in-memory queue, jobs are lost on restart. For a
+    single process only: each process has a queue of its own.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._in_flight = {}
+        self._tags = itertools.count(1)
+
+    def publish(self, message):
+        self._queue.put(message)
+
+    def fetch(self, timeout=1.0):
+        try:
+            message = self._queue.get(timeout=timeout) if timeout else self._queue.get_nowait()
+        except queue.Empty:
+            return None
+
+        tag = next(self._tags)
+        self._in_flight[tag] = message
+        return tag, message
+
+    def ack(self, tag):
+        self._in_flight.pop(tag, None)
+
+    def requeue(self, tag):
+        message = self._in_flight.pop(tag, None)
+        if message is not None:
+            self._queue.put(message)
+
+    def pending(self):
+        return self._queue.qsize()
+
+class SQLiteBroker(Broker):
+    """
+    Durable broker stored in a SQLite file.
+
+    Stand-in for an external broker (Redis, RabbitMQ) on single-host
+    deployments. Messages are claimed with an immediate transaction so several
+    processes can consume the same queue safely. A claim is a lease of
+    lease_seconds: messages neither acked nor requeued by then, because their
+    consumer died, are delivered again.
+    """
+    durable = True
+
+    def __init__(self, path: str, lease_seconds: float = 600):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "payload TEXT NOT NULL, "
+                "state TEXT NOT NULL DEFAULT 'pending', "
+                "claimed_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_jobs_state_id ON jobs (state, id)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def publish(self, message):
+        with closing(self._connect()) as conn:
+            conn.execute("INSERT INTO jobs (payload) VALUES (?)", (json.dumps(message),))
+
+    def publish_many(self, messages):
+        # One transaction for all of them
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN")
+            conn.executemany("INSERT INTO jobs (payload) VALUES (?)", [(json.dumps(m),) for m in messages])
+            conn.execute("COMMIT")
+
+    def _claim(self):
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET state = 'pending', claimed_at = NULL "
+                "WHERE state = 'claimed' AND claimed_at < ?",
+                (now - self.lease_seconds,)
+            )
+            row = conn.execute(
+                "SELECT id, payload FROM jobs WHERE state = 'pending' ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET state = 'claimed', claimed_at = ? WHERE id = ?",
+                    (now, row[0])
+                )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+        return None if row is None else (row[0], json.loads(row[1]))
+
+    def fetch(self, timeout=1.0):
+        deadline = time.monotonic() + (timeout or 0)
+        while True:
+            claimed = self._claim()
+            if claimed is not None or time.monotonic() >= deadline:
+                return claimed
+            time.sleep(min(0.05, max(deadline - time.monotonic(), 0)))
+
+    def ack(self, tag):
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM jobs WHERE id = ?", (tag,))
+
+    def requeue(self, tag):
+        with closing(self._connect()) as conn:
+            conn.execute("UPDATE jobs SET state = 'pending', claimed_at = NULL WHERE id = ?", (tag,))
+
+    def pending(self):
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT COUNT(*) FROM jobs WHERE state = 'pending'").fetchone()[0]
+
+def create_broker(url: str, lease_seconds: float = 600) -> Broker:
+    """
+    Create a broker from a URL.
+
+    Args:
+        url: "memory" for the in-process broker or "sqlite:///path/to/jobs.db"
+        lease_seconds: Time after which unacknowledged SQLite jobs are delivered again
+
+    Returns:
+        Broker: Broker instance
+    """
+    if url == "memory":
+        return InProcessBroker()
+    if url.startswith("sqlite:///"):
+        return SQLiteBroker(url[len("sqlite:///"):], lease_seconds)
+    raise ValueError(f"Unsupported job broker URL: {url}")
@@ -0,0 +1,382 @@
+import time
+import logging
+import numpy as np
+import threading
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+
+from app import database, counters
+from app.storage import get_storage
+from app.config import settings
+from app.models import Analysis, AnalysisStatus
+from app.utils import get_result_path, summarize_analysis_result
+from app.inference import InferenceRequest, get_engine, load_engine
+from app.inference import cache as inference_cache
+from app.images import generate_derivatives
+from app.ingest import decode_image
+from app.jobs.broker import Broker
+
+# A claimed job: broker delivery tag and message
+Delivery = Tuple[Any, Dict[str, Any]]
+
+logger = logging.getLogger(__name__)
+
+def run_analysis_batch(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Run the analysis for a batch of queued jobs and persist their result files.
+
+    Executed in a worker process, so it only receives plain data and must not
+    touch the database. The inference engine is loaded once per process.
+
+    Args:
+        messages: Job messages with analysis_id, ap_path and lat_path
+
+    Returns:
+        List[Dict[str, Any]]: Per job, either result_path and result or error
+    """
+    storage = get_storage()
+
+    with ExitStack() as local_copies:
+        # The engine gets decoded pixels, so each image is read from storage and
+        # decoded exactly once; remote objects are downloaded to temporary files
+        requests, decoded, errors = [], [], {}
+        for index, message in enumerate(messages):
+            try:
+                images = {}
+                for view in ("ap", "lat"):
+                    key = message.get(f"{view}_path")
+                    if key:
+                        images[view] = decode_image(local_copies.enter_context(storage.local_path(key)))
+            except Exception as e:
+                # Unreadable, oversized or unavailable images fail their study only
+                errors[index] = f"Could not decode uploaded image: {str(e)}"
+                continue
+
+            requests.append(InferenceRequest(
+                message["analysis_id"],
+                message.get("ap_path"),
+                message.get("lat_path"),
+                ap_image=np.asarray(images["ap"]) if "ap" in images else None,
+                lat_image=np.asarray(images["lat"]) if "lat" in images else None,
+                ap_pixel_spacing=images["ap"].info.get("pixel_spacing") if "ap" in images else None,
+                lat_pixel_spacing=images["lat"].info.get("pixel_spacing") if "lat" in images else None
+            ))
+            decoded.append(images)
+
+    results = iter(_predict(requests))
+
+    # Render thumbnails and previews from the decoded images; anything missed
+    # here is rendered on first request
+    for request, images in zip(requests, decoded):
+        for view, image in images.items():
+            try:
+                generate_derivatives(request.analysis_id, view, image)
+            except Exception as e:
+                logger.warning(f"Could not render {view} derivatives of analysis {request.analysis_id}: {str(e)}")
+
+    outcomes = []
+    for index, message in enumerate(messages):
+        if index in errors:
+            outcomes.append({"error": errors[index]})
+            continue
+
+        result = next(results)
+        if isinstance(result, Exception):
+            outcomes.append({"error": str(result)})
+            continue
+        try:
+            result_path = storage.write_json(get_result_path(message["analysis_id"]), result)
+            outcomes.append({"result_path": result_path, "result": result})
+        except Exception as e:
+            outcomes.append({"error": str(e)})
+
+    return outcomes
+
+def _predict(requests: List[InferenceRequest]) -> List[Any]:
+    # Results of a batch, or when the batch fails, of each request run on its
+    # own so that only the studies the engine cannot handle fail
+    if not requests:
+        return []
+    engine = get_engine()
+    try:
+        return engine.predict_batch(requests)
+    except Exception as e:
+        logger.warning(f"Batch of {len(requests)} studies failed, running them one by one: {str(e)}")
+
+    results = []
+    for request in requests:
+        try:
+            results.extend(engine.predict_batch([request]))
+        except Exception as e:
+            results.append(e)
+    return results
+
+def _update_analysis(analysis_id: str, values: Dict[str, Any]) -> None:
+    db = database.SessionLocal()
+    try:
+        old_status = db.query(Analysis.status).filter(Analysis.id == analysis_id).scalar()
+        if old_status is None:
+            # Deleted while the job was running
+            return
+        db.query(Analysis).filter(Analysis.id == analysis_id).update(values, synchronize_session=False)
+        if "status" in values:
+            counters.record_status_change(db, old_status, values["status"])
+        db.commit()
+    finally:
+        db.close()
+
+def _cache_result(study_key: str, result: Dict[str, Any]) -> None:
+    db = database.SessionLocal()
+    try:
+        inference_cache.store(db, study_key, result)
+    except Exception as e:
+        logger.warning(f"Could not cache result of study {study_key}: {str(e)}")
+    finally:
+        db.close()
+
+class JobRunner:
+    """
+    Consumes analysis jobs from a broker and runs them on a process pool.
+
+    Jobs arriving within batch_window seconds of each other are grouped into
+    one engine call of up to batch_size studies. At most max_workers batches
+    are in flight, so inference throughput is bounded by the pool size rather
+    than by the number of HTTP requests.
+    """
+
+    def __init__(
+        self,
+        broker: Broker,
+        max_workers: int,
+        batch_size: Optional[int] = None,
+        batch_window: Optional[float] = None
+    ):
+        self.broker = broker
+        self.max_workers = max_workers
+        self.batch_size = batch_size or settings.INFERENCE_BATCH_SIZE
+        self.batch_window = settings.INFERENCE_BATCH_WINDOW_MS / 1000 if batch_window is None else batch_window
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._slots = threading.BoundedSemaphore(max(max_workers, 1))
+
+    def submit(
+        self,
+        analysis_id: str,
+        ap_path: Optional[str],
+        lat_path: Optional[str],
+        study_key: Optional[str] = None
+    ) -> None:
+        """
+        Queue an analysis job. With a study_key (see inference/cache.py) the
+        result is cached for later uploads of the same images.
+        """
+        self.broker.publish({
+            "analysis_id": analysis_id,
+            "ap_path": ap_path,
+            "lat_path": lat_path,
+            "study_key": study_key
+        })
+
+    def submit_many(self, jobs: List[Dict[str, Any]]) -> None:
+        """
+        Queue several analysis jobs at once, e.g. the studies of a batch
+        submission, so the dispatcher can run them in the same engine batches.
+
+        Args:
+            jobs: Dicts with analysis_id, ap_path, lat_path and study_key
+        """
+        self.broker.publish_many([{
+            "analysis_id": job["analysis_id"],
+            "ap_path": job.get("ap_path"),
+            "lat_path": job.get("lat_path"),
+            "study_key": job.get("study_key")
+        } for job in jobs])
+
+    def start(self) -> None:
+        """
+        Start the dispatcher thread and load the inference engine in every
+        worker process (or in this process when running jobs inline).
+        """
+        if self._thread is not None:
+            return
+
+        if not self.broker.durable:
+            self._requeue_unfinished()
+
+        if self.max_workers > 0:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=load_engine)
+        else:
+            load_engine()
+
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._dispatch_loop, name="job-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop dispatching and wait for running jobs to finish.
+        """
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def drain(self) -> int:
+        """
+        Run every pending job synchronously in the calling thread.
+
+        Returns:
+            int: Number of jobs processed
+        """
+        processed = 0
+        while True:
+            batch = self._collect_batch(timeout=0, window=0)
+            if not batch:
+                return processed
+            self._run_inline(batch)
+            processed += len(batch)
+
+    def _requeue_unfinished(self) -> None:
+        # Jobs held by a non-durable broker die with the process, so re-publish
+        # whatever the database still considers unfinished. Every analysis is
+        # taken to belong to this process, which holds only with one server
+        # process; several workers share a durable broker instead
+        db = database.SessionLocal()
+        try:
+            unfinished = db.query(Analysis).filter(
+                Analysis.status.in_([AnalysisStatus.QUEUED.value, AnalysisStatus.RUNNING.value])
+            ).all()
+            for analysis in unfinished:
+                self.submit(
+                    analysis.id,
+                    analysis.ap_image_path,
+                    analysis.lat_image_path,
+                    inference_cache.study_key(analysis.ap_image_hash, analysis.lat_image_hash)
+                )
+        finally:
+            db.close()
+
+        if unfinished:
+            logger.info(f"Re-queued {len(unfinished)} unfinished analysis jobs")
+
+    def _collect_batch(self, timeout: float, window: float) -> List[Delivery]:
+        # Block for the first job, then keep collecting until the window closes
+        delivery = self.broker.fetch(timeout=timeout)
+        if delivery is None:
+            return []
+
+        batch = [delivery]
+        deadline = time.monotonic() + window
+        while len(batch) < self.batch_size:
+            delivery = self.broker.fetch(timeout=max(deadline - time.monotonic(), 0))
+            if delivery is None:
+                break
+            batch.append(delivery)
+
+        return batch
+
+    def _dispatch_loop(self) -> None:
+        while not self._stopping.is_set():
+            if not self._slots.acquire(timeout=0.5):
+                continue
+
+            try:
+                batch = self._collect_batch(timeout=0.5, window=self.batch_window)
+            except Exception as e:
+                logger.error(f"Error fetching analysis jobs: {str(e)}")
+                batch = []
+
+            if not batch:
+                self._slots.release()
+                continue
+
+            if self._executor is None:
+                try:
+                    self._run_inline(batch)
+                finally:
+                    self._slots.release()
+                continue
+
+            try:
+                self._mark_running(batch)
+                future = self._executor.submit(run_analysis_batch, [message for _, message in batch])
+            except Exception as e:
+                self._finish(batch, error=e)
+                self._slots.release()
+                continue
+
+            future.add_done_callback(lambda f, batch=batch: self._on_done(f, batch))
+
+    def _run_inline(self, batch: List[Delivery]) -> None:
+        try:
+            self._mark_running(batch)
+            outcomes = run_analysis_batch([message for _, message in batch])
+        except Exception as e:
+            self._finish(batch, error=e)
+        else:
+            self._finish(batch, outcomes=outcomes)
+
+    def _on_done(self, future, batch: List[Delivery]) -> None:
+        try:
+            error = future.exception()
+            if error is not None:
+                self._finish(batch, error=error)
+            else:
+                self._finish(batch, outcomes=future.result())
+        finally:
+            self._slots.release()
+
+    def _mark_running(self, batch: List[Delivery]) -> None:
+        db = database.SessionLocal()
+        try:
+            ids = [message["analysis_id"] for _, message in batch]
+            previous = db.query(Analysis.status, func.count(Analysis.id)).filter(
+                Analysis.id.in_(ids)
+            ).group_by(Analysis.status).all()
+            db.query(Analysis).filter(
+                Analysis.id.in_(ids)
+            ).update({"status": AnalysisStatus.RUNNING.value}, synchronize_session=False)
+            for old_status, count in previous:
+                counters.record_status_change(db, old_status, AnalysisStatus.RUNNING.value, count)
+            db.commit()
+        finally:
+            db.close()
+
+    def _finish(self, batch: List[Delivery], outcomes: Optional[List[Dict[str, Any]]] = None, error=None) -> None:
+        if outcomes is None:
+            outcomes = [{"error": str(error)}] * len(batch)
+
+        for (tag, message), outcome in zip(batch, outcomes):
+            analysis_id = message["analysis_id"]
+
+            try:
+                if "error" in outcome:
+                    logger.error(f"Analysis job {analysis_id} failed: {outcome['error']}")
+                    _update_analysis(analysis_id, {
+                        "status": AnalysisStatus.FAILED.value,
+                        "error": outcome["error"]
+                    })
+                else:
+                    _update_analysis(analysis_id, {
+                        "status": AnalysisStatus.DONE.value,
+                        "result_path": outcome["result_path"],
+                        "error": None,
+                        **summarize_analysis_result(outcome["result"])
+                    })
+            except Exception as e:
+                # Leave the message with the broker so it is delivered again
+                logger.error(f"Error recording analysis job {analysis_id}: {str(e)}")
+                self.broker.requeue(tag)
+                continue
+
+            self.broker.ack(tag)
+
+            if "error" not in outcome and message.get("study_key") and settings.INFERENCE_CACHE:
+                _cache_result(message["study_key"], outcome["result"])
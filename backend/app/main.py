@@ -1,18 +1,17 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-import os
 
-from app.routers import analysis, history, auth
+from app.routers import analysis, history, auth, images, system
 from app.config import settings
 from app.database import engine
+from app.pagination import PAGINATION_HEADERS
+from app.jobs import get_job_runner
+from app.retention import get_file_cleaner
+from app.ingest import RequestSizeLimitMiddleware, UploadValidationMiddleware
 from app import models
 
 models.Base.metadata.create_all(bind=engine)
 
-os.makedirs("static/images", exist_ok=True)
-os.makedirs("static/results", exist_ok=True)
-
 app = FastAPI(
     title="WristSight AI",
     description="API for X-ray analysis",
@@ -26,13 +25,45 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=PAGINATION_HEADERS,
 )
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Reject unsupported or oversized images while an analysis is uploaded; a
+# batch reports its rejected files per study instead
+app.add_middleware(UploadValidationMiddleware, paths=["/api/analyses"])
+
+# Refuse oversized uploads before their bodies are read
+app.add_middleware(
+    RequestSizeLimitMiddleware,
+    max_bytes=settings.MAX_REQUEST_BYTES,
+    path_limits={"/api/analyses/batch": settings.MAX_BATCH_REQUEST_BYTES}
+)
 
 app.include_router(auth.router, prefix="/api", tags=["auth"])
 app.include_router(analysis.router, prefix="/api", tags=["analysis"])
 app.include_router(history.router, prefix="/api", tags=["history"])
+app.include_router(images.router, prefix="/api", tags=["images"])
+app.include_router(system.router, prefix="/api", tags=["system"])
+
+@app.on_event("startup")
+def start_job_runner():
+    """Start the background analysis workers"""
+    get_job_runner().start()
+
+@app.on_event("startup")
+def start_file_cleaner():
+    """Start removing the files of deleted analyses in the background"""
+    get_file_cleaner().start()
+
+@app.on_event("shutdown")
+def stop_job_runner():
+    """Wait for running analysis jobs and stop the workers"""
+    get_job_runner().stop()
+
+@app.on_event("shutdown")
+def stop_file_cleaner():
+    """Stop the background file cleaner"""
+    get_file_cleaner().stop()
 
 @app.get("/", tags=["root"])
 async def root():
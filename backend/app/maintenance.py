@@ -0,0 +1,175 @@
+"""
+Maintenance commands.
+
+Usage:
+    python -m app.maintenance recompute-measurements [--batch-size 1000]
+    python -m app.maintenance recompute-stats
+    python -m app.maintenance purge [--older-than-days N] [--patient ID] [--user USERNAME] [--batch-size 500] [--pause 0.2]
+    python -m app.maintenance clean-files
+    python -m app.maintenance clean-refresh-tokens
+
+purge deletes the matching analyses, by default those older than
+RETENTION_DAYS; their files are removed by the server's file cleaner, or
+right away with clean-files.
+"""
+import time
+import logging
+import argparse
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy.orm import Session
+
+from app import database, counters, retention, refresh_tokens
+from app.storage import get_storage
+from app.config import settings
+from app.models import Analysis, AnalysisStatus, InferenceCacheEntry, User
+from app.measurements import measure_results
+
+logger = logging.getLogger(__name__)
+
+def _load_results(paths):
+    with ThreadPoolExecutor(max_workers=settings.FILE_IO_WORKERS) as pool:
+        return list(pool.map(_read_or_none, paths))
+
+def _read_or_none(path):
+    try:
+        return get_storage().read_json(path)
+    except (OSError, ValueError) as e:
+        logger.error(f"Skipping unreadable result file {path}: {str(e)}")
+        return None
+
+def recompute_measurements(db: Session, batch_size: int = 1000, pixel_spacing=None) -> int:
+    """
+    Recompute the measurements of all finished analyses from their landmarks.
+
+    Result files are read in parallel and each batch of studies is measured
+    with a single vectorized call. The result files, the denormalized
+    measurements column and the cached results that later uploads of the
+    same images reuse are all updated.
+
+    Args:
+        db: Database session
+        batch_size: Number of studies measured per call
+        pixel_spacing: mm per pixel, defaults to settings.DEFAULT_PIXEL_SPACING_MM
+
+    Returns:
+        int: Number of analyses updated
+    """
+    rows = db.query(Analysis.id, Analysis.result_path).filter(
+        Analysis.status == AnalysisStatus.DONE.value,
+        Analysis.result_path.isnot(None)
+    ).order_by(Analysis.id).all()
+
+    updated = 0
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        loaded = [(row, result) for row, result in zip(batch, _load_results([r.result_path for r in batch])) if result]
+        if not loaded:
+            continue
+
+        measurements = measure_results([result for _, result in loaded], pixel_spacing)
+
+        mappings = []
+        for (row, result), values in zip(loaded, measurements):
+            result["measurements"] = values
+            mappings.append({"id": row.id, "measurements": values})
+
+        with ThreadPoolExecutor(max_workers=settings.FILE_IO_WORKERS) as pool:
+            list(pool.map(lambda item: get_storage().write_json(item[0].result_path, item[1]), loaded))
+
+        db.bulk_update_mappings(Analysis, mappings)
+        db.commit()
+        updated += len(mappings)
+
+    _recompute_cached_results(db, batch_size, pixel_spacing)
+    return updated
+
+def _recompute_cached_results(db: Session, batch_size: int, pixel_spacing) -> None:
+    # Cached results answer later uploads of the same images
+    query = db.query(InferenceCacheEntry.study_key).distinct().order_by(InferenceCacheEntry.study_key)
+    keys = [key for key, in query]
+
+    for start in range(0, len(keys), batch_size):
+        entries = db.query(
+            InferenceCacheEntry.study_key, InferenceCacheEntry.engine_version, InferenceCacheEntry.result
+        ).filter(InferenceCacheEntry.study_key.in_(keys[start:start + batch_size])).all()
+
+        measurements = measure_results([entry.result for entry in entries], pixel_spacing)
+        db.bulk_update_mappings(InferenceCacheEntry, [{
+            "study_key": entry.study_key,
+            "engine_version": entry.engine_version,
+            "result": {**entry.result, "measurements": values}
+        } for entry, values in zip(entries, measurements)])
+        db.commit()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    recompute = commands.add_parser("recompute-measurements", help="Recompute measurements from stored landmarks")
+    recompute.add_argument("--batch-size", type=int, default=1000)
+    recompute.add_argument("--pixel-spacing", type=float, default=None, help="mm per pixel")
+
+    commands.add_parser("recompute-stats", help="Rebuild the analysis statistics counters and patient index")
+
+    purge = commands.add_parser("purge", help="Delete old analyses, or those of a patient or user")
+    purge.add_argument("--older-than-days", type=int, default=None)
+    purge.add_argument("--patient", default=None, help="Patient id")
+    purge.add_argument("--user", default=None, help="Username")
+    purge.add_argument("--batch-size", type=int, default=None, help="Analyses per transaction")
+    purge.add_argument("--pause", type=float, default=None, help="Seconds between transactions")
+
+    commands.add_parser("clean-files", help="Remove the queued files of deleted analyses now")
+
+    commands.add_parser("clean-refresh-tokens", help="Delete expired refresh tokens")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    db = database.SessionLocal()
+    try:
+        if args.command == "recompute-measurements":
+            start = time.perf_counter()
+            count = recompute_measurements(db, args.batch_size, args.pixel_spacing)
+            logger.info(f"Recomputed measurements of {count} analyses in {time.perf_counter() - start:.1f}s")
+        elif args.command == "recompute-stats":
+            start = time.perf_counter()
+            stats = counters.recompute(db)
+            logger.info(f"Recomputed counters of {stats['total_analyses']} analyses in {time.perf_counter() - start:.1f}s")
+        elif args.command == "purge":
+            days = args.older_than_days
+            if days is None and args.patient is None and args.user is None:
+                days = settings.RETENTION_DAYS
+                if days <= 0:
+                    parser.error("RETENTION_DAYS is not set; pass --older-than-days, --patient or --user")
+
+            user_id = None
+            if args.user is not None:
+                user = db.query(User).filter(User.username == args.user).first()
+                if user is None:
+                    parser.error(f"Unknown user {args.user}")
+                user_id = user.id
+
+            start = time.perf_counter()
+            count = retention.purge_analyses(
+                db,
+                older_than=datetime.utcnow() - timedelta(days=days) if days is not None else None,
+                patient_id=args.patient,
+                user_id=user_id,
+                batch_size=args.batch_size,
+                pause=args.pause
+            )
+            logger.info(f"Purged {count} analyses in {time.perf_counter() - start:.1f}s")
+        elif args.command == "clean-files":
+            start = time.perf_counter()
+            count = retention.get_file_cleaner().drain()
+            logger.info(f"Removed {count} queued files in {time.perf_counter() - start:.1f}s")
+        elif args.command == "clean-refresh-tokens":
+            count = refresh_tokens.delete_expired(db)
+            db.commit()
+            logger.info(f"Deleted {count} expired refresh tokens")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
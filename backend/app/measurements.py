@@ -0,0 +1,222 @@
+import numpy as np
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+from app.config import settings
+
+# Landmark order of the (N, K, 2) arrays for each view
+AP_LANDMARKS = ("radial_shaft_proximal", "radial_shaft_distal", "radial_styloid", "ulnar_corner", "ulnar_head")
+LAT_LANDMARKS = ("radial_shaft_proximal", "radial_shaft_distal", "volar_rim", "dorsal_rim")
+
+# Reported measurements in display order, with their units
+MEASUREMENTS = (
+    ("Radial Angle", "°"),
+    ("Radial Length", "mm"),
+    ("Radial Shift", "mm"),
+    ("Ulnar Variance", "mm"),
+    ("Palmar Tilt", "°"),
+    ("Dorsal Shift", "mm")
+)
+
+Spacing = Union[None, float, Sequence[float], np.ndarray]
+
+def _dot(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return np.einsum("...i,...i->...", a, b)
+
+def _spacing_xy(spacing: Spacing, n: int) -> np.ndarray:
+    """
+    Normalize pixel spacing to an (N, 2) array of (x, y) mm per pixel.
+
+    Accepts None (settings default), a scalar, one (row, column) pair as in
+    DICOM PixelSpacing, N scalars (shape (N,) or (N, 1)), or N (row, column)
+    pairs. Two different values for two studies could be either a pair or
+    per-study scalars, so they are refused; pass them with shape (2, 1) or
+    (2, 2) instead.
+    """
+    if spacing is None:
+        spacing = settings.DEFAULT_PIXEL_SPACING_MM
+
+    spacing = np.asarray(spacing, dtype=float)
+    if spacing.ndim == 0:
+        return np.full((n, 2), float(spacing))
+    if spacing.shape == (2,) and n == 2 and spacing[0] != spacing[1]:
+        raise ValueError("Pixel spacing [a, b] for two studies is ambiguous, pass shape (2, 1) or (2, 2)")
+    if spacing.shape == (n, 1) or (spacing.ndim == 1 and spacing.shape[0] == n and n != 2):
+        return np.repeat(spacing.reshape(n, 1), 2, axis=1)
+    if spacing.ndim == 1 and spacing.shape[0] == 2:
+        return np.broadcast_to(spacing[::-1], (n, 2))
+    if spacing.shape == (n, 2):
+        return spacing[:, ::-1]
+    raise ValueError(f"Pixel spacing of shape {spacing.shape} does not match {n} studies")
+
+def _axis_frame(proximal: np.ndarray, distal: np.ndarray, toward: np.ndarray):
+    """
+    Unit vectors along the bone axis (pointing distally) and perpendicular to
+    it, with the perpendicular oriented so that `toward` has a positive
+    component along it.
+    """
+    axis = distal - proximal
+    axis = axis / np.linalg.norm(axis, axis=-1, keepdims=True)
+    normal = np.stack([-axis[:, 1], axis[:, 0]], axis=-1)
+
+    side = np.sign(_dot(toward, normal))
+    side[side == 0] = 1
+    return axis, normal * side[:, None]
+
+def compute_ap_measurements(landmarks: np.ndarray, pixel_spacing: Spacing = None) -> Dict[str, np.ndarray]:
+    """
+    Compute AP view measurements for a batch of studies.
+
+    Args:
+        landmarks: (N, 5, 2) pixel coordinates in AP_LANDMARKS order
+        pixel_spacing: mm per pixel, see _spacing_xy
+
+    Returns:
+        Dict[str, np.ndarray]: Radial Angle (degrees), Radial Length, Radial
+        Shift and Ulnar Variance (mm), each of shape (N,)
+    """
+    points = np.asarray(landmarks, dtype=float)
+    points = points * _spacing_xy(pixel_spacing, points.shape[0])[:, None, :]
+    proximal, distal, styloid, ulnar_corner, ulnar_head = np.moveaxis(points, 1, 0)
+
+    articular = styloid - ulnar_corner
+    axis, normal = _axis_frame(proximal, distal, toward=articular)
+
+    return {
+        # Inclination of the articular surface relative to the perpendicular of the shaft
+        "Radial Angle": np.degrees(np.arctan2(_dot(articular, axis), _dot(articular, normal))),
+        # Styloid tip to ulnar articular surface, measured along the shaft
+        "Radial Length": _dot(styloid - ulnar_head, axis),
+        # Offset of the articular surface centre from the shaft axis, radial side positive
+        "Radial Shift": _dot((styloid + ulnar_corner) / 2 - distal, normal),
+        # Ulnar head relative to the ulnar corner of the radius, ulna-plus positive
+        "Ulnar Variance": _dot(ulnar_head - ulnar_corner, axis)
+    }
+
+def compute_lat_measurements(landmarks: np.ndarray, pixel_spacing: Spacing = None) -> Dict[str, np.ndarray]:
+    """
+    Compute lateral view measurements for a batch of studies.
+
+    Args:
+        landmarks: (N, 4, 2) pixel coordinates in LAT_LANDMARKS order
+        pixel_spacing: mm per pixel, see _spacing_xy
+
+    Returns:
+        Dict[str, np.ndarray]: Palmar Tilt (degrees) and Dorsal Shift (mm),
+        each of shape (N,)
+    """
+    points = np.asarray(landmarks, dtype=float)
+    points = points * _spacing_xy(pixel_spacing, points.shape[0])[:, None, :]
+    proximal, distal, volar_rim, dorsal_rim = np.moveaxis(points, 1, 0)
+
+    articular = dorsal_rim - volar_rim
+    axis, normal = _axis_frame(proximal, distal, toward=articular)
+
+    return {
+        # Volar rim distal to the dorsal rim gives a positive (palmar) tilt
+        "Palmar Tilt": np.degrees(np.arctan2(_dot(-articular, axis), _dot(articular, normal))),
+        # Offset of the articular surface centre from the shaft axis, dorsal positive
+        "Dorsal Shift": _dot((volar_rim + dorsal_rim) / 2 - distal, normal)
+    }
+
+def stack_landmarks(landmark_lists: List[Optional[List[Dict[str, Any]]]], order: Sequence[str]) -> np.ndarray:
+    """
+    Stack per-study landmark lists into an (N, K, 2) array.
+
+    Landmarks that are missing from a study are NaN, which propagates to the
+    measurements that depend on them.
+
+    Args:
+        landmark_lists: Per study, a list of {"x", "y", "label"} points or None
+        order: Landmark labels in array order
+
+    Returns:
+        np.ndarray: (N, K, 2) pixel coordinates
+    """
+    index = {label: k for k, label in enumerate(order)}
+    stacked = np.full((len(landmark_lists), len(order), 2), np.nan)
+
+    for i, points in enumerate(landmark_lists):
+        for point in points or []:
+            k = index.get(point.get("label"))
+            if k is not None:
+                stacked[i, k] = (point["x"], point["y"])
+
+    return stacked
+
+def compute_measurements(
+    ap_landmarks: np.ndarray,
+    lat_landmarks: np.ndarray,
+    ap_pixel_spacing: Spacing = None,
+    lat_pixel_spacing: Spacing = None
+) -> Dict[str, np.ndarray]:
+    """
+    Compute all six measurements for a batch of studies.
+
+    Args:
+        ap_landmarks: (N, 5, 2) AP landmarks, NaN where the view is missing
+        lat_landmarks: (N, 4, 2) lateral landmarks, NaN where the view is missing
+        ap_pixel_spacing: mm per pixel of the AP images
+        lat_pixel_spacing: mm per pixel of the lateral images
+
+    Returns:
+        Dict[str, np.ndarray]: Measurement label to (N,) values, NaN when a
+        study lacks the landmarks for it
+    """
+    with np.errstate(invalid="ignore", divide="ignore"):
+        values = compute_ap_measurements(ap_landmarks, ap_pixel_spacing)
+        values.update(compute_lat_measurements(lat_landmarks, lat_pixel_spacing))
+    return values
+
+def format_measurements(values: Dict[str, np.ndarray], index: int = 0) -> List[Dict[str, str]]:
+    """
+    Format the measurements of one study for the result schema.
+
+    Measurements that could not be computed are left out.
+
+    Args:
+        values: Output of compute_measurements
+        index: Study index within the batch
+
+    Returns:
+        List[Dict[str, str]]: {"label", "value", "unit"} entries
+    """
+    measurements = []
+    for label, unit in MEASUREMENTS:
+        value = float(values[label][index])
+        if np.isfinite(value):
+            measurements.append({"label": label, "value": f"{value:.1f}", "unit": unit})
+    return measurements
+
+def _result_spacing(results: List[Dict[str, Any]], key: str, pixel_spacing: Spacing) -> np.ndarray:
+    # (N, 2) row, column spacing: the image's own where the result records it
+    spacing = _spacing_xy(pixel_spacing, len(results))[:, ::-1].copy()
+    for i, result in enumerate(results):
+        if result.get(key):
+            spacing[i] = result[key]
+    return spacing
+
+def measure_results(results: List[Dict[str, Any]], pixel_spacing: Spacing = None) -> List[List[Dict[str, str]]]:
+    """
+    Compute formatted measurements for a batch of analysis results.
+
+    Results of DICOM studies record the PixelSpacing of their images as
+    ap_pixel_spacing and lat_pixel_spacing ([row, column] mm); those take
+    precedence over pixel_spacing.
+
+    Args:
+        results: Analysis results with ap_landmarks and lat_landmarks
+        pixel_spacing: mm per pixel of images without their own spacing
+
+    Returns:
+        List[List[Dict[str, str]]]: Measurements per result
+    """
+    if not results:
+        return []
+
+    values = compute_measurements(
+        stack_landmarks([result.get("ap_landmarks") for result in results], AP_LANDMARKS),
+        stack_landmarks([result.get("lat_landmarks") for result in results], LAT_LANDMARKS),
+        _result_spacing(results, "ap_pixel_spacing", pixel_spacing),
+        _result_spacing(results, "lat_pixel_spacing", pixel_spacing)
+    )
+    return [format_measurements(values, i) for i in range(len(results))]
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Text, Enum
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Date, DateTime, Text, Enum, JSON, Index
 from sqlalchemy.sql import func
 from sqlalchemy.sql.expression import text
 from sqlalchemy.sql.sqltypes import TIMESTAMP
@@ -15,6 +15,13 @@ class UserRole(str, enum.Enum):
     SUPERUSER = "SUPERUSER"
     NORMAL = "NORMAL"
 
+class AnalysisStatus(str, enum.Enum):
+    """Processing state of an analysis job"""
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
 class User(Base):
     __tablename__ = "users"
     
@@ -25,6 +32,8 @@ class User(Base):
     role = Column(Enum(UserRole), default=UserRole.NORMAL, nullable=False)
     is_active = Column(Boolean, default=True)
     created_at = Column(TIMESTAMP(timezone=True), default=datetime.utcnow, nullable=False)
+    # Bumped to revoke every access token issued to the user so far
+    token_version = Column(Integer, default=0, server_default="0", nullable=False)
 
 class Analysis(Base):
     """Analysis record model"""
@@ -34,14 +43,109 @@ class Analysis(Base):
     patient_id = Column(String, index=True)
     ap_image_path = Column(String, nullable=True)
     lat_image_path = Column(String, nullable=True)
+    ap_image_hash = Column(String(64), nullable=True)  # SHA-256 of the image blob
+    lat_image_hash = Column(String(64), nullable=True)
     result_path = Column(String)
-    timestamp = Column(DateTime, default=func.now(), index=True)
+    timestamp = Column(DateTime, default=func.now())
     notes = Column(Text, nullable=True)
-    status = Column(String, default="new")  # "new", "reviewed", "finalized"
+    status = Column(String, default=AnalysisStatus.QUEUED.value)  # "queued", "running", "done", "failed"
+    error = Column(Text, nullable=True)  # Failure reason of the analysis job
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # Row version of cached responses
+
+    # Indexed from the headers of DICOM uploads
+    study_date = Column(Date, nullable=True)
+    modality = Column(String(16), nullable=True)
+    ap_pixel_spacing = Column(JSON, nullable=True)  # [row, column] mm per pixel
+    lat_pixel_spacing = Column(JSON, nullable=True)
+
+    # Denormalized copy of the result file so listings never have to open it
+    summary = Column(Text, nullable=True)
+    has_ap = Column(Boolean, default=False, nullable=False)
+    has_lat = Column(Boolean, default=False, nullable=False)
+    measurements = Column(JSON, nullable=True)
 
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     user = relationship("User")
+
+    # Listings filter by user and/or patient and page newest first on (timestamp, id)
+    __table_args__ = (
+        Index("ix_analyses_timestamp_id", "timestamp", "id"),
+        Index("ix_analyses_user_id_timestamp", "user_id", "timestamp", "id"),
+        Index("ix_analyses_patient_id_timestamp", "patient_id", "timestamp", "id"),
+        Index("ix_analyses_patient_id_study_date", "patient_id", "study_date"),
+    )
     
+class ImageBlob(Base):
+    """
+    Uploaded image stored once by content hash and shared by every analysis
+    referencing it; the file is deleted when ref_count drops to zero
+    """
+    __tablename__ = "image_blobs"
+
+    sha256 = Column(String(64), primary_key=True)
+    path = Column(String, nullable=False)
+    size = Column(Integer, nullable=False)
+
+    # Read from the image header when the upload is accepted
+    format = Column(String, nullable=True)  # "JPEG", "PNG", "TIFF"
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    bit_depth = Column(Integer, nullable=True)
+
+    ref_count = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=func.now())
+
+class InferenceCacheEntry(Base):
+    """
+    Analysis result of a study, keyed by the hashes of its images and the
+    inference engine version that produced it
+    """
+    __tablename__ = "inference_cache"
+
+    study_key = Column(String, primary_key=True)  # "{ap_hash}:{lat_hash}", "-" for a missing view
+    engine_version = Column(String, primary_key=True)  # "{engine name}:{engine version}"
+    result = Column(JSON, nullable=False)
+    created_at = Column(DateTime, default=func.now())
+
+class AnalysisCounter(Base):
+    """
+    Incrementally maintained analysis counts for the dashboard statistics,
+    one row per (dimension, key), e.g. ("status", "done") or ("user", "3")
+    """
+    __tablename__ = "analysis_counters"
+
+    dimension = Column(String, primary_key=True)  # "total", "user", "patient", "status"
+    key = Column(String, primary_key=True)
+    count = Column(Integer, default=0, nullable=False)
+
+class PatientAccess(Base):
+    """
+    Maintained index of the patients each user has analyses of, one row per
+    (user, patient), behind the patient picker (see app/patient_index.py)
+    """
+    __tablename__ = "patient_access"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    patient_id = Column(String, primary_key=True)
+    study_count = Column(Integer, default=0, nullable=False)
+    last_study_at = Column(DateTime, nullable=True)
+
+    # Admins list patients across users, by patient id
+    __table_args__ = (
+        Index("ix_patient_access_patient_id", "patient_id"),
+    )
+
+class PendingFileDeletion(Base):
+    """
+    Stored object, or prefix ending in "/", of a deleted analysis waiting to
+    be removed by the background file cleaner (see app/retention.py)
+    """
+    __tablename__ = "pending_file_deletions"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    key = Column(String, nullable=False)
+    created_at = Column(DateTime, default=func.now())
+
 class Patient(Base):
     """Patient record model (basic implementation)"""
     __tablename__ = "patients"
@@ -49,3 +153,22 @@ class Patient(Base):
     id = Column(String, primary_key=True, index=True)
     medical_record_number = Column(String, unique=True, index=True)
     name = Column(String, nullable=True)
+
+class RefreshToken(Base):
+    """
+    Refresh token, stored as the SHA-256 of the token. Tokens rotated from
+    one login share a family; presenting a used token revokes the family
+    (see app/refresh_tokens.py)
+    """
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    token_hash = Column(String(64), unique=True, nullable=False)
+    family_id = Column(String(32), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    # Token version of the user when issued; revoking their tokens revokes these too
+    token_version = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=func.now())
+    expires_at = Column(DateTime, nullable=False, index=True)
+    used_at = Column(DateTime, nullable=True)
+    revoked_at = Column(DateTime, nullable=True)
@@ -0,0 +1,147 @@
+import json
+import base64
+import binascii
+from datetime import datetime
+from typing import Any, List, NamedTuple, Optional, Sequence
+from fastapi import HTTPException, Response, status
+from sqlalchemy import tuple_, DateTime
+from sqlalchemy.orm import Query
+
+# Response headers carrying pagination info; list bodies stay plain arrays
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+PREV_CURSOR_HEADER = "X-Prev-Cursor"
+TOTAL_COUNT_HEADER = "X-Total-Count"
+PAGINATION_HEADERS = [NEXT_CURSOR_HEADER, PREV_CURSOR_HEADER, TOTAL_COUNT_HEADER]
+
+class Page(NamedTuple):
+    items: List[Any]
+    next_cursor: Optional[str]
+    prev_cursor: Optional[str]
+
+def encode_cursor(values: Sequence[Any], direction: str) -> str:
+    """
+    Encode the sort key of a row into an opaque cursor.
+
+    Args:
+        values: Sort key values of the boundary row
+        direction: "next" to continue after the row, "prev" to go back before it
+
+    Returns:
+        str: URL-safe cursor
+    """
+    payload = {
+        "k": [value.isoformat() if isinstance(value, datetime) else value for value in values],
+        "d": direction
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, columns: Sequence) -> tuple:
+    """
+    Decode a cursor produced by encode_cursor.
+
+    Raises:
+        HTTPException: 400 if the cursor is malformed
+
+    Returns:
+        tuple: (sort key values, direction)
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        values = payload["k"]
+        direction = payload["d"]
+        if len(values) != len(columns) or direction not in ("next", "prev"):
+            raise ValueError("cursor does not match this listing")
+
+        values = [
+            datetime.fromisoformat(value) if isinstance(column.type, DateTime) and value is not None else value
+            for column, value in zip(columns, values)
+        ]
+    except (ValueError, KeyError, TypeError, binascii.Error):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pagination cursor"
+        )
+
+    return values, direction
+
+def _after(columns: Sequence, values: Sequence, descending: bool):
+    # Row-value comparison (a, b) > (va, vb) lets SQLite and Postgres seek a
+    # composite index to the boundary row; the equivalent OR expansion scans it
+    if len(columns) == 1:
+        return columns[0] < values[0] if descending else columns[0] > values[0]
+    return tuple_(*columns) < tuple_(*values) if descending else tuple_(*columns) > tuple_(*values)
+
+def paginate(
+    query: Query,
+    columns: Sequence,
+    limit: Optional[int],
+    cursor: Optional[str] = None,
+    descending: bool = True,
+    offset: int = 0
+) -> Page:
+    """
+    Fetch one page of a query with keyset (cursor) pagination.
+
+    The query is ordered by `columns`, which must form a unique key, and
+    continues from the boundary row encoded in the cursor, so every page costs
+    the same as the first one.
+
+    Args:
+        query: Filtered query, without ordering or limits
+        columns: Sort key columns, e.g. (Analysis.timestamp, Analysis.id)
+        limit: Page size, None for every remaining row
+        cursor: Cursor from a previous page, None for the first page
+        descending: Sort order
+        offset: Rows to skip, only kept for clients still paging by offset
+
+    Returns:
+        Page: Items and cursors for the following and preceding pages
+    """
+    direction = "next"
+    if cursor:
+        values, direction = decode_cursor(cursor, columns)
+        # Walking backwards means scanning in the opposite order
+        query = query.filter(_after(columns, values, descending if direction == "next" else not descending))
+
+    scan_descending = descending if direction == "next" else not descending
+    query = query.order_by(*[column.desc() if scan_descending else column.asc() for column in columns])
+
+    if offset:
+        query = query.offset(offset)
+
+    if limit is None:
+        rows, has_more = query.all(), False
+    else:
+        rows = query.limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+    if direction == "prev":
+        rows.reverse()
+
+    def key(row):
+        return [getattr(row, column.key) for column in columns]
+
+    if not rows:
+        return Page(rows, None, None)
+
+    if direction == "next":
+        next_cursor = encode_cursor(key(rows[-1]), "next") if has_more else None
+        prev_cursor = encode_cursor(key(rows[0]), "prev") if cursor or offset else None
+    else:
+        next_cursor = encode_cursor(key(rows[-1]), "next")
+        prev_cursor = encode_cursor(key(rows[0]), "prev") if has_more else None
+
+    return Page(rows, next_cursor, prev_cursor)
+
+def set_page_headers(response: Response, page: Page, total: Optional[int] = None) -> None:
+    """
+    Expose the cursors (and optional total count) of a page as response headers.
+    """
+    if page.next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = page.next_cursor
+    if page.prev_cursor:
+        response.headers[PREV_CURSOR_HEADER] = page.prev_cursor
+    if total is not None:
+        response.headers[TOTAL_COUNT_HEADER] = str(total)
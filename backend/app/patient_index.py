@@ -0,0 +1,87 @@
+"""
+Maintained index of the patients each user has analyses of, with their study
+count and latest study, so the patient picker never scans analyses.
+
+Kept up to date by app/counters.py, whose record_created / record_deleted /
+record_deleted_rows every create and delete path already calls.
+"""
+from typing import Dict, Iterable, Optional
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.models import Analysis, PatientAccess
+
+def record_created(db: Session, user_id: int, patient_id: Optional[str]) -> None:
+    """
+    Count a new analysis of a patient by a user. Part of the caller's transaction.
+    """
+    if patient_id is None:
+        return
+
+    values = {"user_id": user_id, "patient_id": patient_id, "study_count": 1, "last_study_at": func.now()}
+    dialect = db.get_bind().dialect.name
+
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        stmt = insert(PatientAccess).values(**values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[PatientAccess.user_id, PatientAccess.patient_id],
+            set_={"study_count": PatientAccess.study_count + 1, "last_study_at": func.now()}
+        )
+        db.execute(stmt)
+        return
+
+    updated = db.query(PatientAccess).filter(
+        PatientAccess.user_id == user_id,
+        PatientAccess.patient_id == patient_id
+    ).update(
+        {"study_count": PatientAccess.study_count + 1, "last_study_at": func.now()},
+        synchronize_session=False
+    )
+    if not updated:
+        db.add(PatientAccess(**values))
+
+def record_deleted(db: Session, pairs: Iterable[tuple]) -> None:
+    """
+    Uncount deleted analyses, given as (user_id, patient_id) pairs. Entries
+    without analyses are dropped and the latest study of the others is
+    looked up again. Call after the analyses were deleted, in the same
+    transaction.
+    """
+    deltas: Dict[tuple, int] = {}
+    for user_id, patient_id in pairs:
+        if patient_id is not None:
+            deltas[(user_id, patient_id)] = deltas.get((user_id, patient_id), 0) + 1
+    if not deltas:
+        return
+
+    by_count: Dict[int, list] = {}
+    for pair, count in deltas.items():
+        by_count.setdefault(count, []).append(pair)
+    for count, group in by_count.items():
+        db.query(PatientAccess).filter(
+            tuple_(PatientAccess.user_id, PatientAccess.patient_id).in_(group)
+        ).update({"study_count": PatientAccess.study_count - count}, synchronize_session=False)
+
+    affected = tuple_(PatientAccess.user_id, PatientAccess.patient_id).in_(list(deltas))
+    db.query(PatientAccess).filter(affected, PatientAccess.study_count <= 0).delete(synchronize_session=False)
+
+    latest = select(func.max(Analysis.timestamp)).where(
+        Analysis.user_id == PatientAccess.user_id,
+        Analysis.patient_id == PatientAccess.patient_id
+    ).scalar_subquery()
+    db.query(PatientAccess).filter(affected).update({"last_study_at": latest}, synchronize_session=False)
+
+def recompute(db: Session) -> None:
+    """
+    Rebuild the index from the analyses table with one aggregate pass. Part
+    of the caller's transaction.
+    """
+    db.query(PatientAccess).delete(synchronize_session=False)
+    rows = select(
+        Analysis.user_id, Analysis.patient_id, func.count(Analysis.id), func.max(Analysis.timestamp)
+    ).where(Analysis.patient_id.isnot(None)).group_by(Analysis.user_id, Analysis.patient_id)
+    db.execute(PatientAccess.__table__.insert().from_select(
+        ["user_id", "patient_id", "study_count", "last_study_at"], rows
+    ))
@@ -0,0 +1,194 @@
+"""
+Token-bucket rate limiting of login attempts, per account and per client IP.
+
+Every attempt takes a token from both buckets before the password is
+checked; buckets refill continuously up to their burst size. The buckets
+live in a backend: in memory (per process) or in a SQLite file shared by
+the processes of one host, like the job broker.
+"""
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import closing
+from typing import Optional, Tuple
+
+from app.config import settings
+
+class RateLimitBackend:
+    """
+    Storage of token buckets. take() refills a bucket for the time elapsed
+    since it was last used, then takes one token if there is one.
+    """
+
+    def take(self, key: str, capacity: float, rate: float, now: float) -> float:
+        """
+        Take a token from a bucket.
+
+        Args:
+            key: Bucket key
+            capacity: Burst size, the tokens of a new bucket
+            rate: Tokens added per second
+            now: Current time in seconds
+
+        Returns:
+            float: 0 if a token was taken, otherwise seconds until one is available
+        """
+        raise NotImplementedError
+
+    def reset(self) -> None:
+        """Drop every bucket"""
+        raise NotImplementedError
+
+def _refill(tokens: float, updated: float, capacity: float, rate: float, now: float) -> float:
+    return min(capacity, tokens + max(now - updated, 0) * rate)
+
+def _wait(tokens: float, rate: float) -> float:
+    # A bucket that never refills is retried after a day
+    return (1 - tokens) / rate if rate > 0 else 24 * 3600.0
+
+class InMemoryBackend(RateLimitBackend):
+    """
+    Buckets of this process, at most maxsize of them; the least recently
+    used are dropped first, which only ever forgives attempts.
+    """
+
+    def __init__(self, maxsize: int = 100_000):
+        self.maxsize = maxsize
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate, now):
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = _refill(tokens, updated, capacity, rate, now)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+
+            return 0.0 if allowed else _wait(tokens, rate)
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+
+class SQLiteBackend(RateLimitBackend):
+    """
+    Buckets stored in a SQLite file, so every process of a host shares them.
+    Each take() is one immediate transaction.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "key TEXT PRIMARY KEY, "
+                "tokens REAL NOT NULL, "
+                "updated REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def take(self, key, capacity, rate, now):
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+                tokens = _refill(*(row or (capacity, now)), capacity, rate, now)
+                allowed = tokens >= 1
+                if allowed:
+                    tokens -= 1
+                conn.execute(
+                    "INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                    (key, tokens, now)
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+        return 0.0 if allowed else _wait(tokens, rate)
+
+    def reset(self):
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM buckets")
+
+def create_rate_limit_backend(url: str) -> RateLimitBackend:
+    """
+    Create a rate limit backend from a URL.
+
+    Args:
+        url: "memory" for buckets of this process or "sqlite:///path/to/ratelimit.db"
+
+    Returns:
+        RateLimitBackend: Backend instance
+    """
+    if url == "memory":
+        return InMemoryBackend()
+    if url.startswith("sqlite:///"):
+        return SQLiteBackend(url[len("sqlite:///"):])
+    raise ValueError(f"Unsupported rate limit URL: {url}")
+
+class LoginRateLimiter:
+    """
+    Limits login attempts per account (burst account_burst, refilled at
+    account_per_minute) and per client IP (ip_burst, ip_per_minute).
+    """
+
+    def __init__(
+        self,
+        backend: RateLimitBackend,
+        account_burst: float,
+        account_per_minute: float,
+        ip_burst: float,
+        ip_per_minute: float,
+        clock=time.time
+    ):
+        self.backend = backend
+        self.account = (account_burst, account_per_minute / 60)
+        self.ip = (ip_burst, ip_per_minute / 60)
+        self.clock = clock
+
+    def check(self, account: str, ip: Optional[str]) -> float:
+        """
+        Count one login attempt.
+
+        Returns:
+            float: 0 if the attempt may go ahead, otherwise seconds to wait
+        """
+        now = self.clock()
+        # The IP bucket is charged first, so guessing at many accounts from
+        # one address does not lock those accounts out for their owners
+        if ip:
+            wait = self.backend.take(f"ip:{ip}", *self.ip, now)
+            if wait:
+                return wait
+        return self.backend.take(f"account:{account.lower()}", *self.account, now)
+
+    def reset(self) -> None:
+        """Forget every attempt"""
+        self.backend.reset()
+
+_login_limiter: Optional[LoginRateLimiter] = None
+
+def get_login_limiter() -> LoginRateLimiter:
+    """
+    Get the process-wide login rate limiter, creating it on first use.
+    """
+    global _login_limiter
+    if _login_limiter is None:
+        _login_limiter = LoginRateLimiter(
+            create_rate_limit_backend(settings.LOGIN_RATE_LIMIT_URL),
+            settings.LOGIN_ACCOUNT_BURST,
+            settings.LOGIN_ACCOUNT_PER_MINUTE,
+            settings.LOGIN_IP_BURST,
+            settings.LOGIN_IP_PER_MINUTE
+        )
+    return _login_limiter
@@ -0,0 +1,116 @@
+"""
+Refresh tokens, which renew access tokens without checking the password.
+
+A refresh token is a random string; only its SHA-256 is stored, so renewal
+is one lookup on a unique index. Every token is used once: renewing with it
+marks it used and hands out the next token of its family (the tokens
+descending from one login). A token presented again after it was used has
+been copied, so its whole family is revoked and that session has to log in
+again.
+"""
+import uuid
+import hashlib
+import secrets
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import RefreshToken, User
+
+class InvalidRefreshToken(Exception):
+    """The refresh token is unknown, expired, revoked or was used before"""
+
+def _digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def issue(db: Session, user: User, family_id: Optional[str] = None) -> str:
+    """
+    Create a refresh token for a user, starting a new family unless one is
+    given. Part of the caller's transaction.
+
+    Returns:
+        str: The token, which is not stored anywhere
+    """
+    token = secrets.token_urlsafe(32)
+    db.add(RefreshToken(
+        token_hash=_digest(token),
+        family_id=family_id or uuid.uuid4().hex,
+        user_id=user.id,
+        token_version=user.token_version or 0,
+        expires_at=datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
+    ))
+    return token
+
+def revoke_family(db: Session, family_id: str) -> int:
+    """
+    Revoke every token of a family. Part of the caller's transaction.
+
+    Returns:
+        int: Number of tokens revoked
+    """
+    return db.query(RefreshToken).filter(
+        RefreshToken.family_id == family_id,
+        RefreshToken.revoked_at.is_(None)
+    ).update({"revoked_at": datetime.utcnow()}, synchronize_session=False)
+
+def rotate(db: Session, token: str) -> Tuple[User, str]:
+    """
+    Use a refresh token: mark it used and issue the next one of its family.
+    Commits, also when the token is rejected, so a detected reuse stays
+    revoked.
+
+    Raises:
+        InvalidRefreshToken: If the token cannot be used
+
+    Returns:
+        Tuple[User, str]: The user and their new refresh token
+    """
+    now = datetime.utcnow()
+    row = db.query(RefreshToken).filter(RefreshToken.token_hash == _digest(token)).first()
+    if row is None or row.revoked_at is not None or row.expires_at <= now:
+        raise InvalidRefreshToken("Invalid or expired refresh token")
+
+    # Claimed with a conditional update, so of two concurrent uses one wins
+    claimed = db.query(RefreshToken).filter(
+        RefreshToken.id == row.id,
+        RefreshToken.used_at.is_(None)
+    ).update({"used_at": now}, synchronize_session=False)
+
+    user = db.get(User, row.user_id)
+    if not claimed or user is None or not user.is_active or (user.token_version or 0) != row.token_version:
+        revoke_family(db, row.family_id)
+        db.commit()
+        if not claimed:
+            raise InvalidRefreshToken("Refresh token reused, the session was revoked")
+        raise InvalidRefreshToken("Refresh token revoked")
+
+    new_token = issue(db, user, row.family_id)
+    db.commit()
+    return user, new_token
+
+def revoke(db: Session, token: str) -> bool:
+    """
+    Revoke the family of a refresh token, on logout. Part of the caller's
+    transaction.
+
+    Returns:
+        bool: Whether the token was known
+    """
+    row = db.query(RefreshToken.family_id).filter(RefreshToken.token_hash == _digest(token)).first()
+    if row is None:
+        return False
+    revoke_family(db, row.family_id)
+    return True
+
+def delete_expired(db: Session) -> int:
+    """
+    Delete expired tokens. Part of the caller's transaction.
+
+    Returns:
+        int: Number of tokens deleted
+    """
+    return db.query(RefreshToken).filter(
+        RefreshToken.expires_at <= datetime.utcnow()
+    ).delete(synchronize_session=False)
@@ -0,0 +1,219 @@
+"""
+Cached JSON responses with strong ETags.
+
+Rendered response bodies are kept in two tiers: a bounded in-process LRU
+(TTLCache) in front of an optional shared tier, a SQLite file standing in
+for a shared cache such as Redis, so every worker of a host reuses what one
+of them rendered. Hits skip rendering and the result files.
+
+Entries of an analysis are keyed by its id and row version (updated_at),
+read from the database on every request: a changed analysis gets a new key
+and a deleted one is not found, in every worker, and the old entries age
+out after the TTL.
+"""
+import json
+import time
+import sqlite3
+import hashlib
+from contextlib import closing
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from fastapi import Request, Response, status
+from pydantic import TypeAdapter
+
+from app.cache import TTLCache
+from app.config import settings
+from app.file_io import run_blocking
+
+def etag_for(body: bytes) -> str:
+    """Strong ETag of a response body"""
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+def render_json(adapter: TypeAdapter, content: Any) -> bytes:
+    """Validate content against a response model and render it, like FastAPI does"""
+    return adapter.dump_json(adapter.validate_python(content))
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    # Weak comparison, as required for If-None-Match
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return etag in [candidate[2:] if candidate.startswith("W/") else candidate for candidate in candidates]
+
+def json_response(
+    request: Request,
+    body: bytes,
+    etag: Optional[str] = None,
+    headers: Optional[Dict[str, str]] = None
+) -> Response:
+    """
+    Response with a rendered JSON body and its ETag, or 304 Not Modified if
+    the client's copy has that ETag. Clients revalidate on every use, since
+    the body depends on who is asking.
+    """
+    etag = etag or etag_for(body)
+    headers = dict(headers or {})
+    headers.update({"ETag": etag, "Cache-Control": "private, no-cache"})
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+class SharedCacheBackend:
+    """
+    Cache shared between processes; values are JSON-serializable dicts.
+    get() returns a value with the seconds it has left to live.
+    """
+
+    def get(self, key: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Dict[str, Any], ttl: float) -> None:
+        raise NotImplementedError
+
+    def delete_many(self, keys: Iterable[str]) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+class SQLiteCacheBackend(SharedCacheBackend):
+    """
+    Shared cache stored in a SQLite file, for the processes of one host.
+    Stand-in for an external cache (Redis, memcached).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, "
+                "value TEXT NOT NULL, "
+                "expires REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def get(self, key):
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT value, expires FROM entries WHERE key = ?", (key,)).fetchone()
+        left = row[1] - time.time() if row is not None else 0
+        if left <= 0:
+            return None
+        return json.loads(row[0]), left
+
+    def set(self, key, value, ttl):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, expires) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time() + ttl)
+            )
+            # Expired entries are dropped as new ones come in
+            conn.execute("DELETE FROM entries WHERE expires < ?", (time.time(),))
+
+    def delete_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return
+        with closing(self._connect()) as conn:
+            conn.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key in keys])
+
+    def clear(self):
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM entries")
+
+def create_shared_cache(url: Optional[str]) -> Optional[SharedCacheBackend]:
+    """
+    Create the shared cache tier from a URL.
+
+    Args:
+        url: "" for none or "sqlite:///path/to/cache.db"
+
+    Returns:
+        Optional[SharedCacheBackend]: Backend instance, None without a shared tier
+    """
+    if not url:
+        return None
+    if url.startswith("sqlite:///"):
+        return SQLiteCacheBackend(url[len("sqlite:///"):])
+    raise ValueError(f"Unsupported response cache URL: {url}")
+
+class ResponseCache:
+    """
+    Rendered responses by key: an in-process LRU tier in front of an
+    optional shared tier. Values are dicts holding a rendered "body" (str)
+    and its "etag", plus whatever the caller needs to authorize a hit.
+    """
+
+    def __init__(self, local: TTLCache, shared: Optional[SharedCacheBackend] = None):
+        self.local = local
+        self.shared = shared
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            entry = self.shared.get(key)
+            if entry is not None:
+                # Kept locally no longer than in the shared tier, so a copy
+                # is never older than the TTL
+                value, left = entry
+                self.local.set(key, value, ttl=min(left, self.local.ttl))
+        return value
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        self.local.set(key, value)
+        if self.shared is not None:
+            self.shared.set(key, value, self.local.ttl)
+
+    async def get_async(self, key: str) -> Optional[Dict[str, Any]]:
+        """get() for async handlers; the shared tier is read off the event loop"""
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            value = await run_blocking(self.get, key)
+        return value
+
+    async def set_async(self, key: str, value: Dict[str, Any]) -> None:
+        """set() for async handlers; the shared tier is written off the event loop"""
+        if self.shared is None:
+            self.local.set(key, value)
+        else:
+            await run_blocking(self.set, key, value)
+
+    def invalidate(self, keys: Iterable[str]) -> None:
+        keys = list(keys)
+        for key in keys:
+            self.local.invalidate(key)
+        if self.shared is not None:
+            self.shared.delete_many(keys)
+
+    def clear(self) -> None:
+        self.local.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.local.stats(), "shared": self.shared is not None}
+
+_response_cache: Optional[ResponseCache] = None
+
+def get_response_cache() -> ResponseCache:
+    """
+    Get the process-wide response cache, creating it on first use.
+    """
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache(
+            TTLCache(maxsize=settings.RESPONSE_CACHE_SIZE, ttl=settings.RESPONSE_CACHE_TTL_SECONDS),
+            create_shared_cache(settings.RESPONSE_CACHE_URL)
+        )
+    return _response_cache
+
+def analysis_key(analysis_id: str, version: Optional[datetime]) -> str:
+    """Cache key of the detail response of an analysis at a row version (updated_at)"""
+    return f"analysis:{analysis_id}:{version.isoformat() if version else 0}"
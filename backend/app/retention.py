@@ -0,0 +1,252 @@
+"""
+Deleting analyses in bulk and removing their files in the background.
+
+Rows are deleted with set-based statements, a batch per transaction with a
+pause in between so long purges leave room for other writers. The files of
+deleted analyses are not removed inline: their keys are queued in
+pending_file_deletions, in the same transaction as the delete, and the
+FileCleaner thread removes them in throttled batches.
+"""
+import time
+import logging
+import threading
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app import database, counters, blobs
+from app.config import settings
+from app.models import Analysis, ImageBlob, PendingFileDeletion
+from app.storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+def analysis_file_keys(analysis_id: str, result_path: Optional[str]) -> List[str]:
+    """Storage keys of the files owned by one analysis, apart from shared blobs"""
+    keys = [f"{settings.IMAGES_DIR}/{analysis_id}/"]
+    if result_path:
+        keys.append(result_path)
+    return keys
+
+def enqueue_file_deletions(db: Session, keys: Iterable[str]) -> None:
+    """
+    Queue stored objects (or prefixes ending in "/") for the file cleaner.
+    The queue entries are part of the caller's transaction.
+    """
+    rows = [{"key": key} for key in keys]
+    if rows:
+        db.bulk_insert_mappings(PendingFileDeletion, rows)
+
+def delete_rows(db: Session, analyses: List) -> int:
+    """
+    Delete analyses with one DELETE statement, uncount them, release their
+    blobs and queue their files. Part of the caller's transaction.
+
+    Args:
+        db: Database session
+        analyses: Analysis objects or rows with id, user_id, patient_id,
+            status, result_path, ap_image_hash and lat_image_hash
+
+    Returns:
+        int: Number of analyses deleted
+    """
+    if not analyses:
+        return 0
+
+    ids = [analysis.id for analysis in analyses]
+    deleted = db.query(Analysis).filter(Analysis.id.in_(ids)).delete(synchronize_session=False)
+    counters.record_deleted_rows(db, [(a.user_id, a.patient_id, a.status) for a in analyses])
+    orphaned = blobs.release(db, [digest for a in analyses for digest in (a.ap_image_hash, a.lat_image_hash)])
+
+    keys = [key for a in analyses for key in analysis_file_keys(a.id, a.result_path)]
+    enqueue_file_deletions(db, keys + orphaned)
+    return deleted
+
+def purge_analyses(
+    db: Session,
+    older_than: Optional[datetime] = None,
+    patient_id: Optional[str] = None,
+    user_id: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    pause: Optional[float] = None
+) -> int:
+    """
+    Delete every analysis matching all of the given criteria, batch_size
+    rows per transaction with pause seconds between transactions.
+
+    Args:
+        db: Database session
+        older_than: Delete analyses created before this (UTC) time
+        patient_id: Delete the analyses of this patient
+        user_id: Delete the analyses of this user
+        batch_size: Rows per transaction, defaults to settings.PURGE_BATCH_SIZE
+        pause: Seconds between transactions, defaults to settings.PURGE_PAUSE_SECONDS
+
+    Raises:
+        ValueError: If no criterion is given
+
+    Returns:
+        int: Number of analyses deleted
+    """
+    criteria = []
+    if older_than is not None:
+        criteria.append(Analysis.timestamp < older_than)
+    if patient_id is not None:
+        criteria.append(Analysis.patient_id == patient_id)
+    if user_id is not None:
+        criteria.append(Analysis.user_id == user_id)
+    if not criteria:
+        raise ValueError("Refusing to purge without criteria")
+
+    batch_size = batch_size or settings.PURGE_BATCH_SIZE
+    pause = settings.PURGE_PAUSE_SECONDS if pause is None else pause
+
+    deleted = 0
+    while True:
+        # Deleted rows drop out of the filter, so every batch starts over
+        rows = db.query(
+            Analysis.id, Analysis.user_id, Analysis.patient_id, Analysis.status,
+            Analysis.result_path, Analysis.ap_image_hash, Analysis.lat_image_hash
+        ).filter(*criteria).limit(batch_size).all()
+        if not rows:
+            break
+
+        try:
+            deleted += delete_rows(db, rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        logger.info(f"Purged {deleted} analyses")
+        if len(rows) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+
+    return deleted
+
+def _lock_blobs(db: Session) -> None:
+    # Hold back new references to blobs until the transaction ends. SQLite
+    # has one writer at a time, which this transaction already is
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text(f"LOCK TABLE {ImageBlob.__tablename__} IN SHARE MODE"))
+
+class FileCleaner:
+    """
+    Removes queued files of deleted analyses in a background thread, at most
+    batch_size per batch with pause seconds between batches, polling every
+    interval seconds while the queue is empty.
+
+    Blobs referenced again since they were queued (an identical image was
+    uploaded in the meantime) are kept. Every deletion of a blob object goes
+    through this queue, so that check covers racing uploads.
+    """
+
+    def __init__(
+        self,
+        batch_size: Optional[int] = None,
+        pause: Optional[float] = None,
+        interval: Optional[float] = None
+    ):
+        self.batch_size = batch_size or settings.FILE_CLEANUP_BATCH_SIZE
+        self.pause = settings.FILE_CLEANUP_PAUSE_SECONDS if pause is None else pause
+        self.interval = settings.FILE_CLEANUP_INTERVAL_SECONDS if interval is None else interval
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    def run_once(self) -> int:
+        """
+        Remove one batch of queued files.
+
+        Returns:
+            int: Number of queue entries handled
+        """
+        db = database.SessionLocal()
+        try:
+            entries = db.query(PendingFileDeletion.id, PendingFileDeletion.key).order_by(
+                PendingFileDeletion.id
+            ).limit(self.batch_size).all()
+            if not entries:
+                return 0
+
+            # Take the entries off the queue first, which opens the write
+            # transaction: an upload referencing one of these blobs commits
+            # either before the in-use check below, or after the objects are
+            # gone, and then stores its file again (see blobs.store_file)
+            db.query(PendingFileDeletion).filter(
+                PendingFileDeletion.id.in_([entry.id for entry in entries])
+            ).delete(synchronize_session=False)
+            _lock_blobs(db)
+
+            keys = {entry.key for entry in entries}
+            in_use = {path for path, in db.query(ImageBlob.path).filter(ImageBlob.path.in_(keys))}
+            objects = sorted(key for key in keys - in_use if not key.endswith("/"))
+            prefixes = sorted(key for key in keys if key.endswith("/"))
+
+            storage = get_storage()
+            try:
+                storage.delete_many(objects)
+                for prefix in prefixes:
+                    storage.delete_prefix(prefix)
+            except Exception as e:
+                # Left queued and retried with the next batch
+                db.rollback()
+                logger.error(f"Could not delete files of deleted analyses: {str(e)}")
+                return 0
+
+            db.commit()
+            return len(entries)
+        finally:
+            db.close()
+
+    def drain(self) -> int:
+        """
+        Remove every queued file synchronously, without pausing.
+
+        Returns:
+            int: Number of queue entries handled
+        """
+        handled = 0
+        while True:
+            count = self.run_once()
+            if not count:
+                return handled
+            handled += count
+
+    def start(self) -> None:
+        """Start the cleaner thread"""
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._loop, name="file-cleaner", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the cleaner thread after its current batch"""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _loop(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                count = self.run_once()
+            except Exception as e:
+                logger.error(f"File cleaner failed: {str(e)}")
+                count = 0
+            self._stopping.wait(self.pause if count >= self.batch_size else self.interval)
+
+_file_cleaner: Optional[FileCleaner] = None
+
+def get_file_cleaner() -> FileCleaner:
+    """
+    Get the process-wide file cleaner, creating it on first use.
+    """
+    global _file_cleaner
+    if _file_cleaner is None:
+        _file_cleaner = FileCleaner()
+    return _file_cleaner
@@ -1,35 +1,115 @@
 import os
-from typing import Optional
-from fastapi import APIRouter, Depends, File, Form, UploadFile, HTTPException, status
+import json
+from typing import Dict, List, Optional
+from fastapi import APIRouter, Depends, File, Form, Request, UploadFile, HTTPException, status
+from pydantic import TypeAdapter
 from sqlalchemy.orm import Session
 import logging
 
-from app.database import get_db
-from app.models import Analysis, UserRole, User
-from app.schemas import AnalysisResponse, AnalysisDetail
+from app.database import DbRunner, get_db, get_db_runner
+from app.models import Analysis, AnalysisStatus, UserRole, User
+from app.schemas import (
+    AnalysisResponse,
+    AnalysisDetail,
+    AnalysisStatusOut,
+    BatchStudy,
+    BatchAnalysisResponse,
+    BulkDeleteResponse
+)
 from app.utils import (
-    save_uploaded_file,
     generate_analysis_id,
-    generate_mock_analysis,
     save_analysis_result,
     load_analysis_result,
+    summarize_analysis_result,
     cleanup_analysis_files
 )
+from app.file_io import run_blocking
+from app.images import derivative_url, original_url
+from app.inference import cache as inference_cache
+from app.jobs import get_job_runner
 from app.config import settings
 from app import auth_utils  # Import the auth utilities
+from app import counters, blobs, retention
+from app.dicom import DicomHeader, study_patient, study_values, index_patient
+from app.response_cache import (
+    analysis_key,
+    etag_for,
+    get_response_cache,
+    json_response,
+    render_json
+)
 
 # Create router
 router = APIRouter()
 
+# Analyses whose results are not available yet
+PENDING_STATUSES = (AnalysisStatus.QUEUED.value, AnalysisStatus.RUNNING.value)
+
 # Setup basic logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def _add_analysis(
+    db: Session,
+    uploads: Dict[str, blobs.Upload],
+    headers: Dict[str, DicomHeader],
+    **columns
+) -> Dict[str, str]:
+    # Reference the stored blobs and add the analysis row; returns the blob keys by view
+    paths = {view: blobs.add_reference(db, upload) for view, upload in uploads.items()}
+    for header in headers.values():
+        index_patient(db, header)
+
+    db_analysis = Analysis(**{
+        "ap_image_path": paths.get("ap"),
+        "lat_image_path": paths.get("lat"),
+        "has_ap": "ap" in paths,
+        "has_lat": "lat" in paths,
+        **columns
+    })
+    db.add(db_analysis)
+    counters.record_created(db, db_analysis)
+    return paths
+
+def _record_analysis(
+    db: Session,
+    uploads: Dict[str, blobs.Upload],
+    headers: Dict[str, DicomHeader],
+    **columns
+) -> Dict[str, str]:
+    # Commit one analysis; returns the blob keys by view
+    paths = _add_analysis(db, uploads, headers, **columns)
+    db.commit()
+    return paths
+
+def _record_batch(db: Session, studies: List[tuple]) -> List[Dict[str, str]]:
+    # Commit the analyses of (uploads, headers, columns) studies in one transaction
+    paths = [_add_analysis(db, uploads, headers, **columns) for uploads, headers, columns in studies]
+    db.commit()
+    return paths
+
+def _undo_analyses(db: Session, analysis_ids: List[str]) -> None:
+    # Roll back, and delete the analyses that were committed; their orphaned blobs go to the file cleaner
+    db.rollback()
+    created = db.query(Analysis).filter(Analysis.id.in_(analysis_ids)).all() if analysis_ids else []
+    for analysis in created:
+        db.delete(analysis)
+        # The patient index looks up the latest remaining study
+        db.flush()
+        counters.record_deleted(db, analysis)
+        retention.enqueue_file_deletions(db, blobs.release(db, [analysis.ap_image_hash, analysis.lat_image_hash]))
+    db.commit()
+
+def _remove_staged(uploads: List[blobs.Upload]) -> None:
+    for upload in uploads:
+        if os.path.exists(upload.tmp_path):
+            os.remove(upload.tmp_path)
+
 @router.post("/analyses", response_model=AnalysisResponse, status_code=status.HTTP_201_CREATED)
 async def create_analysis(
     ap_image: Optional[UploadFile] = File(None),
     lat_image: Optional[UploadFile] = File(None),
-    patient_id: str = Form(...),
+    patient_id: Optional[str] = Form(None),
     notes: Optional[str] = Form(None),
     db: Session = Depends(get_db),
     current_user: User = Depends(auth_utils.get_current_user)  # Add authentication
@@ -37,7 +117,17 @@ async def create_analysis(
     """
     Create a new X-ray analysis.
     
-    At least one image (AP or lateral view) must be provided.
+    At least one image (AP or lateral view) must be provided, as JPEG, PNG,
+    TIFF or DICOM within the upload size limits; other uploads are rejected
+    with 413, 415 or 422 before they reach the blob store; unsupported and
+    oversized files are rejected while the request body arrives. For DICOM
+    uploads the patient_id defaults to the PatientID of the header, and the
+    study date, modality and pixel spacing are recorded from it.
+    
+    The analysis is queued and runs in the background; poll
+    GET /analyses/{analysis_id}/status until it is "done" or "failed".
+    Images analysed before by the same model version are not analysed again
+    and the analysis is "done" right away.
     """
     # Validate input
     if not ap_image and not lat_image:
@@ -48,72 +138,357 @@ async def create_analysis(
     
     # Generate analysis ID
     analysis_id = generate_analysis_id()
-    logger.info(f"Creating analysis {analysis_id} for patient {patient_id} by user {current_user.username}")
-    
-    # Create directories for this analysis
-    analysis_dir = os.path.join(settings.IMAGES_DIR, analysis_id)
-    os.makedirs(analysis_dir, exist_ok=True)
     
-    # Initialize paths
-    ap_path = None
-    lat_path = None
+    # Queries run on the database thread pool, off the event loop
+    run = DbRunner(db)
+    uploads = {}
     
     try:
-        # Save uploaded files if they exist
+        # Stream uploaded files into the blob store, hashing and validating them on the way
         if ap_image:
-            ap_path = os.path.join(analysis_dir, "ap.jpg")
-            await save_uploaded_file(ap_image, ap_path)
+            uploads["ap"] = await blobs.receive_upload(ap_image, "ap_image")
         
         if lat_image:
-            lat_path = os.path.join(analysis_dir, "lat.jpg")
-            await save_uploaded_file(lat_image, lat_path)
+            uploads["lat"] = await blobs.receive_upload(lat_image, "lat_image")
         
-        # Generate analysis results (mock or real)
-        if settings.USE_MOCK:
-            analysis_result = generate_mock_analysis(ap_path, lat_path)
-        else:
-            # Here you would call your real analysis function
-            # For now, just use mock data
-            analysis_result = generate_mock_analysis(ap_path, lat_path)
+        # Headers of DICOM uploads, read without their pixel data
+        headers = {view: upload.info.dicom for view, upload in uploads.items() if upload.info.dicom}
+        patient_id = study_patient(patient_id, headers)
+        logger.info(f"Creating analysis {analysis_id} for patient {patient_id} by user {current_user.username}")
+        
+        ap_hash = uploads["ap"].sha256 if "ap" in uploads else None
+        lat_hash = uploads["lat"].sha256 if "lat" in uploads else None
         
-        # Save results to file
-        result_path = save_analysis_result(analysis_id, analysis_result)
+        values = {"status": AnalysisStatus.QUEUED.value}
+        values.update(study_values(headers))
         
-        # Save to database with user_id
-        db_analysis = Analysis(
+        study_key = inference_cache.study_key(ap_hash, lat_hash)
+        cached = await run(inference_cache.lookup, study_key) if settings.INFERENCE_CACHE else None
+        if cached is not None:
+            logger.info(f"Reusing cached result of study {study_key} for analysis {analysis_id}")
+            values.update(summarize_analysis_result(cached))
+            values["status"] = AnalysisStatus.DONE.value
+            values["result_path"] = await save_analysis_result(analysis_id, cached)
+        
+        # Save to database with user_id; otherwise results are filled in by the job runner
+        paths = await run(
+            _record_analysis,
+            uploads,
+            headers,
             id=analysis_id,
             patient_id=patient_id,
-            ap_image_path=ap_path,
-            lat_image_path=lat_path,
-            result_path=result_path,
+            ap_image_hash=ap_hash,
+            lat_image_hash=lat_hash,
             notes=notes,
-            user_id=current_user.id  # Associate with current user
+            user_id=current_user.id,  # Associate with current user
+            **values
         )
-        db.add(db_analysis)
-        db.commit()
         
-        return {"analysis_id": analysis_id}
+        # Repeat uploads of the same file share one stored blob, stored once
+        # the reference has committed
+        for upload in uploads.values():
+            await run_blocking(blobs.store_file, upload)
+        
+        # Hand the analysis (mock or real) to the background workers
+        if cached is None:
+            get_job_runner().submit(analysis_id, paths.get("ap"), paths.get("lat"), study_key)
+        
+        return {"analysis_id": analysis_id, "status": values["status"]}
     
     except Exception as e:
         # Clean up on error
-        cleanup_analysis_files(analysis_id)
+        await run(_undo_analyses, [analysis_id])
+        await run_blocking(_remove_staged, list(uploads.values()))
+        await run_blocking(cleanup_analysis_files, analysis_id)
+        if isinstance(e, HTTPException):
+            # Rejected upload
+            raise
         logger.error(f"Error in create_analysis: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error processing analysis: {str(e)}"
         )
 
+def _parse_manifest(manifest: str) -> List[BatchStudy]:
+    try:
+        items = json.loads(manifest)
+        if not isinstance(items, list):
+            raise ValueError("expected a list of studies")
+        studies = [BatchStudy(**item) for item in items]
+    except (ValueError, TypeError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Invalid manifest: {str(e)}"
+        )
+
+    if not studies:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="The manifest lists no studies"
+        )
+    if len(studies) > settings.MAX_BATCH_STUDIES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"A batch may hold at most {settings.MAX_BATCH_STUDIES} studies"
+        )
+    return studies
+
+def _study_uploads(study: BatchStudy, uploads: Dict[str, blobs.Upload], rejected: Dict[str, str]) -> Dict[str, blobs.Upload]:
+    # The received uploads of a study by view; raises for studies that cannot be created
+    names = {view: name for view, name in (("ap", study.ap), ("lat", study.lat)) if name}
+    if not names:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="At least one X-ray image (AP or lateral) is required"
+        )
+
+    for name in names.values():
+        if name in rejected:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=rejected[name])
+        if name not in uploads:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"No file named {name} was uploaded"
+            )
+    return {view: uploads[name] for view, name in names.items()}
+
+@router.post("/analyses/batch", response_model=BatchAnalysisResponse, status_code=status.HTTP_201_CREATED)
+async def create_analysis_batch(
+    manifest: str = Form(...),
+    files: List[UploadFile] = File(...),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(auth_utils.get_current_user)
+):
+    """
+    Create the analyses of many studies in one request.
+
+    manifest is a JSON list of studies, each with patient_id, notes and the
+    file names of its ap and/or lat image among the uploaded files, e.g.
+    [{"patient_id": "P1", "ap": "p1-ap.dcm", "lat": "p1-lat.dcm"}]. A file
+    may be used by several studies. Images are validated and stored as in
+    POST /analyses; studies that cannot be created are reported as
+    "rejected" with an error without affecting the others. Accepted studies
+    are recorded in one transaction and queued together, so the workers run
+    them in shared inference batches.
+
+    Returns one item per manifest entry, in order, with its analysis_id and
+    status ("queued", "done" when cached, or "rejected").
+    """
+    studies = _parse_manifest(manifest)
+
+    files_by_name = {}
+    for file in files:
+        if file.filename in files_by_name:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"More than one file is named {file.filename}"
+            )
+        files_by_name[file.filename] = file
+
+    logger.info(f"Creating a batch of {len(studies)} analyses by user {current_user.username}")
+
+    # Queries run on the database thread pool, off the event loop
+    run = DbRunner(db)
+    uploads, rejected = {}, {}
+    items, records, analysis_ids = [], [], []
+
+    try:
+        # Stream the files the manifest uses into staging, validating each one
+        used = {name for study in studies for name in (study.ap, study.lat) if name}
+        for name, file in files_by_name.items():
+            if name not in used:
+                continue
+            try:
+                uploads[name] = await blobs.receive_upload(file, name)
+            except HTTPException as e:
+                rejected[name] = e.detail
+
+        for index, study in enumerate(studies):
+            try:
+                study_uploads = _study_uploads(study, uploads, rejected)
+                headers = {view: upload.info.dicom for view, upload in study_uploads.items() if upload.info.dicom}
+                patient_id = study_patient(study.patient_id, headers)
+            except HTTPException as e:
+                items.append({"index": index, "patient_id": study.patient_id, "status": "rejected", "error": e.detail})
+                continue
+
+            ap_hash = study_uploads["ap"].sha256 if "ap" in study_uploads else None
+            lat_hash = study_uploads["lat"].sha256 if "lat" in study_uploads else None
+
+            analysis_id = generate_analysis_id()
+            analysis_ids.append(analysis_id)
+            values = {"status": AnalysisStatus.QUEUED.value}
+            values.update(study_values(headers))
+
+            study_key = inference_cache.study_key(ap_hash, lat_hash)
+            cached = await run(inference_cache.lookup, study_key) if settings.INFERENCE_CACHE else None
+            if cached is not None:
+                values.update(summarize_analysis_result(cached))
+                values["status"] = AnalysisStatus.DONE.value
+                values["result_path"] = await save_analysis_result(analysis_id, cached)
+
+            columns = dict(
+                id=analysis_id,
+                patient_id=patient_id,
+                ap_image_hash=ap_hash,
+                lat_image_hash=lat_hash,
+                notes=study.notes,
+                user_id=current_user.id,
+                **values
+            )
+            records.append((study_uploads, headers, columns, study_key if cached is None else None))
+            items.append({"index": index, "patient_id": patient_id, "analysis_id": analysis_id, "status": values["status"]})
+
+        paths = await run(_record_batch, [record[:3] for record in records])
+
+        # Each file is stored once however many studies use it, once the
+        # references have committed
+        stored = set()
+        for study_uploads, _, _, _ in records:
+            for upload in study_uploads.values():
+                if upload.tmp_path not in stored:
+                    await run_blocking(blobs.store_file, upload)
+                    stored.add(upload.tmp_path)
+
+        jobs = [
+            {
+                "analysis_id": columns["id"],
+                "ap_path": study_paths.get("ap"),
+                "lat_path": study_paths.get("lat"),
+                "study_key": study_key
+            }
+            for (_, _, columns, study_key), study_paths in zip(records, paths)
+            if study_key is not None
+        ]
+        if jobs:
+            get_job_runner().submit_many(jobs)
+
+    except Exception as e:
+        # Clean up on error, including analyses committed before queueing
+        # failed, so that the client can submit the batch again
+        await run(_undo_analyses, analysis_ids)
+        await run_blocking(_remove_staged, list(uploads.values()))
+        for analysis_id in analysis_ids:
+            await run_blocking(cleanup_analysis_files, analysis_id)
+        logger.error(f"Error in create_analysis_batch: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error processing analysis batch: {str(e)}"
+        )
+
+    # Files no accepted study uses
+    try:
+        await run_blocking(_remove_staged, list(uploads.values()))
+    except OSError as e:
+        logger.warning(f"Could not remove staged uploads of a batch: {str(e)}")
+
+    return {"items": items}
+
+@router.delete("/analyses", response_model=BulkDeleteResponse)
+async def delete_analyses(
+    patient_id: Optional[str] = None,
+    user_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(auth_utils.is_admin_or_superuser)  # Only admin/superuser
+):
+    """
+    Delete all analyses of a patient and/or user (admin/superuser only).
+
+    Rows are deleted in throttled batches and their files are removed in the
+    background afterwards.
+    """
+    if patient_id is None and user_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="patient_id or user_id is required"
+        )
+
+    try:
+        deleted = await run_blocking(retention.purge_analyses, db, patient_id=patient_id, user_id=user_id)
+        logger.info(f"Deleted {deleted} analyses (patient {patient_id}, user {user_id}) by user {current_user.username}")
+        return {"deleted": deleted}
+    
+    except Exception as e:
+        logger.error(f"Error in delete_analyses: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error deleting analyses: {str(e)}"
+        )
+
+@router.get("/analyses/stats", status_code=status.HTTP_200_OK)
+async def get_analysis_stats(
+    run: DbRunner = Depends(get_db_runner),
+    current_user: User = Depends(auth_utils.is_admin_or_superuser)  # Only admin/superuser
+):
+    """
+    Get statistics on analyses (admin/superuser only).
+
+    Served from the counters maintained on create, delete and job status
+    changes, so the cost does not grow with the number of analyses. Run
+    `python -m app.maintenance recompute-stats` to rebuild them.
+    """
+    try:
+        return await run(counters.read_stats)
+    
+    except Exception as e:
+        logger.error(f"Error in get_analysis_stats: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error getting analysis statistics: {str(e)}"
+        )
+
+@router.get("/analyses/{analysis_id}/status", response_model=AnalysisStatusOut)
+def get_analysis_status(
+    analysis_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(auth_utils.get_current_user)
+):
+    """
+    Get the processing status of an analysis. A plain function, so it runs
+    on the threadpool and its query never blocks the event loop.
+    """
+    analysis = auth_utils.can_access_analysis(analysis_id, db, current_user)
+
+    return {"analysis_id": analysis.id, "status": analysis.status, "error": analysis.error}
+
+def _can_view(current_user: User, owner_id: int) -> bool:
+    # Admins and superusers see every analysis, others their own
+    return current_user.role in [UserRole.ADMIN, UserRole.SUPERUSER] or owner_id == current_user.id
+
+_detail_json = TypeAdapter(AnalysisDetail)
+
 @router.get("/analyses/{analysis_id}", response_model=AnalysisDetail)
 async def get_analysis(
     analysis_id: str, 
-    db: Session = Depends(get_db),
+    request: Request,
+    run: DbRunner = Depends(get_db_runner),
     current_user: User = Depends(auth_utils.get_current_user)  # Add authentication
 ):
     """
     Get detailed analysis results by ID.
+    
+    Responses carry a strong ETag; send it back in If-None-Match to get 304
+    Not Modified while the analysis is unchanged. Finished analyses are
+    served from the response cache, keyed by their row version, so a hit
+    only reads that version from the database.
     """
+    def load_version(db: Session):
+        return db.query(Analysis.user_id, Analysis.updated_at).filter(Analysis.id == analysis_id).first()
+    
+    def load(db: Session):
+        return db.query(Analysis).filter(Analysis.id == analysis_id).first()
+    
+    # Queries run off the event loop
+    version = await run(load_version)
+    
+    cache = get_response_cache()
+    key = analysis_key(analysis_id, version.updated_at) if version else None
+    cached = await cache.get_async(key) if key else None
+    if cached is not None and _can_view(current_user, cached["user_id"]):
+        return json_response(request, cached["body"].encode(), cached["etag"])
+    
     # Get analysis from database
-    analysis = db.query(Analysis).filter(Analysis.id == analysis_id).first()
+    analysis = await run(load) if version else None
     
     if not analysis:
         raise HTTPException(
@@ -122,18 +497,34 @@ async def get_analysis(
         )
     
     # Check if user has permission to access this analysis
-    if current_user.role not in [UserRole.ADMIN, UserRole.SUPERUSER] and analysis.user_id != current_user.id:
+    if not _can_view(current_user, analysis.user_id):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You don't have permission to access this analysis"
         )
     
     try:
-        # Load analysis results
-        analysis_result = load_analysis_result(analysis.result_path)
+        # Use the denormalized result columns; only older rows need the result file
+        if analysis.status in PENDING_STATUSES:
+            analysis_result = {
+                "measurements": [],
+                "summary": f"Analysis {analysis.status}"
+            }
+        elif analysis.status == AnalysisStatus.FAILED.value:
+            analysis_result = {
+                "measurements": [],
+                "summary": f"Analysis failed: {analysis.error}"
+            }
+        elif analysis.summary is not None:
+            analysis_result = {
+                "measurements": analysis.measurements or [],
+                "summary": analysis.summary
+            }
+        else:
+            analysis_result = await load_analysis_result(analysis.result_path)
 
-        ap_image_url = f"/static/images/{analysis_id}/ap.jpg" if analysis.ap_image_path else None
-        lat_image_url = f"/static/images/{analysis_id}/lat.jpg" if analysis.lat_image_path else None
+        ap_image_url = original_url(analysis.id, "ap") if analysis.ap_image_path else None
+        lat_image_url = original_url(analysis.id, "lat") if analysis.lat_image_path else None
         
         result = {
             "id": analysis.id,
@@ -141,16 +532,31 @@ async def get_analysis(
             "timestamp": analysis.timestamp,
             "ap_image_url": ap_image_url,
             "lat_image_url": lat_image_url,
+            "ap_thumbnail_url": derivative_url(analysis_id, "ap", "thumb") if analysis.ap_image_path else None,
+            "lat_thumbnail_url": derivative_url(analysis_id, "lat", "thumb") if analysis.lat_image_path else None,
+            "ap_preview_url": derivative_url(analysis_id, "ap", "preview") if analysis.ap_image_path else None,
+            "lat_preview_url": derivative_url(analysis_id, "lat", "preview") if analysis.lat_image_path else None,
             "has_ap": analysis.ap_image_path is not None,
             "has_lat": analysis.lat_image_path is not None,
             "notes": analysis.notes,
+            "study_date": analysis.study_date,
+            "modality": analysis.modality,
             "status": analysis.status,
+            "error": analysis.error,
             "measurements": analysis_result.get("measurements", []),
             "summary": analysis_result.get("summary", "No summary available"),
             "user_id": analysis.user_id  # Include user_id in response
         }
         
-        return result
+        body = render_json(_detail_json, result)
+        etag = etag_for(body)
+        
+        # Finished analyses rarely change; the key moves on when they do
+        if analysis.status not in PENDING_STATUSES:
+            key = analysis_key(analysis_id, analysis.updated_at)
+            await cache.set_async(key, {"body": body.decode(), "etag": etag, "user_id": analysis.user_id})
+        
+        return json_response(request, body, etag)
     
     except Exception as e:
         logger.error(f"Error in get_analysis: {str(e)}")
@@ -160,13 +566,14 @@ async def get_analysis(
         )
 
 @router.delete("/analyses/{analysis_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_analysis(
+def delete_analysis(
     analysis_id: str, 
     db: Session = Depends(get_db),
     current_user: User = Depends(auth_utils.get_current_user)  # Add authentication
 ):
     """
-    Delete an analysis and associated files.
+    Delete an analysis. Its files are removed shortly after, in the background.
+    Runs on the threadpool, like get_analysis_status.
     """
     analysis = db.query(Analysis).filter(Analysis.id == analysis_id).first()
     
@@ -184,69 +591,16 @@ async def delete_analysis(
         )
     
     try:
-        db.delete(analysis)
+        # Files are removed in the background by the file cleaner
+        retention.delete_rows(db, [analysis])
         db.commit()
-
-        cleanup_analysis_files(analysis_id)
         
         return None
     
     except Exception as e:
+        db.rollback()
         logger.error(f"Error in delete_analysis: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error deleting analysis: {str(e)}"
         )
-
-@router.get("/analyses/stats", status_code=status.HTTP_200_OK)
-async def get_analysis_stats(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(auth_utils.is_admin_or_superuser)  # Only admin/superuser
-):
-    """
-    Get statistics on analyses (admin/superuser only).
-    """
-    try:
-        # Total analyses count
-        total_analyses = db.query(Analysis).count()
-        
-        # Analyses by user
-        user_analyses = db.query(
-            User.username, 
-            db.func.count(Analysis.id)
-        ).join(
-            Analysis, 
-            User.id == Analysis.user_id
-        ).group_by(
-            User.username
-        ).all()
-        
-        # Analyses by patient
-        patient_analyses = db.query(
-            Analysis.patient_id,
-            db.func.count(Analysis.id)
-        ).group_by(
-            Analysis.patient_id
-        ).all()
-        
-        # Analyses by status
-        status_analyses = db.query(
-            Analysis.status,
-            db.func.count(Analysis.id)
-        ).group_by(
-            Analysis.status
-        ).all()
-        
-        return {
-            "total_analyses": total_analyses,
-            "by_user": {username: count for username, count in user_analyses},
-            "by_patient": {patient_id: count for patient_id, count in patient_analyses},
-            "by_status": {status: count for status, count in status_analyses}
-        }
-    
-    except Exception as e:
-        logger.error(f"Error in get_analysis_stats: {str(e)}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error getting analysis statistics: {str(e)}"
-        )
\ No newline at end of file
@@ -1,21 +1,24 @@
 # routers/auth.py
-from fastapi import APIRouter, Depends, status, HTTPException
+import math
+from fastapi import APIRouter, Depends, Query, Request, Response, status, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security.oauth2 import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
-from app.database import get_db
+from app.database import DbRunner, get_db
 from app import schemas, models
 from app.models import UserRole
-from app import auth_utils
+from app import auth_utils, refresh_tokens
+from app.pagination import paginate, set_page_headers
+from app.ratelimit import get_login_limiter
 
 router = APIRouter(
     prefix="/auth",
     tags=['Authentication']
 )
 
-@router.post("/register", response_model=schemas.UserOut)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+def _check_new_user(db: Session, user: schemas.UserCreate) -> None:
     # Check if email exists
     existing_user = db.query(models.User).filter(models.User.email == user.email).first()
     if existing_user:
@@ -27,9 +30,21 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     if existing_username:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, 
                             detail="Username already taken")
+
+def _add_user(db: Session, new_user: models.User) -> models.User:
+    db.add(new_user)
+    db.commit()
+    db.refresh(new_user)
+    return new_user
+
+@router.post("/register", response_model=schemas.UserOut)
+async def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+    # Queries run on the database thread pool, off the event loop
+    run = DbRunner(db)
+    await run(_check_new_user, user)
     
     # Hash the password
-    hashed_password = auth_utils.hash_password(user.password)
+    hashed_password = await auth_utils.hash_password_async(user.password)
     
     # Create the user (default role is NORMAL)
     new_user = models.User(
@@ -39,26 +54,51 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
         role=UserRole.NORMAL
     )
     
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-    
-    return new_user
+    return await run(_add_user, new_user)
 
-@router.post("/login", response_model=schemas.Token)
-def login(user_credentials: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+def _find_login_user(db: Session, username: str) -> Optional[models.User]:
     # OAuth2PasswordRequestForm returns username field (can be email or username)
     # Find user by either email or username
-    user = db.query(models.User).filter(
-        (models.User.email == user_credentials.username) | 
-        (models.User.username == user_credentials.username)
+    return db.query(models.User).filter(
+        (models.User.email == username) | 
+        (models.User.username == username)
     ).first()
+
+def _start_session(db: Session, user: models.User, new_hash: Optional[str]) -> str:
+    # Move the stored hash to the configured bcrypt cost
+    if new_hash is not None:
+        user.password = new_hash
+    
+    # A refresh token starting a new session
+    refresh_token = refresh_tokens.issue(db, user)
+    db.commit()
+    return refresh_token
+
+@router.post("/login", response_model=schemas.Token)
+async def login(
+    request: Request,
+    user_credentials: OAuth2PasswordRequestForm = Depends(),
+    db: Session = Depends(get_db)
+):
+    # Attempts over the per-account or per-IP budget never reach bcrypt; the
+    # limiter may be backed by SQLite, so it is checked off the event loop
+    client_ip = request.client.host if request.client else None
+    wait = await run_in_threadpool(get_login_limiter().check, user_credentials.username, client_ip)
+    if wait:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                            detail="Too many login attempts, try again later",
+                            headers={"Retry-After": str(math.ceil(wait))})
+    
+    # Queries run on the database thread pool, off the event loop
+    run = DbRunner(db)
+    user = await run(_find_login_user, user_credentials.username)
     
     if not user:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, 
                             detail="Invalid credentials")
     
-    if not auth_utils.verify_password(user_credentials.password, user.password):
+    valid, new_hash = await auth_utils.verify_password_async(user_credentials.password, user.password)
+    if not valid:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, 
                             detail="Invalid credentials")
     
@@ -67,14 +107,49 @@ def login(user_credentials: OAuth2PasswordRequestForm = Depends(), db: Session =
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
                            detail="Account is disabled")
     
-    # Create a token
-    access_token = auth_utils.create_access_token(data={"user_id": user.id})
+    # Create a token, and a refresh token starting a new session
+    access_token = auth_utils.create_access_token(data=auth_utils.token_claims(user))
+    refresh_token = await run(_start_session, user, new_hash)
+    
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+@router.post("/refresh", response_model=schemas.Token)
+def refresh(request: schemas.RefreshRequest, db: Session = Depends(get_db)):
+    # Renew the access token with a refresh token, which is replaced by a new one
+    try:
+        user, refresh_token = refresh_tokens.rotate(db, request.refresh_token)
+    except refresh_tokens.InvalidRefreshToken as e:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                            detail=str(e),
+                            headers={"WWW-Authenticate": "Bearer"})
+    
+    access_token = auth_utils.create_access_token(data=auth_utils.token_claims(user))
     
-    return {"access_token": access_token, "token_type": "bearer"}
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+def logout(request: schemas.RefreshRequest, db: Session = Depends(get_db)):
+    # End the session of a refresh token; its access token expires on its own
+    refresh_tokens.revoke(db, request.refresh_token)
+    db.commit()
+    
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 @router.get("/me", response_model=schemas.UserOut)
-def get_current_user(current_user: models.User = Depends(auth_utils.get_current_user)):
-    return current_user
+def get_current_user(
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth_utils.get_current_user)
+):
+    # The token only names the user, the profile comes from the database
+    user = db.query(models.User).filter(models.User.id == current_user.id).first()
+    
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"User with id {current_user.id} not found"
+        )
+    
+    return user
 
 # Admin-only endpoint to update user roles
 @router.patch("/users/{user_id}/role", response_model=schemas.UserOut)
@@ -85,8 +160,35 @@ def update_user_role(
     current_user: models.User = Depends(auth_utils.is_admin)  # Using the is_admin dependency
 ):
     # Get user to update
-    user_query = db.query(models.User).filter(models.User.id == user_id)
-    user = user_query.first()
+    user = db.query(models.User).filter(models.User.id == user_id).first()
+    
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"User with id {user_id} not found"
+        )
+    
+    # Update user role; tokens carry the old role, so they are revoked
+    if user.role != role_update.role:
+        user.role = models.UserRole(role_update.role.value)
+        auth_utils.revoke_tokens(user)
+    db.commit()
+    db.refresh(user)
+    
+    # Drop the cached role so the change applies to the next request
+    auth_utils.invalidate_user(user_id)
+    
+    return user
+
+# Admin-only endpoint to update user details or (de)activate an account
+@router.patch("/users/{user_id}", response_model=schemas.UserOut)
+def update_user(
+    user_id: int,
+    user_update: schemas.UserUpdate,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth_utils.is_admin)
+):
+    user = db.query(models.User).filter(models.User.id == user_id).first()
     
     if not user:
         raise HTTPException(
@@ -94,20 +196,55 @@ def update_user_role(
             detail=f"User with id {user_id} not found"
         )
     
-    # Update user role
-    user_query.update({"role": role_update.role}, synchronize_session=False)
+    changes = user_update.dict(exclude_unset=True)
+    
+    if "email" in changes and db.query(models.User).filter(
+        models.User.email == changes["email"], models.User.id != user_id
+    ).first():
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, 
+                            detail="Email already registered")
+    
+    if "username" in changes and db.query(models.User).filter(
+        models.User.username == changes["username"], models.User.id != user_id
+    ).first():
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, 
+                            detail="Username already taken")
+    
+    # Tokens carry the username; a reactivated user signs in again
+    if any(field in changes and changes[field] != getattr(user, field) for field in ("username", "is_active")):
+        auth_utils.revoke_tokens(user)
+    
+    for field, value in changes.items():
+        setattr(user, field, value)
+    
     db.commit()
     db.refresh(user)
     
+    # Deactivation must take effect on the next request
+    auth_utils.invalidate_user(user_id)
+    
     return user
 
-# Admin/Superuser endpoint to get all users
+# Admin-only endpoint to inspect the authenticated user cache
+@router.get("/user-cache")
+def get_user_cache_stats(current_user: models.User = Depends(auth_utils.is_admin)):
+    return auth_utils.user_cache.stats()
+
+# Admin/Superuser endpoint to get all users, paginated by cursor on id
 @router.get("/users", response_model=List[schemas.UserOut])
 def get_users(
+    response: Response,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth_utils.is_admin_or_superuser),  # Using combined role check
-    skip: int = 0,
-    limit: int = 100
+    cursor: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor or X-Prev-Cursor header"),
+    include_total: bool = False,
+    skip: int = Query(0, ge=0, deprecated=True),
+    limit: int = Query(100, ge=1, le=1000)
 ):
-    users = db.query(models.User).offset(skip).limit(limit).all()
-    return users
\ No newline at end of file
+    query = db.query(models.User)
+    total_count = query.count() if include_total else None
+    
+    page = paginate(query, (models.User.id,), limit, cursor, descending=False, offset=skip)
+    set_page_headers(response, page, total_count)
+    
+    return page.items
\ No newline at end of file
@@ -1,15 +1,19 @@
 from typing import List, Optional
 from datetime import datetime, date
-from fastapi import APIRouter, Depends, Query, HTTPException, status
+from fastapi import APIRouter, Depends, Query, HTTPException, Request, Response, status
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
 import logging
 
-from app.database import get_db
-from app.models import Analysis, UserRole, User
+from app.database import DbRunner, get_db_runner
+from app.models import Analysis, PatientAccess, UserRole, User
 from app.schemas import AnalysisSummary
-from app.utils import load_analysis_result
+from app.images import derivative_url, original_url
+from app.pagination import paginate, set_page_headers
+from app.response_cache import json_response, render_json
 from app import auth_utils  # Import the auth utilities
+from app import export
 
 # Create router
 router = APIRouter()
@@ -18,81 +22,113 @@ router = APIRouter()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def _analysis_summary(analysis: Analysis) -> dict:
+    """
+    Build an AnalysisSummary payload from the denormalized columns of a row.
+    """
+    image_urls = {
+        "ap_image_url": original_url(analysis.id, "ap") if analysis.ap_image_path else None,
+        "lat_image_url": original_url(analysis.id, "lat") if analysis.lat_image_path else None
+    }
+
+    # Small derivative of the AP view, or of the lateral view for LAT-only studies
+    if analysis.ap_image_path:
+        thumbnail_url = derivative_url(analysis.id, "ap", "thumb")
+    elif analysis.lat_image_path:
+        thumbnail_url = derivative_url(analysis.id, "lat", "thumb")
+    else:
+        thumbnail_url = None
+
+    return {
+        "id": analysis.id,
+        "patient_id": analysis.patient_id,
+        "timestamp": analysis.timestamp,
+        "image_urls": image_urls,
+        "thumbnail_url": thumbnail_url,
+        "summary": analysis.summary or "No summary available",
+        "status": analysis.status,
+        "user_id": analysis.user_id
+    }
+
+_summaries_json = TypeAdapter(List[AnalysisSummary])
+
+# Sort key of every analysis listing, matched by the composite indexes on analyses
+HISTORY_ORDER = (Analysis.timestamp, Analysis.id)
+
+def build_history_query(
+    db: Session,
+    current_user: User,
+    patient_id: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None
+):
+    """
+    Build the filtered (unordered) analysis query behind the history listings.
+    """
+    # Start query
+    query = db.query(Analysis)
+    
+    # Apply role-based filtering
+    # Admin and superusers can see all analyses
+    if current_user.role not in [UserRole.ADMIN, UserRole.SUPERUSER]:
+        # Normal users can only see their own analyses
+        query = query.filter(Analysis.user_id == current_user.id)
+    
+    # Apply additional filters
+    if patient_id:
+        query = query.filter(Analysis.patient_id == patient_id)
+    
+    if start_date:
+        query = query.filter(Analysis.timestamp >= start_date)
+    
+    if end_date:
+        query = query.filter(Analysis.timestamp <= end_date)
+    
+    return query
+
 @router.get("/history", response_model=List[AnalysisSummary])
 async def get_analysis_history(
+    request: Request,
+    response: Response,
     patient_id: Optional[str] = Query(None, description="Filter by patient ID"),
     start_date: Optional[date] = Query(None, description="Filter by start date"),
     end_date: Optional[date] = Query(None, description="Filter by end date"),
-    skip: int = Query(0, ge=0, description="Number of records to skip"),
+    cursor: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor or X-Prev-Cursor header"),
+    include_total: bool = Query(False, description="Count all matching records into X-Total-Count"),
+    skip: int = Query(0, ge=0, description="Number of records to skip (deprecated, use cursor)", deprecated=True),
     limit: int = Query(20, ge=1, le=100, description="Number of records to return"),
-    db: Session = Depends(get_db),
+    run: DbRunner = Depends(get_db_runner),
     current_user: User = Depends(auth_utils.get_current_user)  # Add authentication
 ):
     """
     Get analysis history with optional filtering.
+    
+    Results are ordered newest first and paginated by cursor: pass the value
+    of the X-Next-Cursor (or X-Prev-Cursor) response header as `cursor` to
+    fetch the following (or preceding) page. Pages carry a strong ETag and
+    are answered with 304 Not Modified when unchanged.
     """
-    try:
-        # Start query
-        query = db.query(Analysis)
-        
-        # Apply role-based filtering
-        # Admin and superusers can see all analyses
-        if current_user.role not in [UserRole.ADMIN, UserRole.SUPERUSER]:
-            # Normal users can only see their own analyses
-            query = query.filter(Analysis.user_id == current_user.id)
-        
-        # Apply additional filters
-        if patient_id:
-            query = query.filter(Analysis.patient_id == patient_id)
-        
-        if start_date:
-            query = query.filter(Analysis.timestamp >= start_date)
+    def load(db: Session):
+        query = build_history_query(db, current_user, patient_id, start_date, end_date)
         
-        if end_date:
-            query = query.filter(Analysis.timestamp <= end_date)
+        # Get total count only when asked, it scans every matching row
+        total_count = query.count() if include_total else None
         
-        # Get total count (for pagination info if needed)
-        total_count = query.count()
+        # Apply keyset pagination on (timestamp, id)
+        page = paginate(query, HISTORY_ORDER, limit, cursor, offset=skip)
         
-        # Apply pagination and ordering
-        analyses = query.order_by(desc(Analysis.timestamp)).offset(skip).limit(limit).all()
-        
-        # Prepare results
-        results = []
-        for analysis in analyses:
-            try:
-                analysis_result = load_analysis_result(analysis.result_path)
-                summary = analysis_result.get("summary", "No summary available")
-                
-                image_urls = {
-                    "ap_image_url": f"/static/images/{analysis.id}/ap.jpg" if analysis.ap_image_path else None,
-                    "lat_image_url": f"/static/images/{analysis.id}/lat.jpg" if analysis.lat_image_path else None
-                }
-
-                results.append({
-                    "id": analysis.id,
-                    "patient_id": analysis.patient_id,
-                    "timestamp": analysis.timestamp,
-                    "image_urls": image_urls,
-                    "summary": summary,
-                    "status": analysis.status,
-                    "user_id": analysis.user_id
-                })
-            except Exception as e:
-                logger.error(f"Error processing analysis {analysis.id}: {str(e)}")
-
-                results.append({
-                    "id": analysis.id,
-                    "patient_id": analysis.patient_id,
-                    "timestamp": analysis.timestamp,
-                    "image_urls": None,
-                    "summary": "Error retrieving summary",
-                    "status": analysis.status,
-                    "user_id": analysis.user_id
-                })
+        # Prepare results from the row itself, no result files are opened
+        return page, total_count, [_analysis_summary(analysis) for analysis in page.items]
+    
+    try:
+        # Queries run off the event loop
+        page, total_count, results = await run(load)
+        set_page_headers(response, page, total_count)
         
-        return results
+        return json_response(request, render_json(_summaries_json, results), headers=response.headers)
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in get_analysis_history: {str(e)}")
         raise HTTPException(
@@ -100,66 +136,71 @@ async def get_analysis_history(
             detail=f"Error retrieving history: {str(e)}"
         )
 
+@router.get("/history/export")
+async def export_analysis_history(
+    format: str = Query("csv", description="csv, ndjson or parquet"),
+    patient_id: Optional[str] = Query(None, description="Filter by patient ID"),
+    start_date: Optional[date] = Query(None, description="Filter by start date"),
+    end_date: Optional[date] = Query(None, description="Filter by end date"),
+    user_id: Optional[int] = Query(None, description="Filter by user (admins and superusers)"),
+    current_user: User = Depends(auth_utils.get_current_user)  # Add authentication
+):
+    """
+    Export the analyses and measurements matching the /history filters, oldest
+    first, as one streamed CSV, NDJSON or Parquet file.
+    """
+    # Normal users can only export their own analyses
+    if current_user.role not in [UserRole.ADMIN, UserRole.SUPERUSER]:
+        if user_id is not None and user_id != current_user.id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not authorized to export analyses of other users"
+            )
+        user_id = current_user.id
+    
+    try:
+        export.check_format(format)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail=str(e))
+    
+    # Rows are read and written batch by batch while the response streams
+    chunks = export.stream_export(
+        format, user_id=user_id, patient_id=patient_id, start_date=start_date, end_date=end_date
+    )
+    filename = f"analyses-{datetime.utcnow():%Y%m%d-%H%M%S}.{format}"
+    
+    return StreamingResponse(
+        chunks,
+        media_type=export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 @router.get("/patients/{patient_id}/history", response_model=List[AnalysisSummary])
 async def get_patient_history(
     patient_id: str,
+    request: Request,
     limit: int = Query(100, ge=1, le=1000, description="Maximum number of records to return"),
-    db: Session = Depends(get_db),
+    run: DbRunner = Depends(get_db_runner),
     current_user: User = Depends(auth_utils.get_current_user)  # Add authentication
 ):
     """
-    Get all analysis records for a specific patient.
+    Get all analysis records for a specific patient, with a strong ETag.
     """
-    try:
-        # Start query for this patient
-        query = db.query(Analysis).filter(Analysis.patient_id == patient_id)
-        
-        # Apply role-based filtering
-        if current_user.role not in [UserRole.ADMIN, UserRole.SUPERUSER]:
-            # Normal users can only see their own analyses
-            query = query.filter(Analysis.user_id == current_user.id)
+    def load(db: Session):
+        query = build_history_query(db, current_user, patient_id=patient_id)
         
         # Get analyses with ordering and limit
-        analyses = query.order_by(desc(Analysis.timestamp)).limit(limit).all()
+        analyses = query.order_by(*[column.desc() for column in HISTORY_ORDER]).limit(limit).all()
         
         # Process results (reuse logic from previous endpoint)
-        results = []
-        for analysis in analyses:
-            try:
-                # Load analysis result for summary
-                analysis_result = load_analysis_result(analysis.result_path)
-                summary = analysis_result.get("summary", "No summary available")
-                
-                # Determine thumbnail URL
-                if analysis.ap_image_path:
-                    thumbnail_url = f"/static/images/{analysis.id}/ap.jpg"
-                elif analysis.lat_image_path:
-                    thumbnail_url = f"/static/images/{analysis.id}/lat.jpg"
-                else:
-                    thumbnail_url = None
-                
-                # Add to results
-                results.append({
-                    "id": analysis.id,
-                    "patient_id": analysis.patient_id,
-                    "timestamp": analysis.timestamp,
-                    "thumbnail_url": thumbnail_url,
-                    "summary": summary,
-                    "status": analysis.status
-                })
-            except Exception as e:
-                logger.error(f"Error processing analysis {analysis.id}: {str(e)}")
-                # Still include the analysis in results but with minimal info
-                results.append({
-                    "id": analysis.id,
-                    "patient_id": analysis.patient_id,
-                    "timestamp": analysis.timestamp,
-                    "thumbnail_url": None,
-                    "summary": "Error retrieving summary",
-                    "status": analysis.status
-                })
+        return [_analysis_summary(analysis) for analysis in analyses]
+    
+    try:
+        results = await run(load)
         
-        return results
+        return json_response(request, render_json(_summaries_json, results))
     
     except Exception as e:
         logger.error(f"Error in get_patient_history: {str(e)}")
@@ -168,29 +209,58 @@ async def get_patient_history(
             detail=f"Error retrieving patient history: {str(e)}"
         )
 
-# Add this new endpoint to get all patients accessible to the user
+# Sort key of the patient picker, the primary key of the patient index
+PATIENT_ORDER = (PatientAccess.patient_id,)
+
+def build_patient_query(db: Session, current_user: User, prefix: Optional[str] = None):
+    """
+    Build the (unordered) patient index query behind the patient picker.
+    """
+    # Start query
+    query = db.query(PatientAccess.patient_id)
+    
+    # Apply role-based filtering
+    if current_user.role not in [UserRole.ADMIN, UserRole.SUPERUSER]:
+        # Normal users can only see their own patients
+        query = query.filter(PatientAccess.user_id == current_user.id)
+    else:
+        # A patient may have analyses by several users
+        query = query.distinct()
+    
+    # Prefix search as a range, so it seeks the index
+    if prefix:
+        query = query.filter(PatientAccess.patient_id >= prefix, PatientAccess.patient_id < prefix + "\uffff")
+    
+    return query
+
 @router.get("/patients", response_model=List[str])
 async def get_accessible_patients(
-    db: Session = Depends(get_db),
+    response: Response,
+    q: Optional[str] = Query(None, description="Only patient IDs starting with this"),
+    cursor: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor or X-Prev-Cursor header"),
+    limit: Optional[int] = Query(None, ge=1, le=500, description="Number of patient IDs to return, all by default"),
+    run: DbRunner = Depends(get_db_runner),
     current_user: User = Depends(auth_utils.get_current_user)
 ):
     """
-    Get all patient IDs accessible to the current user.
+    Get the IDs of the patients accessible to the current user.
+    
+    Served from the patient index in patient ID order, optionally narrowed to
+    a prefix. Every patient is returned unless a limit is given; pages are
+    then continued by cursor like /history.
     """
+    def load(db: Session):
+        query = build_patient_query(db, current_user, q)
+        return paginate(query, PATIENT_ORDER, limit, cursor, descending=False)
+    
     try:
-        # Start query
-        query = db.query(Analysis.patient_id).distinct()
-        
-        # Apply role-based filtering
-        if current_user.role not in [UserRole.ADMIN, UserRole.SUPERUSER]:
-            # Normal users can only see their own patients
-            query = query.filter(Analysis.user_id == current_user.id)
-        
-        # Get unique patient IDs
-        patient_ids = [row[0] for row in query.all()]
+        page = await run(load)
+        set_page_headers(response, page)
         
-        return patient_ids
+        return [row.patient_id for row in page.items]
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in get_accessible_patients: {str(e)}")
         raise HTTPException(
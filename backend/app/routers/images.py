@@ -0,0 +1,147 @@
+from typing import Optional, Tuple
+from email.utils import formatdate
+from fastapi import APIRouter, Depends, Request, Response, HTTPException, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+import logging
+
+from app.database import DbRunner, get_db_runner
+from app.models import Analysis, ImageBlob
+from app.images import get_derivative, webp_supported, MEDIA_TYPES, VIEWS, ORIGINAL
+from app.storage import get_storage
+from app.file_io import run_blocking
+from app.response_cache import etag_matches
+from app.config import settings
+
+# Create router
+router = APIRouter()
+
+# Setup basic logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def _parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single "bytes=" range against an object size.
+
+    Returns None to serve the whole object: no header, a malformed one, or
+    several ranges (which servers may answer in full).
+
+    Raises:
+        HTTPException: 416 if the range lies outside the object
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+
+    start, _, end = header[len("bytes="):].strip().partition("-")
+    try:
+        if start:
+            first = int(start)
+            last = min(int(end), size - 1) if end else size - 1
+        else:
+            # Suffix range: the last N bytes
+            first = max(size - int(end), 0)
+            last = size - 1
+    except ValueError:
+        return None
+
+    if first > last or first >= size:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+
+    return first, last
+
+async def _serve(request: Request, key: str, media_type: str, negotiated: bool) -> Response:
+    storage = get_storage()
+    info = await run_blocking(storage.stat, key)
+
+    etag = f'"{info.etag}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(info.last_modified, usegmt=True),
+        "Cache-Control": f"public, max-age={settings.IMAGE_CACHE_MAX_AGE}, immutable",
+        "Accept-Ranges": "bytes"
+    }
+    if negotiated:
+        headers["Vary"] = "Accept"
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    byte_range = _parse_range(request.headers.get("range"), info.size)
+    if_range = request.headers.get("if-range")
+    if byte_range and if_range and if_range != etag:
+        # The client's partial copy is stale, send everything
+        byte_range = None
+
+    start, end = byte_range or (0, info.size - 1)
+    headers["Content-Length"] = str(end - start + 1)
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{info.size}"
+
+    return StreamingResponse(
+        storage.iter_range(key, start, end),
+        status_code=status.HTTP_206_PARTIAL_CONTENT if byte_range else status.HTTP_200_OK,
+        media_type=media_type,
+        headers=headers
+    )
+
+@router.get("/images/{analysis_id}/{view}/{size}")
+async def get_image(
+    analysis_id: str,
+    view: str,
+    size: str,
+    request: Request,
+    run: DbRunner = Depends(get_db_runner)
+):
+    """
+    Get an uploaded X-ray ("original") or a downscaled copy ("thumb" or "preview").
+
+    Copies are served as WebP to clients that accept it, JPEG otherwise, and
+    rendered on first request. Responses carry an ETag and long-lived cache
+    headers and honour If-None-Match and Range. Like the former /static URLs,
+    these are used directly in <img> tags and are not authenticated.
+    """
+    # Uploads live in the shared blob store; the row says which blob to serve
+    source, source_format = None, None
+    if view in VIEWS:
+        path_column = Analysis.ap_image_path if view == "ap" else Analysis.lat_image_path
+        hash_column = Analysis.ap_image_hash if view == "ap" else Analysis.lat_image_hash
+
+        def load(db: Session):
+            return db.query(path_column, ImageBlob.format).outerjoin(
+                ImageBlob, ImageBlob.sha256 == hash_column
+            ).filter(Analysis.id == analysis_id).first()
+
+        # Queries run off the event loop
+        row = await run(load)
+        if row is not None:
+            source, source_format = row
+
+    try:
+        if size == ORIGINAL:
+            if source is None:
+                raise FileNotFoundError(f"{analysis_id}/{view}")
+            media_type = MEDIA_TYPES[(source_format or "JPEG").lower()]
+            return await _serve(request, source, media_type, negotiated=False)
+
+        fmt = "webp" if webp_supported() and "image/webp" in request.headers.get("accept", "") else "jpeg"
+        key = await run_blocking(get_derivative, analysis_id, view, size, fmt, source)
+        return await _serve(request, key, MEDIA_TYPES[fmt], negotiated=True)
+
+    except HTTPException:
+        raise
+    except (ValueError, FileNotFoundError):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Image {view}/{size} of analysis {analysis_id} not found"
+        )
+    except OSError as e:
+        logger.error(f"Error rendering image for analysis {analysis_id}: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Uploaded {view} image of analysis {analysis_id} could not be decoded"
+        )
@@ -0,0 +1,27 @@
+from fastapi import APIRouter, Depends
+import logging
+
+from app.database import pool_stats
+from app.models import User
+from app import auth_utils
+
+# Create router
+router = APIRouter()
+
+# Setup basic logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+@router.get("/system/db-pool")
+async def get_db_pool_stats(
+    current_user: User = Depends(auth_utils.is_admin_or_superuser)  # Only admin/superuser
+):
+    """
+    Get connection pool metrics of this process (admin/superuser only).
+
+    Per engine ("sync", and "async" with DATABASE_ASYNC): pool size,
+    connections checked out, in overflow and idle, and the number of
+    checkouts and timeouts with the time spent waiting for a connection.
+    Engines without a connection pool report null.
+    """
+    return pool_stats()
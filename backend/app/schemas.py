@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr
 from typing import List, Optional, Dict, Any
-from datetime import datetime
+from datetime import date, datetime
 from enum import Enum
 
 # Define enum for role validation in Pydantic models
@@ -42,9 +42,17 @@ class UserRoleUpdate(BaseModel):
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 class TokenData(BaseModel):
     id: Optional[int] = None
+    # Claims of stateless tokens, absent from tokens issued by older versions
+    username: Optional[str] = None
+    role: Optional[UserRole] = None
+    version: Optional[int] = None
 
 # Analysis schemas
 class AnalysisBase(BaseModel):
@@ -56,6 +64,32 @@ class AnalysisCreate(AnalysisBase):
 
 class AnalysisResponse(BaseModel):
     analysis_id: str
+    status: str
+
+class BatchStudy(BaseModel):
+    """One study of a batch submission; ap and lat name uploaded files"""
+    patient_id: Optional[str] = None
+    ap: Optional[str] = None
+    lat: Optional[str] = None
+    notes: Optional[str] = None
+
+class BatchItemResult(BaseModel):
+    index: int
+    patient_id: Optional[str] = None
+    analysis_id: Optional[str] = None
+    status: str
+    error: Optional[str] = None
+
+class BatchAnalysisResponse(BaseModel):
+    items: List[BatchItemResult]
+
+class BulkDeleteResponse(BaseModel):
+    deleted: int
+
+class AnalysisStatusOut(BaseModel):
+    analysis_id: str
+    status: str
+    error: Optional[str] = None
 
 class Point(BaseModel):
     x: int
@@ -73,12 +107,19 @@ class AnalysisDetail(BaseModel):
     timestamp: datetime
     ap_image_url: Optional[str] = None
     lat_image_url: Optional[str] = None
+    ap_thumbnail_url: Optional[str] = None
+    lat_thumbnail_url: Optional[str] = None
+    ap_preview_url: Optional[str] = None
+    lat_preview_url: Optional[str] = None
     has_ap: bool
     has_lat: bool
     measurements: List[Measurement]
     summary: str
     status: str
+    error: Optional[str] = None
     notes: Optional[str] = None
+    study_date: Optional[date] = None
+    modality: Optional[str] = None
     user_id: int
     
     class Config:
@@ -89,6 +130,7 @@ class AnalysisSummary(BaseModel):
     patient_id: str
     timestamp: datetime
     image_urls: Optional[Dict] = None
+    thumbnail_url: Optional[str] = None
     summary: str
     status: str
     user_id: int
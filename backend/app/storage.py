@@ -0,0 +1,308 @@
+import os
+import json
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
+from urllib.parse import urlparse, parse_qs
+
+from app.config import settings
+
+class ObjectInfo(NamedTuple):
+    """Metadata of a stored object"""
+    size: int
+    etag: str  # Opaque, without quotes
+    last_modified: float  # Unix timestamp
+
+class Storage:
+    """
+    Base class for the stores holding uploaded images, derivatives and
+    result files.
+
+    Objects are addressed by "/"-separated keys such as
+    "static/results/{analysis_id}.json". Missing objects raise
+    FileNotFoundError, like files do.
+    """
+
+    def put_file(self, key: str, path: str, move: bool = False) -> None:
+        """Store a local file under key; with move, the local file is consumed"""
+        raise NotImplementedError
+
+    def write_bytes(self, key: str, data: bytes) -> None:
+        """Store data under key, replacing any previous object atomically"""
+        raise NotImplementedError
+
+    def read_bytes(self, key: str) -> bytes:
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def stat(self, key: str) -> ObjectInfo:
+        raise NotImplementedError
+
+    def iter_range(self, key: str, start: int, end: int, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        """Yield bytes start to end (inclusive) of an object"""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        """Delete an object; deleting a missing object is not an error"""
+        raise NotImplementedError
+
+    def delete_prefix(self, prefix: str) -> int:
+        """Delete every object below a prefix ending in "/", returns the number deleted"""
+        raise NotImplementedError
+
+    def delete_many(self, keys: List[str]) -> None:
+        """Delete several objects; missing objects are not an error"""
+        for key in keys:
+            self.delete(key)
+
+    def local_path(self, key: str):
+        """Context manager yielding the path of a local file with the object's content"""
+        raise NotImplementedError
+
+    def write_json(self, key: str, data: Dict[str, Any]) -> str:
+        """
+        Store a JSON document (blocking).
+
+        Returns:
+            str: The key
+        """
+        self.write_bytes(key, json.dumps(data, indent=2).encode())
+        return key
+
+    def read_json(self, key: str) -> Dict[str, Any]:
+        """
+        Read a JSON document (blocking).
+        """
+        return json.loads(self.read_bytes(key))
+
+class FileSystemStorage(Storage):
+    """
+    Stores objects as files below a root directory. Keys are paths relative
+    to the root, so with the default root "." they are the paths the
+    application has always used.
+    """
+
+    def __init__(self, root: str = "."):
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def put_file(self, key, path, move=False):
+        destination = self._path(key)
+        os.makedirs(os.path.dirname(destination) or ".", exist_ok=True)
+        if move:
+            os.replace(path, destination)
+            return
+
+        tmp_path = f"{destination}.part"
+        shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, destination)
+
+    def write_bytes(self, key, data):
+        destination = self._path(key)
+        os.makedirs(os.path.dirname(destination) or ".", exist_ok=True)
+
+        tmp_path = f"{destination}.part"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, destination)
+
+    def read_bytes(self, key):
+        with open(self._path(key), "rb") as f:
+            return f.read()
+
+    def exists(self, key):
+        return os.path.isfile(self._path(key))
+
+    def stat(self, key):
+        st = os.stat(self._path(key))
+        return ObjectInfo(st.st_size, f"{st.st_mtime_ns:x}-{st.st_size:x}", st.st_mtime)
+
+    def iter_range(self, key, start, end, chunk_size=64 * 1024):
+        with open(self._path(key), "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def delete_prefix(self, prefix):
+        path = self._path(prefix)
+        if not os.path.isdir(path):
+            return 0
+
+        count = sum(len(files) for _, _, files in os.walk(path))
+        shutil.rmtree(path)
+        return count
+
+    @contextmanager
+    def local_path(self, key):
+        path = self._path(key)
+        if not os.path.isfile(path):
+            raise FileNotFoundError(path)
+        yield path
+
+class S3Storage(Storage):
+    """
+    Stores objects in an S3-compatible bucket (AWS S3, MinIO, Ceph, ...), so
+    several backend replicas can share uploads and results.
+
+    Requires boto3. Credentials come from the usual AWS environment variables
+    or config files.
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        endpoint_url: Optional[str] = None,
+        region_name: Optional[str] = None,
+        client=None
+    ):
+        if client is None:
+            try:
+                import boto3
+            except ImportError:
+                raise RuntimeError("S3 storage requires boto3: pip install boto3")
+            client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region_name)
+
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key.lstrip("/")
+
+    def _missing(self, error) -> bool:
+        return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+    def _call(self, key: str, method, **kwargs):
+        from botocore.exceptions import ClientError
+
+        try:
+            return method(Bucket=self.bucket, Key=self._key(key), **kwargs)
+        except ClientError as e:
+            if self._missing(e):
+                raise FileNotFoundError(key)
+            raise
+
+    def put_file(self, key, path, move=False):
+        self.client.upload_file(path, self.bucket, self._key(key))
+        if move:
+            os.remove(path)
+
+    def write_bytes(self, key, data):
+        self.client.put_object(Bucket=self.bucket, Key=self._key(key), Body=data)
+
+    def read_bytes(self, key):
+        return self._call(key, self.client.get_object)["Body"].read()
+
+    def exists(self, key):
+        try:
+            self._call(key, self.client.head_object)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def stat(self, key):
+        head = self._call(key, self.client.head_object)
+        return ObjectInfo(head["ContentLength"], head["ETag"].strip('"'), head["LastModified"].timestamp())
+
+    def iter_range(self, key, start, end, chunk_size=64 * 1024):
+        if end < start:
+            return
+        body = self._call(key, self.client.get_object, Range=f"bytes={start}-{end}")["Body"]
+        try:
+            yield from body.iter_chunks(chunk_size)
+        finally:
+            body.close()
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def delete_prefix(self, prefix):
+        count = 0
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix)):
+            objects = [{"Key": item["Key"]} for item in page.get("Contents", [])]
+            if objects:
+                # A listing page holds at most 1000 keys, the delete_objects limit
+                self.client.delete_objects(Bucket=self.bucket, Delete={"Objects": objects, "Quiet": True})
+                count += len(objects)
+        return count
+
+    def delete_many(self, keys):
+        # delete_objects takes at most 1000 keys per call
+        for start in range(0, len(keys), 1000):
+            objects = [{"Key": self._key(key)} for key in keys[start:start + 1000]]
+            self.client.delete_objects(Bucket=self.bucket, Delete={"Objects": objects, "Quiet": True})
+
+    @contextmanager
+    def local_path(self, key):
+        os.makedirs(settings.UPLOAD_TMP_DIR, exist_ok=True)
+        fd, path = tempfile.mkstemp(dir=settings.UPLOAD_TMP_DIR, suffix=os.path.splitext(key)[1])
+        os.close(fd)
+        try:
+            try:
+                self.client.download_file(self.bucket, self._key(key), path)
+            except Exception as e:
+                if hasattr(e, "response") and self._missing(e):
+                    raise FileNotFoundError(key)
+                raise
+            yield path
+        finally:
+            os.remove(path)
+
+def create_storage(url: str) -> Storage:
+    """
+    Create a storage backend from a URL.
+
+    Args:
+        url: "file://<root directory>" or
+            "s3://<bucket>/<prefix>?endpoint_url=http://minio:9000&region=us-east-1"
+
+    Returns:
+        Storage: The backend
+    """
+    if url.startswith("file://"):
+        return FileSystemStorage(url[len("file://"):] or ".")
+
+    parsed = urlparse(url)
+    if parsed.scheme == "s3":
+        options = {name: values[0] for name, values in parse_qs(parsed.query).items()}
+        return S3Storage(
+            parsed.netloc,
+            prefix=parsed.path,
+            endpoint_url=options.get("endpoint_url"),
+            region_name=options.get("region")
+        )
+
+    raise ValueError(f"Unsupported storage URL: {url}")
+
+_storage: Optional[Storage] = None
+_storage_lock = threading.Lock()
+
+def get_storage() -> Storage:
+    """
+    Get the storage backend of this process, configured by STORAGE_URL.
+    """
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = create_storage(settings.STORAGE_URL)
+    return _storage
@@ -1,43 +1,34 @@
-import os
-import shutil
 import uuid
-import json
-from typing import Dict, Any, Optional
-from fastapi import UploadFile
-from PIL import Image
+from typing import Dict, Any, List, Optional, Tuple
+import numpy as np
 
 from app.config import settings
+from app import file_io
+from app.storage import get_storage
+from app.measurements import measure_results
 
-async def save_uploaded_file(file: UploadFile, destination: str) -> str:
+def generate_analysis_id() -> str:
     """
-    Save an uploaded file to the specified destination.
+    Generate a unique ID for a new analysis.
     
-    Args:
-        file: The uploaded file
-        destination: Path where the file should be saved
-        
     Returns:
-        str: Path to the saved file
+        str: Unique ID
     """
-    # Ensure parent directory exists
-    os.makedirs(os.path.dirname(destination), exist_ok=True)
-    
-    # Save the file
-    with open(destination, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    return destination
+    return str(uuid.uuid4())
 
-def generate_analysis_id() -> str:
+def get_result_path(analysis_id: str) -> str:
     """
-    Generate a unique ID for a new analysis.
+    Get the storage key of the results file for an analysis.
     
+    Args:
+        analysis_id: Analysis identifier
+        
     Returns:
-        str: Unique ID
+        str: Storage key of the results file
     """
-    return str(uuid.uuid4())
+    return f"{settings.RESULTS_DIR}/{analysis_id}.json"
 
-def save_analysis_result(analysis_id: str, result: Dict[str, Any]) -> str:
+async def save_analysis_result(analysis_id: str, result: Dict[str, Any]) -> str:
     """
     Save analysis results to a JSON file.
     
@@ -46,40 +37,105 @@ def save_analysis_result(analysis_id: str, result: Dict[str, Any]) -> str:
         result: Analysis results to save
         
     Returns:
-        str: Path to the saved results file
+        str: Storage key of the saved results file
     """
     # Create result path
-    result_path = os.path.join(settings.RESULTS_DIR, f"{analysis_id}.json")
-    
-    # Ensure directory exists
-    os.makedirs(os.path.dirname(result_path), exist_ok=True)
-    
-    # Save results as JSON
-    with open(result_path, "w") as f:
-        json.dump(result, f, indent=2)
+    result_path = get_result_path(analysis_id)
     
-    return result_path
+    # Save results as JSON without blocking the event loop
+    return await file_io.run_blocking(get_storage().write_json, result_path, result)
 
-def load_analysis_result(path: str) -> Dict[str, Any]:
+async def load_analysis_result(path: str) -> Dict[str, Any]:
     """
     Load analysis results from a JSON file.
     
     Args:
-        path: Path to the results file
+        path: Storage key of the results file
         
     Returns:
         Dict[str, Any]: Analysis results
     """
-    with open(path, "r") as f:
-        return json.load(f)
+    return await file_io.run_blocking(get_storage().read_json, path)
+
+def summarize_analysis_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Extract the fields of an analysis result that are stored on the database row.
+    
+    Args:
+        result: Analysis results as produced by the analysis function
+        
+    Returns:
+        Dict[str, Any]: Column values for models.Analysis
+    """
+    return {
+        "summary": result.get("summary", "No summary available"),
+        "has_ap": bool(result.get("has_ap", False)),
+        "has_lat": bool(result.get("has_lat", False)),
+        "measurements": result.get("measurements", [])
+    }
+
+# Mock landmark positions as fractions of image width and height
+MOCK_AP_LANDMARKS = {
+    "radial_shaft_proximal": (0.465, 0.90),
+    "radial_shaft_distal": (0.465, 0.60),
+    "radial_styloid": (0.28, 0.2867),
+    "ulnar_corner": (0.62, 0.47),
+    "ulnar_head": (0.70, 0.4617)
+}
+
+MOCK_LAT_LANDMARKS = {
+    "radial_shaft_proximal": (0.474, 0.90),
+    "radial_shaft_distal": (0.474, 0.60),
+    "volar_rim": (0.375, 0.45),
+    "dorsal_rim": (0.625, 0.515)
+}
+
+def place_mock_landmarks(template: Dict[str, tuple], width: int, height: int) -> List[Dict[str, Any]]:
+    """
+    Scale a mock landmark template to an image.
+    
+    Args:
+        template: Landmark label to (x, y) fractions of the image size
+        width: Image width in pixels
+        height: Image height in pixels
+        
+    Returns:
+        List[Dict[str, Any]]: Landmarks as {"x", "y", "label"} points
+    """
+    return [
+        {"x": round(fx * width), "y": round(fy * height), "label": label}
+        for label, (fx, fy) in template.items()
+    ]
+
+def reference_line(landmarks: List[Dict[str, Any]], start: str, end: str, label: str) -> Dict[str, Any]:
+    """
+    Build a reference line between two labelled landmarks.
+    """
+    points = {point["label"]: point for point in landmarks}
+    return {
+        "x1": points[start]["x"], "y1": points[start]["y"],
+        "x2": points[end]["x"], "y2": points[end]["y"],
+        "label": label
+    }
 
-def generate_mock_analysis(ap_path: Optional[str], lat_path: Optional[str]) -> Dict[str, Any]:
+def generate_mock_analysis(
+    ap_path: Optional[str],
+    lat_path: Optional[str],
+    ap_image: Optional[np.ndarray] = None,
+    lat_image: Optional[np.ndarray] = None,
+    ap_pixel_spacing: Optional[Tuple[float, float]] = None,
+    lat_pixel_spacing: Optional[Tuple[float, float]] = None
+) -> Dict[str, Any]:
     """
     Generate mock analysis data for development.
     
     Args:
         ap_path: Path to AP view image (optional)
         lat_path: Path to lateral view image (optional)
+        ap_image: Decoded AP view, used for the image size (optional)
+        lat_image: Decoded lateral view, used for the image size (optional)
+        ap_pixel_spacing: (row, column) mm per pixel of a DICOM AP view (optional)
+        lat_pixel_spacing: (row, column) mm per pixel of a DICOM lateral view (optional)
         
     Returns:
         Dict[str, Any]: Mock analysis results
@@ -95,33 +151,37 @@ def generate_mock_analysis(ap_path: Optional[str], lat_path: Optional[str]) -> D
         "has_lat": lat_path is not None
     }
     
-    # Get image dimensions if available
+    # Get image dimensions from the decoded images if available
     ap_width, ap_height = (800, 600)  # Default dimensions
     lat_width, lat_height = (800, 600)  # Default dimensions
     
+    if ap_image is not None:
+        ap_height, ap_width = ap_image.shape[:2]
+    
+    if lat_image is not None:
+        lat_height, lat_width = lat_image.shape[:2]
+    
+    # Add mock landmarks and the reference lines drawn through them
     if ap_path:
-        try:
-            img = Image.open(ap_path)
-            ap_width, ap_height = img.size
-        except:
-            pass
+        result["ap_landmarks"] = place_mock_landmarks(MOCK_AP_LANDMARKS, ap_width, ap_height)
+        result["ap_reference_lines"] = [
+            reference_line(result["ap_landmarks"], "radial_shaft_proximal", "radial_shaft_distal", "Radial Axis"),
+            reference_line(result["ap_landmarks"], "radial_styloid", "ulnar_corner", "Articular Surface")
+        ]
     
     if lat_path:
-        try:
-            img = Image.open(lat_path)
-            lat_width, lat_height = img.size
-        except:
-            pass
-    
-    # Add mock measurements
-    result["measurements"] = [
-        {"label": "Radial Angle", "value": "22.3", "unit": "°"},
-        {"label": "Radial Length", "value": "12.1", "unit": "mm"},
-        {"label": "Radial Shift", "value": "1.2", "unit": "mm"},
-        {"label": "Ulnar Variance", "value": "0.5", "unit": "mm"},
-        {"label": "Palmar Tilt", "value": "11.2", "unit": "°"},
-        {"label": "Dorsal Shift", "value": "2.1", "unit": "mm"}
-    ]
+        result["lat_landmarks"] = place_mock_landmarks(MOCK_LAT_LANDMARKS, lat_width, lat_height)
+        result["lat_reference_lines"] = [
+            reference_line(result["lat_landmarks"], "radial_shaft_proximal", "radial_shaft_distal", "Radial Axis"),
+            reference_line(result["lat_landmarks"], "volar_rim", "dorsal_rim", "Articular Surface")
+        ]
+    
+    # Compute measurements from the mock landmarks, in the images' own spacing if known
+    if ap_pixel_spacing:
+        result["ap_pixel_spacing"] = list(ap_pixel_spacing)
+    if lat_pixel_spacing:
+        result["lat_pixel_spacing"] = list(lat_pixel_spacing)
+    result["measurements"] = measure_results([result])[0]
     
     # Generate summary
     if ap_path and lat_path:
@@ -137,15 +197,17 @@ def cleanup_analysis_files(analysis_id: str) -> None:
     """
     Clean up all files associated with an analysis.
     
+    Uploaded images are shared through the blob store; the blobs no other
+    analysis references are queued for the file cleaner by whoever released
+    them (see blobs.release).
+    
     Args:
         analysis_id: Analysis identifier
     """
-    # Clean up image files
-    image_dir = os.path.join(settings.IMAGES_DIR, analysis_id)
-    if os.path.exists(image_dir):
-        shutil.rmtree(image_dir)
+    storage = get_storage()
+    
+    # Clean up legacy per-analysis images and derivatives
+    storage.delete_prefix(f"{settings.IMAGES_DIR}/{analysis_id}/")
     
     # Clean up results file
-    result_path = os.path.join(settings.RESULTS_DIR, f"{analysis_id}.json")
-    if os.path.exists(result_path):
-        os.remove(result_path)
+    storage.delete(get_result_path(analysis_id))
@@ -0,0 +1,48 @@
+"""
+Benchmark inference throughput against batch size on CPU.
+
+Uses the mock engine with a simulated per-batch and per-image cost, so the
+effect of micro-batching can be measured without a GPU or model weights.
+
+Usage:
+    python -m benchmarks.inference_batching --studies 256 --overhead-ms 20 --per-image-ms 2
+"""
+import time
+import argparse
+
+from app.inference import InferenceRequest, MockInferenceEngine
+
+def run(studies: int, batch_size: int, engine: MockInferenceEngine) -> float:
+    """Return throughput in studies/sec for one batch size"""
+    requests = [
+        InferenceRequest(f"bench-{i}", ap_path=f"bench-{i}-ap.jpg", lat_path=f"bench-{i}-lat.jpg")
+        for i in range(studies)
+    ]
+
+    start = time.perf_counter()
+    for i in range(0, studies, batch_size):
+        engine.predict_batch(requests[i:i + batch_size])
+    elapsed = time.perf_counter() - start
+
+    return studies / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--studies", type=int, default=256)
+    parser.add_argument("--overhead-ms", type=float, default=20.0, help="Simulated cost per engine call")
+    parser.add_argument("--per-image-ms", type=float, default=2.0, help="Simulated cost per image")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    engine = MockInferenceEngine(batch_overhead=args.overhead_ms / 1000, per_image=args.per_image_ms / 1000)
+    engine.load()
+
+    print(f"{'batch':>6} {'studies/s':>10} {'speedup':>8}")
+    baseline = None
+    for batch_size in args.batch_sizes:
+        throughput = run(args.studies, batch_size, engine)
+        baseline = baseline or throughput
+        print(f"{batch_size:>6} {throughput:>10.1f} {throughput / baseline:>7.2f}x")
+
+if __name__ == "__main__":
+    main()
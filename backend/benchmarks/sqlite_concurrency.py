@@ -0,0 +1,122 @@
+"""
+Benchmark concurrent reads and writes against a SQLite database file, with
+and without the SQLite tuning of app/database.py (WAL, pragmas and the
+process-wide writer lock).
+
+Writer threads create analyses the way POST /analyses does (row plus
+counters, one commit each) while reader threads page through the history.
+
+Usage:
+    python -m benchmarks.sqlite_concurrency --writers 8 --readers 8 --seconds 5
+"""
+import os
+import time
+import uuid
+import argparse
+import tempfile
+import threading
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from app import counters
+from app.database import Base, configure_sqlite, engine_options
+from app.models import Analysis, AnalysisStatus, User, UserRole
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+def run(path: str, tuned: bool, writers: int, readers: int, seconds: float) -> dict:
+    """Run the workload for seconds and return throughput, latencies and errors"""
+    url = f"sqlite:///{path}"
+    engine = create_engine(url, **engine_options(url))
+    if tuned:
+        configure_sqlite(engine)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine, autoflush=False)
+
+    with Session() as db:
+        db.add(User(id=1, email="bench@wristsight.ai", username="bench", password="-", role=UserRole.ADMIN))
+        db.commit()
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    stats = {"writes": 0, "reads": 0, "errors": 0, "write_latency": [], "read_latency": []}
+
+    def record(kind, started, failed=False):
+        with lock:
+            if failed:
+                stats["errors"] += 1
+            else:
+                stats[f"{kind}s"] += 1
+                stats[f"{kind}_latency"].append(time.perf_counter() - started)
+
+    def write():
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                with Session() as db:
+                    analysis = Analysis(
+                        id=uuid.uuid4().hex,
+                        patient_id=f"bench-{uuid.uuid4().int % 50}",
+                        status=AnalysisStatus.QUEUED.value,
+                        summary="Benchmark study",
+                        user_id=1
+                    )
+                    db.add(analysis)
+                    counters.record_created(db, analysis)
+                    db.commit()
+            except OperationalError:
+                record("write", started, failed=True)
+                continue
+            record("write", started)
+
+    def read():
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                with Session() as db:
+                    db.query(Analysis).order_by(Analysis.timestamp.desc(), Analysis.id.desc()).limit(20).all()
+            except OperationalError:
+                record("read", started, failed=True)
+                continue
+            record("read", started)
+
+    threads = [threading.Thread(target=write) for _ in range(writers)]
+    threads += [threading.Thread(target=read) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+
+    return {
+        "writes/s": stats["writes"] / seconds,
+        "reads/s": stats["reads"] / seconds,
+        "errors": stats["errors"],
+        "write p95 ms": _percentile(stats["write_latency"], 0.95) * 1000,
+        "read p95 ms": _percentile(stats["read_latency"], 0.95) * 1000
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--dir", default=".", help="Where to create the database, on the disk to measure")
+    args = parser.parse_args()
+
+    columns = ["writes/s", "reads/s", "errors", "write p95 ms", "read p95 ms"]
+    print(f"{'mode':>8} " + " ".join(f"{column:>13}" for column in columns))
+    for mode, tuned in (("default", False), ("tuned", True)):
+        with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+            result = run(os.path.join(directory, "bench.db"), tuned, args.writers, args.readers, args.seconds)
+        print(f"{mode:>8} " + " ".join(f"{result[column]:>13.1f}" for column in columns))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# tests/conftest.py
+import io
+import os
+import atexit
+import shutil
+import tempfile
+import pytest
+import numpy as np
+from PIL import Image
+from fastapi import status
+from fastapi.testclient import TestClient
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Uploads, results and the application database live below the working
+# directory (STORAGE_URL=file://.); run the suite in a scratch directory so it
+# never writes into the source tree
+_workdir = tempfile.mkdtemp(prefix="wristsight-tests-")
+os.chdir(_workdir)
+atexit.register(shutil.rmtree, _workdir, ignore_errors=True)
+
+from app.main import app
+from app import database, auth_utils
+from app.database import Base, get_db
+from app.models import User, UserRole
+
+# Create in-memory SQLite database for testing
+SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Point the application's own session factory at the test database too, so
+# code that opens sessions outside of a request (workers, CLIs) sees the same data
+database.SessionLocal.configure(bind=engine)
+
+# Create the tables
+Base.metadata.create_all(bind=engine)
+
+TEST_USER_ID = 1
+
+def _create_test_user():
+    db = TestingSessionLocal()
+    if db.query(User).filter(User.id == TEST_USER_ID).first() is None:
+        db.add(User(
+            id=TEST_USER_ID,
+            email="tester@wristsight.ai",
+            username="tester",
+            password="not-a-real-hash",
+            role=UserRole.ADMIN,
+            is_active=True
+        ))
+        db.commit()
+    db.close()
+
+_create_test_user()
+
+# Override the get_db dependency
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Authenticate every request as the test admin
+def override_get_current_user():
+    db = TestingSessionLocal()
+    try:
+        return db.query(User).filter(User.id == TEST_USER_ID).first()
+    finally:
+        db.close()
+
+app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[auth_utils.get_current_user] = override_get_current_user
+
+@pytest.fixture
+def db_session():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def image_bytes(fmt="JPEG", size=(64, 48)):
+    """A small noise image, different on every call so uploads are never deduplicated"""
+    buffer = io.BytesIO()
+    Image.frombytes("L", size, os.urandom(size[0] * size[1])).save(buffer, format=fmt)
+    return buffer.getvalue()
+
+def create_analysis(patient_id="test-patient", content=None, view="ap_image"):
+    """Create an analysis of one uploaded image, a fresh one by default; returns the response body"""
+    files = {view: (f"{view}.jpg", io.BytesIO(content or image_bytes()), "image/jpeg")}
+    response = TestClient(app).post("/api/analyses", files=files, data={"patient_id": patient_id})
+    assert response.status_code == status.HTTP_201_CREATED
+    return response.json()
+
+def dicom_bytes(patient_id="DCM-001", frames=None, spacing=(0.2, 0.1), window=(1000, 2000), photometric="MONOCHROME2"):
+    """A 16-bit DX image, or a multi-frame one whose frame i is filled with i * 1000"""
+    rows, columns = 40, 60
+    if frames is None:
+        # Random pixels so repeat uploads are never deduplicated
+        pixels = np.random.randint(0, 2000, (rows, columns), dtype=np.uint16)
+    else:
+        pixels = np.stack([np.full((rows, columns), i * 1000, dtype=np.uint16) for i in range(frames)])
+
+    meta = FileMetaDataset()
+    meta.MediaStorageSOPClassUID = "1.2.840.10008.5.1.4.1.1.1.1"
+    meta.MediaStorageSOPInstanceUID = generate_uid()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+
+    ds = Dataset()
+    ds.file_meta = meta
+    ds.SOPClassUID = meta.MediaStorageSOPClassUID
+    ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+    ds.PatientID = patient_id
+    ds.PatientName = "Doe^Jane"
+    ds.StudyDate = "20250314"
+    ds.Modality = "DX"
+    ds.Rows, ds.Columns = rows, columns
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = photometric
+    ds.BitsAllocated, ds.BitsStored, ds.HighBit = 16, 12, 11
+    ds.PixelRepresentation = 0
+    if spacing:
+        ds.ImagerPixelSpacing = list(spacing)
+    if window:
+        ds.WindowCenter, ds.WindowWidth = window
+    if frames is not None:
+        ds.NumberOfFrames = frames
+    ds.PixelData = pixels.tobytes()
+
+    buffer = io.BytesIO()
+    ds.save_as(buffer, enforce_file_format=True)
+    return buffer.getvalue()
@@ -3,35 +3,10 @@ import pytest
 import io
 from fastapi.testclient import TestClient
 from fastapi import status
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
-
 from app.main import app
-from app.database import Base, get_db
 from app.models import Analysis, Patient
 
-# Create in-memory SQLite database for testing
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False},
-    poolclass=StaticPool,
-)
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-# Create the tables
-Base.metadata.create_all(bind=engine)
-
-# Override the get_db dependency
-def override_get_db():
-    db = TestingSessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-app.dependency_overrides[get_db] = override_get_db
+from tests.conftest import TestingSessionLocal, TEST_USER_ID, image_bytes
 
 # Create test client
 client = TestClient(app)
@@ -54,7 +29,8 @@ def setup_test_data():
         ap_image_path="static/images/test-analysis-id/ap.jpg",
         lat_image_path="static/images/test-analysis-id/lat.jpg",
         result_path="static/images/test-analysis-id/result.json",
-        status="new"
+        status="new",
+        user_id=TEST_USER_ID
     )
     
     db.add(patient)
@@ -67,8 +43,8 @@ setup_test_data()
 
 def test_create_analysis():
     # Create test image files
-    ap_image_content = b"fake AP image content"
-    lat_image_content = b"fake LAT image content"
+    ap_image_content = image_bytes()
+    lat_image_content = image_bytes("PNG")
     
     # Prepare multipart form data
     files = {
@@ -0,0 +1,231 @@
+# tests/test_auth.py
+import pytest
+from fastapi.testclient import TestClient
+from fastapi import status, HTTPException
+from passlib.context import CryptContext
+
+from app.main import app
+from app import auth_utils
+from app.models import RefreshToken, User, UserRole
+from app.ratelimit import LoginRateLimiter, create_rate_limit_backend, get_login_limiter
+
+from tests.conftest import TestingSessionLocal
+
+client = TestClient(app)
+
+@pytest.fixture
+def normal_user(db_session):
+    user = User(email="cached@wristsight.ai", username="cached", password="x", role=UserRole.NORMAL)
+    db_session.add(user)
+    db_session.commit()
+    db_session.refresh(user)
+    yield user
+    db_session.delete(user)
+    db_session.commit()
+
+def authenticate(user_id):
+    # Fresh session per call, like a request
+    token = auth_utils.create_access_token(data={"user_id": user_id})
+    db = TestingSessionLocal()
+    try:
+        return auth_utils.get_current_user(token, db)
+    finally:
+        db.close()
+
+def test_user_lookup_is_cached(normal_user, db_session):
+    auth_utils.user_cache.clear()
+
+    first = authenticate(normal_user.id)
+    second = authenticate(normal_user.id)
+
+    assert first is second
+    assert first.username == "cached"
+    assert not hasattr(first, "password")
+    stats = auth_utils.user_cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+def test_role_change_invalidates_cache(normal_user, db_session):
+    assert authenticate(normal_user.id).role == UserRole.NORMAL
+
+    response = client.patch(f"/api/auth/users/{normal_user.id}/role", json={"role": "SUPERUSER"})
+    assert response.status_code == status.HTTP_200_OK
+
+    assert authenticate(normal_user.id).role == UserRole.SUPERUSER
+
+def test_deactivation_invalidates_cache(normal_user, db_session):
+    authenticate(normal_user.id)
+
+    response = client.patch(f"/api/auth/users/{normal_user.id}", json={"is_active": False})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["is_active"] is False
+
+    with pytest.raises(HTTPException) as exc_info:
+        authenticate(normal_user.id)
+    assert exc_info.value.status_code == status.HTTP_403_FORBIDDEN
+
+def test_cache_stats_endpoint():
+    response = client.get("/api/auth/user-cache")
+    assert response.status_code == status.HTTP_200_OK
+    assert {"hits", "misses", "size"} <= set(response.json())
+
+@pytest.fixture
+def login_user(db_session, monkeypatch):
+    # Cheap bcrypt cost for the test, the stored hash has an older one
+    monkeypatch.setattr(auth_utils, "pwd_context", CryptContext(schemes=["bcrypt"], bcrypt__rounds=5))
+    user = User(
+        email="login@wristsight.ai",
+        username="login",
+        password=auth_utils.pwd_context.hash("s3cret", rounds=4),
+        role=UserRole.NORMAL
+    )
+    db_session.add(user)
+    db_session.commit()
+    get_login_limiter().reset()
+    yield user
+    get_login_limiter().reset()
+    db_session.query(RefreshToken).filter(RefreshToken.user_id == user.id).delete()
+    db_session.delete(user)
+    db_session.commit()
+
+def login(username, password):
+    return client.post("/api/auth/login", data={"username": username, "password": password})
+
+def test_login_rehashes_password_at_configured_cost(login_user, db_session):
+    assert login("login", "s3cret").status_code == status.HTTP_200_OK
+
+    db_session.refresh(login_user)
+    assert login_user.password.startswith("$2b$05$")
+    assert login("login@wristsight.ai", "s3cret").status_code == status.HTTP_200_OK
+    assert login("login", "wrong").status_code == status.HTTP_403_FORBIDDEN
+
+def test_login_attempts_are_rate_limited_per_account(login_user, monkeypatch):
+    monkeypatch.setattr(get_login_limiter(), "account", (3, 0.01))
+    for _ in range(3):
+        assert login("login", "wrong").status_code == status.HTTP_403_FORBIDDEN
+
+    # Even the right password waits for the bucket to refill
+    response = login("LOGIN", "s3cret")
+    assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert int(response.headers["Retry-After"]) >= 1
+
+    # Other accounts are not affected
+    assert login("someone-else", "wrong").status_code == status.HTTP_403_FORBIDDEN
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_token_bucket_refills(tmp_path, backend):
+    url = "memory" if backend == "memory" else f"sqlite:///{tmp_path / 'ratelimit.db'}"
+    now = [1000.0]
+    limiter = LoginRateLimiter(create_rate_limit_backend(url), 2, 60, 10, 600, clock=lambda: now[0])
+
+    assert limiter.check("user", "10.0.0.1") == 0
+    assert limiter.check("user", "10.0.0.1") == 0
+    assert limiter.check("user", "10.0.0.1") == pytest.approx(1.0)
+
+    now[0] += 1
+    assert limiter.check("user", "10.0.0.1") == 0
+
+    # Another process sharing the SQLite file sees the same buckets
+    if backend == "sqlite":
+        other = LoginRateLimiter(create_rate_limit_backend(url), 2, 60, 10, 600, clock=lambda: now[0])
+        assert other.check("user", "10.0.0.2") > 0
+
+def authenticate_stateless(user):
+    # No database session: the token and the version table must be enough
+    token = auth_utils.create_access_token(data=auth_utils.token_claims(user))
+    return token, auth_utils.get_current_user(token, None)
+
+def test_tokens_are_verified_without_the_database(normal_user):
+    auth_utils.token_versions.clear()
+    _, user = authenticate_stateless(normal_user)
+
+    assert isinstance(user, auth_utils.TokenUser)
+    assert (user.id, user.username, user.role) == (normal_user.id, "cached", UserRole.NORMAL)
+    with pytest.raises(HTTPException) as exc_info:
+        auth_utils.is_admin(user)
+    assert exc_info.value.status_code == status.HTTP_403_FORBIDDEN
+
+def test_role_change_revokes_tokens(normal_user, db_session):
+    token, _ = authenticate_stateless(normal_user)
+
+    response = client.patch(f"/api/auth/users/{normal_user.id}/role", json={"role": "ADMIN"})
+    assert response.status_code == status.HTTP_200_OK
+
+    with pytest.raises(HTTPException) as exc_info:
+        auth_utils.get_current_user(token, None)
+    assert exc_info.value.status_code == status.HTTP_401_UNAUTHORIZED
+
+    db_session.refresh(normal_user)
+    _, user = authenticate_stateless(normal_user)
+    assert auth_utils.is_admin(user) is user
+
+def test_deactivation_applies_to_stateless_tokens(normal_user, db_session):
+    token, _ = authenticate_stateless(normal_user)
+
+    response = client.patch(f"/api/auth/users/{normal_user.id}", json={"is_active": False})
+    assert response.status_code == status.HTTP_200_OK
+
+    # Also after the version table was reloaded from the database
+    auth_utils.token_versions.clear()
+    db_session.refresh(normal_user)
+    with pytest.raises(HTTPException) as exc_info:
+        authenticate_stateless(normal_user)
+    assert exc_info.value.status_code == status.HTTP_403_FORBIDDEN
+    with pytest.raises(HTTPException) as exc_info:
+        auth_utils.get_current_user(token, None)
+    assert exc_info.value.status_code == status.HTTP_401_UNAUTHORIZED
+
+def test_rolled_back_revocation_keeps_tokens(normal_user, db_session):
+    token, _ = authenticate_stateless(normal_user)
+
+    auth_utils.revoke_tokens(normal_user)
+    db_session.flush()
+    db_session.rollback()
+
+    assert auth_utils.get_current_user(token, None).id == normal_user.id
+
+def test_tokens_of_deleted_users_are_rejected(db_session):
+    user = User(email="deleted@wristsight.ai", username="deleted", password="x", role=UserRole.NORMAL)
+    db_session.add(user)
+    db_session.commit()
+    token, _ = authenticate_stateless(user)
+
+    db_session.delete(user)
+    db_session.commit()
+    for reload in (False, True):
+        if reload:
+            auth_utils.token_versions.clear()
+        with pytest.raises(HTTPException) as exc_info:
+            auth_utils.get_current_user(token, None)
+        assert exc_info.value.status_code == status.HTTP_401_UNAUTHORIZED
+
+def refresh(token):
+    return client.post("/api/auth/refresh", json={"refresh_token": token})
+
+def test_refresh_tokens_rotate_and_detect_reuse(login_user, db_session):
+    first = login("login", "s3cret").json()["refresh_token"]
+
+    response = refresh(first)
+    assert response.status_code == status.HTTP_200_OK
+    second = response.json()["refresh_token"]
+    assert second != first
+    user = auth_utils.get_current_user(response.json()["access_token"], None)
+    assert user.id == login_user.id
+
+    # Replaying the used token revokes the whole session
+    assert refresh(first).status_code == status.HTTP_401_UNAUTHORIZED
+    assert refresh(second).status_code == status.HTTP_401_UNAUTHORIZED
+
+    # Other sessions go on
+    third = login("login", "s3cret").json()["refresh_token"]
+    assert refresh(third).status_code == status.HTTP_200_OK
+    assert db_session.query(RefreshToken).filter(RefreshToken.token_hash == third).count() == 0
+
+def test_logout_and_revocation_end_refresh(login_user, db_session):
+    token = login("login", "s3cret").json()["refresh_token"]
+    assert client.post("/api/auth/logout", json={"refresh_token": token}).status_code == status.HTTP_204_NO_CONTENT
+    assert refresh(token).status_code == status.HTTP_401_UNAUTHORIZED
+
+    token = login("login", "s3cret").json()["refresh_token"]
+    response = client.patch(f"/api/auth/users/{login_user.id}/role", json={"role": "SUPERUSER"})
+    assert response.status_code == status.HTTP_200_OK
+    assert refresh(token).status_code == status.HTTP_401_UNAUTHORIZED
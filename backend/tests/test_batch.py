@@ -0,0 +1,107 @@
+# tests/test_batch.py
+import io
+import json
+from fastapi.testclient import TestClient
+from fastapi import status
+
+from app.main import app
+from app.config import settings
+from app.models import Analysis, ImageBlob
+from app.jobs import get_job_runner, SQLiteBroker
+
+from tests.conftest import TestingSessionLocal, image_bytes, dicom_bytes
+
+client = TestClient(app)
+
+def submit_batch(studies, files):
+    return client.post(
+        "/api/analyses/batch",
+        data={"manifest": json.dumps(studies)},
+        files=[("files", (name, io.BytesIO(content), "application/octet-stream")) for name, content in files.items()]
+    )
+
+def test_batch_creates_studies_and_reports_each_item():
+    get_job_runner().drain()
+    shared = image_bytes()
+    files = {
+        "p1-ap.jpg": shared,
+        "p1-lat.png": image_bytes("PNG"),
+        "p2-ap.dcm": dicom_bytes("BATCH-2"),
+        "broken.jpg": b"not an image at all",
+        "unused.jpg": image_bytes()
+    }
+    studies = [
+        {"patient_id": "BATCH-1", "ap": "p1-ap.jpg", "lat": "p1-lat.png", "notes": "first"},
+        {"ap": "p2-ap.dcm"},
+        {"patient_id": "BATCH-3", "ap": "broken.jpg"},
+        {"patient_id": "BATCH-4", "lat": "missing.jpg"},
+        # A file may be shared by studies
+        {"patient_id": "BATCH-5", "ap": "p1-ap.jpg"}
+    ]
+
+    response = submit_batch(studies, files)
+    assert response.status_code == status.HTTP_201_CREATED
+    items = response.json()["items"]
+    assert [item["index"] for item in items] == [0, 1, 2, 3, 4]
+    assert [item["status"] for item in items] == ["queued", "queued", "rejected", "rejected", "queued"]
+    assert items[1]["patient_id"] == "BATCH-2"
+    assert "broken.jpg" in items[2]["error"]
+    assert "missing.jpg" in items[3]["error"]
+
+    # Queued together, so a single drain runs them all
+    assert get_job_runner().drain() == 3
+
+    db = TestingSessionLocal()
+    try:
+        first = db.get(Analysis, items[0]["analysis_id"])
+        assert first.status == "done" and first.notes == "first" and first.has_lat
+        assert db.get(Analysis, items[1]["analysis_id"]).modality == "DX"
+        assert db.get(ImageBlob, first.ap_image_hash).ref_count == 2
+    finally:
+        db.close()
+
+def test_batch_rejects_invalid_manifests(monkeypatch):
+    files = {"ap.jpg": image_bytes()}
+    response = submit_batch({"ap": "ap.jpg"}, files)
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    response = submit_batch([], files)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    monkeypatch.setattr(settings, "MAX_BATCH_STUDIES", 1)
+    response = submit_batch([{"patient_id": "P", "ap": "ap.jpg"}] * 2, files)
+    assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+def test_batch_is_undone_when_queueing_fails(monkeypatch):
+    get_job_runner().drain()
+    # A study analysed before, so the batch answers it from the result cache
+    seen = image_bytes()
+    first = submit_batch([{"patient_id": "UNDO-0", "ap": "seen.jpg"}], {"seen.jpg": seen}).json()["items"][0]
+    get_job_runner().drain()
+
+    def broken_submit(jobs):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(get_job_runner(), "submit_many", broken_submit)
+    studies = [{"patient_id": "UNDO-1", "ap": "seen.jpg"}, {"patient_id": "UNDO-2", "ap": "new.jpg"}]
+    response = submit_batch(studies, {"seen.jpg": seen, "new.jpg": image_bytes()})
+    assert response.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
+
+    db = TestingSessionLocal()
+    try:
+        assert db.query(Analysis).filter(Analysis.patient_id.in_(["UNDO-1", "UNDO-2"])).count() == 0
+        analysis = db.get(Analysis, first["analysis_id"])
+        assert db.get(ImageBlob, analysis.ap_image_hash).ref_count == 1
+    finally:
+        db.close()
+
+    # The analysis the cached result came from is untouched
+    response = client.get(f"/api/analyses/{first['analysis_id']}")
+    assert response.json()["status"] == "done"
+    assert response.json()["measurements"]
+
+def test_sqlite_broker_publishes_many(tmp_path):
+    broker = SQLiteBroker(str(tmp_path / "jobs.db"))
+    broker.publish_many([{"analysis_id": "a"}, {"analysis_id": "b"}])
+    assert broker.pending() == 2
+    assert broker.fetch(timeout=0)[1] == {"analysis_id": "a"}
@@ -0,0 +1,93 @@
+# tests/test_blobs.py
+import os
+import hashlib
+from fastapi.testclient import TestClient
+from fastapi import status
+
+from app import blobs
+from app.main import app
+from app.models import Analysis, ImageBlob
+from app.inference import MockInferenceEngine
+from app.jobs import get_job_runner
+from app.retention import get_file_cleaner
+
+from tests.conftest import TestingSessionLocal, create_analysis, image_bytes
+
+client = TestClient(app)
+
+def get_row(model, key):
+    db = TestingSessionLocal()
+    try:
+        return db.get(model, key)
+    finally:
+        db.close()
+
+def test_repeat_upload_shares_blob_and_skips_inference():
+    get_job_runner().drain()
+    content = image_bytes()
+    digest = hashlib.sha256(content).hexdigest()
+
+    first = create_analysis("blobs-patient", content)
+    assert first["status"] == "queued"
+    assert get_job_runner().drain() == 1
+
+    second = create_analysis("blobs-patient", content)
+    assert second["status"] == "done"
+    assert get_job_runner().drain() == 0
+
+    first_row = get_row(Analysis, first["analysis_id"])
+    second_row = get_row(Analysis, second["analysis_id"])
+    assert first_row.ap_image_hash == second_row.ap_image_hash == digest
+    assert first_row.ap_image_path == second_row.ap_image_path
+    assert get_row(ImageBlob, digest).ref_count == 2
+
+    detail = client.get(f"/api/analyses/{second['analysis_id']}").json()
+    assert detail["measurements"] == client.get(f"/api/analyses/{first['analysis_id']}").json()["measurements"]
+    assert detail["ap_image_url"] == f"/api/images/{second['analysis_id']}/ap/original"
+    assert client.get(detail["ap_image_url"]).content == content
+
+def test_delete_removes_only_orphaned_blobs():
+    content = image_bytes()
+    digest = hashlib.sha256(content).hexdigest()
+    first, second = create_analysis("blobs-patient", content), create_analysis("blobs-patient", content)
+    path = get_row(Analysis, first["analysis_id"]).ap_image_path
+    get_job_runner().drain()
+
+    assert client.delete(f"/api/analyses/{first['analysis_id']}").status_code == status.HTTP_204_NO_CONTENT
+    get_file_cleaner().drain()
+    assert os.path.exists(path)
+    assert get_row(ImageBlob, digest).ref_count == 1
+
+    assert client.delete(f"/api/analyses/{second['analysis_id']}").status_code == status.HTTP_204_NO_CONTENT
+    get_file_cleaner().drain()
+    assert not os.path.exists(path)
+    assert get_row(ImageBlob, digest) is None
+
+def test_upload_racing_the_file_cleaner_keeps_its_blob(monkeypatch):
+    content = image_bytes()
+    first = create_analysis("blobs-patient", content)
+    path = get_row(Analysis, first["analysis_id"]).ap_image_path
+    get_job_runner().drain()
+    assert client.delete(f"/api/analyses/{first['analysis_id']}").status_code == status.HTTP_204_NO_CONTENT
+
+    # The cleaner removes the queued blob while the next upload of it is under way
+    add_reference = blobs.add_reference
+    def add_reference_after_cleanup(db, upload):
+        get_file_cleaner().drain()
+        return add_reference(db, upload)
+    monkeypatch.setattr(blobs, "add_reference", add_reference_after_cleanup)
+
+    second = create_analysis("blobs-patient", content)
+    get_job_runner().drain()
+    assert os.path.exists(path)
+    assert client.get(f"/api/images/{second['analysis_id']}/ap/original").content == content
+
+def test_new_engine_version_is_not_served_from_cache(monkeypatch):
+    get_job_runner().drain()
+    content = image_bytes()
+    create_analysis("blobs-patient", content)
+    get_job_runner().drain()
+
+    monkeypatch.setattr(MockInferenceEngine, "version", "mock-2")
+    assert create_analysis("blobs-patient", content)["status"] == "queued"
+    assert get_job_runner().drain() == 1
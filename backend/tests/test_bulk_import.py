@@ -0,0 +1,88 @@
+# tests/test_bulk_import.py
+import pytest
+
+from app import bulk_import
+from app.bulk_import import Study, discover_studies, import_studies
+from app.models import Analysis, Patient, User
+
+from tests.conftest import TestingSessionLocal, TEST_USER_ID, image_bytes, dicom_bytes
+
+@pytest.fixture
+def db():
+    session = TestingSessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+def write(path, content):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    return path
+
+def analyses_of(db, patient_id):
+    return db.query(Analysis).filter(Analysis.patient_id == patient_id).all()
+
+def test_imports_directory_and_resumes(db, tmp_path):
+    user = db.get(User, TEST_USER_ID)
+    ap = image_bytes()
+    write(tmp_path / "IMPORT-1" / "2024-01-02" / "AP.jpg", ap)
+    write(tmp_path / "IMPORT-1" / "2024-01-02" / "lat.png", image_bytes("PNG"))
+    # The same radiograph filed twice is imported once
+    write(tmp_path / "IMPORT-1" / "copy" / "ap.jpg", ap)
+    write(tmp_path / "IMPORT-2" / "ap.dcm", dicom_bytes("IMPORT-2"))
+    write(tmp_path / "IMPORT-3" / "ap.jpg", b"not an image at all")
+    write(tmp_path / "IMPORT-3" / "notes.txt", b"ignored")
+
+    studies = list(discover_studies(str(tmp_path)))
+    assert [study.patient_id for study in studies] == ["IMPORT-1", "IMPORT-1", "IMPORT-2", "IMPORT-3"]
+
+    report = import_studies(db, studies, user, batch_size=2)
+    assert (report.imported, report.skipped, report.rejected, report.failed) == (3, 0, 1, 0)
+    assert report.studies == 4 and report.studies_per_second > 0
+
+    db.expire_all()
+    first, = [a for a in analyses_of(db, "IMPORT-1") if a.lat_image_hash]
+    assert first.status == "done" and first.has_ap and first.has_lat
+    dicom_study, = analyses_of(db, "IMPORT-2")
+    assert dicom_study.status == "done" and dicom_study.modality == "DX"
+    assert db.get(Patient, "IMPORT-2") is not None
+    assert analyses_of(db, "IMPORT-3") == []
+
+    # Running it again skips everything that was imported
+    report = import_studies(db, discover_studies(str(tmp_path)), user, batch_size=10)
+    assert (report.imported, report.skipped, report.rejected) == (0, 3, 1)
+    assert len(analyses_of(db, "IMPORT-1")) == 2
+
+def test_resumes_interrupted_analyses(db, tmp_path, monkeypatch):
+    user = db.get(User, TEST_USER_ID)
+    manifest = tmp_path / "manifest.csv"
+    write(tmp_path / "images" / "a.jpg", image_bytes())
+    write(tmp_path / "images" / "b.jpg", image_bytes())
+    manifest.write_text(
+        "patient_id,ap_path,lat_path\n"
+        "RESUME-1,images/a.jpg,\n"
+        "RESUME-1,,images/b.jpg\n"
+    )
+
+    def interrupted(*args, **kwargs):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(bulk_import, "analyse_batch", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        import_studies(db, discover_studies(str(manifest)), user)
+    assert {a.status for a in analyses_of(db, "RESUME-1")} == {"queued"}
+
+    monkeypatch.undo()
+    report = import_studies(db, discover_studies(str(manifest)), user)
+    assert (report.imported, report.skipped) == (0, 2)
+
+    db.expire_all()
+    assert [a.status for a in analyses_of(db, "RESUME-1")] == ["done", "done"]
+
+def test_rejects_study_of_another_patient(db, tmp_path):
+    user = db.get(User, TEST_USER_ID)
+    path = write(tmp_path / "ap.dcm", dicom_bytes("SOMEONE"))
+
+    report = import_studies(db, [Study("OTHER", str(path), None)], user)
+    assert (report.imported, report.rejected) == (0, 1)
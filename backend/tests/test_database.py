@@ -0,0 +1,132 @@
+# tests/test_database.py
+import asyncio
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from fastapi.testclient import TestClient
+from fastapi import status
+
+from app.main import app
+from app import database
+from app.config import settings
+from app.database import MeteredQueuePool, async_database_url, configure_sqlite, engine_options
+
+client = TestClient(app)
+
+def test_pool_settings_apply_except_to_memory_sqlite(monkeypatch):
+    monkeypatch.setattr(settings, "DB_POOL_SIZE", 3)
+    monkeypatch.setattr(settings, "DB_MAX_OVERFLOW", 2)
+    options = engine_options("postgresql://db/wristsight")
+    assert options["poolclass"] is MeteredQueuePool
+    assert (options["pool_size"], options["max_overflow"]) == (3, 2)
+    assert "poolclass" not in engine_options("sqlite:///:memory:")
+
+def test_pool_metrics_count_checkouts_and_timeouts(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "DB_POOL_SIZE", 1)
+    monkeypatch.setattr(settings, "DB_MAX_OVERFLOW", 0)
+    monkeypatch.setattr(settings, "DB_POOL_TIMEOUT", 0.05)
+    url = f"sqlite:///{tmp_path / 'pool.db'}"
+    engine = create_engine(url, **engine_options(url))
+
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+        stats = engine.pool.metrics.snapshot(engine.pool)
+        assert stats["checked_out"] == 1 and stats["checkouts"] == 1
+
+        # The only connection is taken
+        with pytest.raises(PoolTimeoutError):
+            engine.connect()
+
+    stats = engine.pool.metrics.snapshot(engine.pool)
+    assert stats["checked_out"] == 0 and stats["timeouts"] == 1
+    assert stats["wait_seconds_max"] >= 0.05
+    engine.dispose()
+
+def test_async_database_url():
+    assert async_database_url("sqlite:///./wristsight.db") == "sqlite+aiosqlite:///./wristsight.db"
+    assert async_database_url("postgresql://u:p@db/ws") == "postgresql+asyncpg://u:p@db/ws"
+
+def test_db_runner_on_async_engine(tmp_path, monkeypatch):
+    pytest.importorskip("aiosqlite")
+    url = f"sqlite:///{tmp_path / 'async.db'}"
+    monkeypatch.setattr(settings, "DATABASE_URL", url)
+    monkeypatch.setattr(database, "_async_engine", None)
+    monkeypatch.setattr(database, "_async_sessionmaker", None)
+
+    async def query():
+        async with database.get_async_sessionmaker()() as session:
+            result = await database.DbRunner(session)(lambda db: db.execute(text("SELECT 41 + 1")).scalar())
+        stats = database.pool_stats()["async"]
+        await database._async_engine.dispose()
+        return result, stats
+
+    result, stats = asyncio.run(query())
+    assert result == 42
+    assert stats["checkouts"] >= 1
+
+def test_db_pool_endpoint():
+    response = client.get("/api/system/db-pool")
+    assert response.status_code == status.HTTP_200_OK
+    assert set(response.json()) == {"sync", "async"}
+
+def sqlite_engine(path, serialize_writes=True):
+    url = f"sqlite:///{path}"
+    engine = create_engine(url, **engine_options(url))
+    configure_sqlite(engine, serialize_writes)
+    return engine
+
+def test_sqlite_file_runs_in_wal_with_pragmas(tmp_path):
+    engine = sqlite_engine(tmp_path / "tuned.db")
+    with engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert connection.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        assert connection.execute(text("PRAGMA cache_size")).scalar() == -settings.SQLITE_CACHE_SIZE_KB
+    engine.dispose()
+
+def test_sqlite_writes_are_serialized(tmp_path):
+    engine = sqlite_engine(tmp_path / "writers.db")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE counter (n INTEGER)"))
+        connection.execute(text("INSERT INTO counter VALUES (0)"))
+    Session = sessionmaker(bind=engine)
+
+    # Every concurrent write transaction commits, none fails on SQLite's lock
+    def increment(_):
+        for _ in range(20):
+            with Session() as db:
+                db.execute(text("UPDATE counter SET n = n + 1"))
+                db.execute(text("SELECT n FROM counter")).scalar()
+                db.commit()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(increment, range(8)))
+
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT n FROM counter")).scalar() == 160
+    engine.dispose()
+
+def test_sqlite_writer_waits_for_open_write_transaction(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "SQLITE_WRITE_TIMEOUT", 0.05)
+    engine = sqlite_engine(tmp_path / "wait.db")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE t (n INTEGER)"))
+
+    with engine.connect() as first:
+        first.execute(text("INSERT INTO t VALUES (1)"))
+
+        def second_writer():
+            with engine.connect() as second:
+                # Reads go ahead while the first transaction is open
+                assert second.execute(text("SELECT COUNT(*) FROM t")).scalar() == 0
+                second.execute(text("INSERT INTO t VALUES (2)"))
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            with pytest.raises(PoolTimeoutError):
+                pool.submit(second_writer).result()
+
+        first.commit()
+        with engine.begin() as second:
+            second.execute(text("INSERT INTO t VALUES (2)"))
+    engine.dispose()
@@ -0,0 +1,103 @@
+# tests/test_dicom.py
+import io
+import uuid
+import numpy as np
+from datetime import date
+from fastapi.testclient import TestClient
+from fastapi import status
+
+from app.main import app
+from app.models import Analysis, ImageBlob, Patient
+from app.jobs import get_job_runner
+from app.storage import get_storage
+from app.ingest import sniff_format
+from app.dicom import read_header, decode_frame
+from app.measurements import measure_results
+
+from tests.conftest import TestingSessionLocal, dicom_bytes
+
+client = TestClient(app)
+
+def write(tmp_path, content):
+    path = tmp_path / f"{uuid.uuid4().hex}.dcm"
+    path.write_bytes(content)
+    return str(path)
+
+def test_header_is_read_without_pixels(tmp_path):
+    content = dicom_bytes(frames=3)
+    assert sniff_format(content[:132]) == "DICOM"
+
+    header = read_header(write(tmp_path, content))
+    assert header.patient_id == "DCM-001"
+    assert header.patient_name == "Doe^Jane"
+    assert header.study_date == date(2025, 3, 14)
+    assert header.modality == "DX"
+    assert header.pixel_spacing == (0.2, 0.1)
+    assert (header.rows, header.columns, header.frames, header.bits_stored) == (40, 60, 3, 12)
+
+def test_decodes_one_windowed_frame(tmp_path):
+    path = write(tmp_path, dicom_bytes(frames=3))
+
+    # Window 0..2000: frame 1 (1000) is mid grey, frame 2 (2000) white
+    assert np.asarray(decode_frame(path, 0)).max() == 0
+    middle = decode_frame(path, 1)
+    assert middle.mode == "L" and middle.size == (60, 40)
+    assert abs(int(np.asarray(middle)[0, 0]) - 127) <= 1
+    assert np.asarray(decode_frame(path, 2)).min() == 255
+    assert middle.info["pixel_spacing"] == (0.2, 0.1)
+
+    inverted = decode_frame(write(tmp_path, dicom_bytes(frames=3, photometric="MONOCHROME1")), 2)
+    assert np.asarray(inverted).max() == 0
+
+def test_dicom_upload_indexes_study_and_measures_in_mm():
+    get_job_runner().drain()
+    files = {"ap_image": ("ap.dcm", io.BytesIO(dicom_bytes("DCM-UPLOAD")), "application/dicom")}
+
+    # No patient_id: it comes from the header
+    response = client.post("/api/analyses", files=files)
+    assert response.status_code == status.HTTP_201_CREATED
+    analysis_id = response.json()["analysis_id"]
+    assert get_job_runner().drain() == 1
+
+    db = TestingSessionLocal()
+    try:
+        analysis = db.get(Analysis, analysis_id)
+        assert analysis.status == "done"
+        assert analysis.patient_id == "DCM-UPLOAD"
+        assert (analysis.study_date, analysis.modality) == (date(2025, 3, 14), "DX")
+        assert analysis.ap_pixel_spacing == [0.2, 0.1]
+        assert db.get(Patient, "DCM-UPLOAD").name == "Doe^Jane"
+
+        blob = db.get(ImageBlob, analysis.ap_image_hash)
+        assert blob.path.endswith(".dcm")
+        assert (blob.format, blob.width, blob.height, blob.bit_depth) == ("DICOM", 60, 40, 12)
+
+        result = get_storage().read_json(analysis.result_path)
+    finally:
+        db.close()
+
+    # Measured with the header's spacing, not the 0.1 mm default
+    assert result["ap_pixel_spacing"] == [0.2, 0.1]
+    assert result["measurements"] == measure_results([result])[0]
+    assert result["measurements"] != measure_results([dict(result, ap_pixel_spacing=None)])[0]
+
+    response = client.get(f"/api/analyses/{analysis_id}")
+    assert response.json()["study_date"] == "2025-03-14"
+    assert response.json()["modality"] == "DX"
+
+    response = client.get(f"/api/images/{analysis_id}/ap/original")
+    assert response.headers["content-type"] == "application/dicom"
+
+    response = client.get(f"/api/images/{analysis_id}/ap/thumb", headers={"Accept": "image/jpeg"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"] == "image/jpeg"
+
+def test_rejects_dicom_of_another_patient():
+    files = {"ap_image": ("ap.dcm", io.BytesIO(dicom_bytes("DCM-OTHER")), "application/dicom")}
+    response = client.post("/api/analyses", files=files, data={"patient_id": "someone-else"})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    # Without a PatientID in the header the form must name the patient
+    files = {"ap_image": ("ap.dcm", io.BytesIO(dicom_bytes("")), "application/dicom")}
+    response = client.post("/api/analyses", files=files)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
@@ -0,0 +1,58 @@
+# tests/test_export.py
+import io
+import csv
+import json
+import pytest
+from fastapi.testclient import TestClient
+from fastapi import status
+
+from app.main import app
+from app.export import iter_analyses, iter_export
+from app.jobs import get_job_runner
+
+from tests.conftest import create_analysis
+
+client = TestClient(app)
+
+@pytest.fixture(scope="module")
+def exported():
+    ids = [create_analysis("export-patient")["analysis_id"] for _ in range(3)]
+    get_job_runner().drain()
+    return ids
+
+def test_csv_export_has_a_row_per_measurement(exported):
+    response = client.get("/api/history/export", params={"format": "csv", "patient_id": "export-patient"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("text/csv")
+    assert "attachment" in response.headers["content-disposition"]
+
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert {row["analysis_id"] for row in rows} == set(exported)
+    assert all(row["patient_id"] == "export-patient" for row in rows)
+
+    details = [client.get(f"/api/analyses/{analysis_id}").json() for analysis_id in exported]
+    assert len(rows) == sum(max(len(detail["measurements"]), 1) for detail in details)
+
+def test_ndjson_export_is_oldest_first(exported):
+    response = client.get("/api/history/export", params={"format": "ndjson", "patient_id": "export-patient"})
+    assert response.status_code == status.HTTP_200_OK
+
+    analyses = [json.loads(line) for line in response.text.splitlines()]
+    assert {analysis["analysis_id"] for analysis in analyses} == set(exported)
+    timestamps = [analysis["timestamp"] for analysis in analyses]
+    assert timestamps == sorted(timestamps)
+    assert all(isinstance(analysis["measurements"], list) for analysis in analyses)
+
+def test_parquet_export_streams_row_groups(exported, db_session):
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    chunks = list(iter_export(iter_analyses(db_session, batch_size=2, patient_id="export-patient"), "parquet", batch_size=2))
+    assert len(chunks) > 1
+
+    table = pq.read_table(io.BytesIO(b"".join(chunks)))
+    assert set(table.column("analysis_id").to_pylist()) == set(exported)
+    assert table.schema.field("value").type == "double"
+
+def test_export_rejects_unknown_format():
+    response = client.get("/api/history/export", params={"format": "xlsx"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
@@ -0,0 +1,27 @@
+# tests/test_file_io.py
+import io
+import asyncio
+from fastapi import UploadFile
+
+from app import file_io
+
+def test_stream_upload_writes_in_chunks(tmp_path):
+    content = bytes(range(256)) * 1000
+    upload = UploadFile(file=io.BytesIO(content), filename="ap.jpg")
+    destination = str(tmp_path / "nested" / "ap.jpg")
+
+    written = asyncio.run(file_io.stream_upload(upload, destination, chunk_size=4096))
+
+    assert written == len(content)
+    with open(destination, "rb") as f:
+        assert f.read() == content
+    # No temporary file is left behind
+    assert sorted(p.name for p in (tmp_path / "nested").iterdir()) == ["ap.jpg"]
+
+def test_json_round_trip(tmp_path):
+    path = str(tmp_path / "results" / "a.json")
+    document = {"summary": "ok", "measurements": [{"label": "Radial Angle", "value": "22.3"}]}
+
+    asyncio.run(file_io.write_json_async(path, document))
+
+    assert asyncio.run(file_io.read_json_async(path)) == document
@@ -0,0 +1,112 @@
+# tests/test_history.py
+import io
+import os
+from datetime import datetime
+from fastapi.testclient import TestClient
+from fastapi import status
+
+from app.main import app
+from app.config import settings
+from app.jobs import get_job_runner
+from app.models import Analysis, PatientAccess
+
+from tests.conftest import TestingSessionLocal, TEST_USER_ID, create_analysis, image_bytes
+
+client = TestClient(app)
+
+def test_history_does_not_read_result_files():
+    analysis_id = create_analysis("history-patient")["analysis_id"]
+    get_job_runner().drain()
+
+    # Listing must be served from the database row alone
+    os.remove(os.path.join(settings.RESULTS_DIR, f"{analysis_id}.json"))
+
+    response = client.get("/api/history", params={"patient_id": "history-patient"})
+    assert response.status_code == status.HTTP_200_OK
+    records = response.json()
+    assert [record["id"] for record in records] == [analysis_id]
+    assert records[0]["summary"].startswith("Analysis of AP view")
+
+    response = client.get("/api/patients/history-patient/history")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()[0]["summary"] == records[0]["summary"]
+
+def test_detail_uses_denormalized_measurements():
+    analysis_id = create_analysis("detail-patient")["analysis_id"]
+    get_job_runner().drain()
+    os.remove(os.path.join(settings.RESULTS_DIR, f"{analysis_id}.json"))
+
+    response = client.get(f"/api/analyses/{analysis_id}")
+    assert response.status_code == status.HTTP_200_OK
+    body = response.json()
+    assert body["has_ap"] is True
+    assert body["has_lat"] is False
+    # AP-only studies report the four AP measurements
+    assert [m["label"] for m in body["measurements"]] == ["Radial Angle", "Radial Length", "Radial Shift", "Ulnar Variance"]
+
+def test_patients_are_served_from_the_patient_index():
+    first = create_analysis("picker-b")["analysis_id"]
+    create_analysis("picker-b")
+    create_analysis("picker-a")
+    create_analysis("picker-c")
+    create_analysis("other-picker")
+    get_job_runner().drain()
+
+    response = client.get("/api/patients", params={"q": "picker-", "limit": 2})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == ["picker-a", "picker-b"]
+
+    response = client.get("/api/patients", params={"q": "picker-", "cursor": response.headers["X-Next-Cursor"]})
+    assert response.json() == ["picker-c"]
+
+    db = TestingSessionLocal()
+    try:
+        entry = db.get(PatientAccess, (TEST_USER_ID, "picker-b"))
+        assert entry.study_count == 2 and entry.last_study_at is not None
+
+        # Deleting a patient's last study drops it from the picker
+        assert client.delete(f"/api/analyses/{first}").status_code == status.HTTP_204_NO_CONTENT
+        db.expire_all()
+        assert db.get(PatientAccess, (TEST_USER_ID, "picker-b")).study_count == 1
+        client.delete("/api/analyses", params={"patient_id": "picker-b"})
+        db.expire_all()
+        assert db.get(PatientAccess, (TEST_USER_ID, "picker-b")) is None
+    finally:
+        db.close()
+
+    assert client.get("/api/patients", params={"q": "picker-"}).json() == ["picker-a", "picker-c"]
+
+def test_patients_are_not_paged_without_a_limit():
+    for index in range(60):
+        create_analysis(f"unpaged-{index:02d}")
+    get_job_runner().drain()
+
+    response = client.get("/api/patients", params={"q": "unpaged-"})
+    assert response.json() == [f"unpaged-{index:02d}" for index in range(60)]
+    assert "X-Next-Cursor" not in response.headers
+
+def test_failed_analysis_is_dropped_from_the_patient_index(monkeypatch):
+    analysis_id = create_analysis("undo-patient")["analysis_id"]
+    get_job_runner().drain()
+    earlier = datetime(2020, 1, 1)
+    db = TestingSessionLocal()
+    try:
+        db.get(Analysis, analysis_id).timestamp = earlier
+        db.commit()
+    finally:
+        db.close()
+
+    # Queueing fails after the analysis was committed
+    def fail(*args):
+        raise RuntimeError("queue unavailable")
+    monkeypatch.setattr(get_job_runner(), "submit", fail)
+    files = {"ap_image": ("ap.jpg", io.BytesIO(image_bytes()), "image/jpeg")}
+    response = client.post("/api/analyses", files=files, data={"patient_id": "undo-patient"})
+    assert response.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
+
+    db = TestingSessionLocal()
+    try:
+        entry = db.get(PatientAccess, (TEST_USER_ID, "undo-patient"))
+        assert (entry.study_count, entry.last_study_at) == (1, earlier)
+    finally:
+        db.close()
@@ -0,0 +1,75 @@
+# tests/test_images.py
+import io
+import itertools
+import os
+import shutil
+from PIL import Image
+from fastapi.testclient import TestClient
+from fastapi import status
+
+from app.main import app
+from app.config import settings
+from app.images import derivative_path, render_derivative
+from app.jobs import get_job_runner
+
+client = TestClient(app)
+
+# A new shade per image, so uploads are not deduplicated between tests
+_shades = itertools.count(1)
+
+def jpeg_bytes(size=(2000, 1500)):
+    buffer = io.BytesIO()
+    Image.new("L", size, color=next(_shades)).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+def create_analysis():
+    files = {"ap_image": ("ap.jpg", io.BytesIO(jpeg_bytes()), "image/jpeg")}
+    response = client.post("/api/analyses", files=files, data={"patient_id": "images-patient"})
+    assert response.status_code == status.HTTP_201_CREATED
+    get_job_runner().drain()
+    return response.json()["analysis_id"]
+
+def test_derivatives_rendered_by_worker():
+    analysis_id = create_analysis()
+
+    for size, max_side in (("thumb", settings.THUMBNAIL_SIZE), ("preview", settings.PREVIEW_SIZE)):
+        with Image.open(derivative_path(analysis_id, "ap", size, "jpeg")) as img:
+            assert max(img.size) == max_side
+
+    body = client.get(f"/api/analyses/{analysis_id}").json()
+    assert body["ap_thumbnail_url"] == f"/api/images/{analysis_id}/ap/thumb"
+    assert body["lat_thumbnail_url"] is None
+
+    records = client.get("/api/history", params={"patient_id": "images-patient"}).json()
+    assert records[0]["thumbnail_url"] == body["ap_thumbnail_url"]
+
+def test_derivative_rendered_lazily_and_negotiated():
+    analysis_id = create_analysis()
+    shutil.rmtree(os.path.join(settings.IMAGES_DIR, analysis_id, "derived"))
+
+    response = client.get(f"/api/images/{analysis_id}/ap/thumb", headers={"Accept": "image/webp,*/*"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"] == "image/webp"
+    assert "max-age" in response.headers["cache-control"]
+    assert len(response.content) < 10_000
+
+    response = client.get(f"/api/images/{analysis_id}/ap/thumb", headers={"Accept": "image/jpeg"})
+    assert response.headers["content-type"] == "image/jpeg"
+    assert os.path.exists(derivative_path(analysis_id, "ap", "thumb", "jpeg"))
+
+def test_unknown_derivatives_are_not_found():
+    analysis_id = create_analysis()
+
+    assert client.get(f"/api/images/{analysis_id}/lat/thumb").status_code == status.HTTP_404_NOT_FOUND
+    assert client.get(f"/api/images/{analysis_id}/ap/huge").status_code == status.HTTP_404_NOT_FOUND
+    assert client.get("/api/images/../ap/thumb").status_code == status.HTTP_404_NOT_FOUND
+
+def test_16_bit_images_are_stretched_to_8_bit(tmp_path):
+    source = str(tmp_path / "deep.png")
+    Image.new("I;16", (600, 400), color=4000).save(source)
+
+    destination = render_derivative(source, str(tmp_path / "thumb.jpg"), 256, "jpeg")
+
+    with Image.open(destination) as img:
+        assert img.mode == "L"
+        assert img.size == (256, 171)
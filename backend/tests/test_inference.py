@@ -0,0 +1,70 @@
+# tests/test_inference.py
+from PIL import Image
+
+from app.inference import InferenceRequest, MockInferenceEngine
+from app.jobs import JobRunner, InProcessBroker
+from app.jobs import runner as runner_module
+
+from tests.conftest import image_bytes
+
+def test_mock_engine_is_deterministic():
+    engine = MockInferenceEngine()
+    engine.load()
+    requests = [InferenceRequest("a", ap_path="missing-ap.jpg"), InferenceRequest("b", lat_path="missing-lat.jpg")]
+
+    first = engine.predict_batch(requests)
+    assert first == engine.predict_batch(requests)
+
+    ap_result, lat_result = first
+    assert ap_result["has_ap"] and not ap_result["has_lat"]
+    assert {point["label"] for point in ap_result["ap_landmarks"]} >= {"radial_styloid", "ulnar_corner"}
+    assert [line["label"] for line in ap_result["ap_reference_lines"]] == ["Radial Axis", "Articular Surface"]
+    assert lat_result["ap_landmarks"] == []
+    assert len(lat_result["lat_landmarks"]) == 4
+
+def test_runner_groups_jobs_into_batches(monkeypatch, tmp_path):
+    batch_sizes = []
+
+    class CountingEngine(MockInferenceEngine):
+        def predict_batch(self, requests):
+            batch_sizes.append(len(requests))
+            return super().predict_batch(requests)
+
+    monkeypatch.setattr(runner_module, "get_engine", lambda: CountingEngine())
+
+    runner = JobRunner(InProcessBroker(), max_workers=0, batch_size=4)
+    for i in range(10):
+        ap_path = tmp_path / f"batch-{i}-ap.jpg"
+        ap_path.write_bytes(image_bytes())
+        runner.submit(f"batch-{i}", str(ap_path), None)
+
+    assert runner.drain() == 10
+    assert batch_sizes == [4, 4, 2]
+
+def test_failing_study_does_not_fail_its_batch(monkeypatch, tmp_path):
+    class PickyEngine(MockInferenceEngine):
+        def predict_batch(self, requests):
+            if any(request.analysis_id == "odd" for request in requests):
+                raise ValueError("unexpected image shape")
+            return super().predict_batch(requests)
+
+    decode_image = runner_module.decode_image
+
+    def bomb_aware_decode(path):
+        if "bomb" in path:
+            raise Image.DecompressionBombError("too many pixels")
+        return decode_image(path)
+
+    monkeypatch.setattr(runner_module, "get_engine", lambda: PickyEngine())
+    monkeypatch.setattr(runner_module, "decode_image", bomb_aware_decode)
+
+    messages = []
+    for analysis_id in ("first", "bomb", "odd", "last"):
+        ap_path = tmp_path / f"{analysis_id}-ap.jpg"
+        ap_path.write_bytes(image_bytes())
+        messages.append({"analysis_id": analysis_id, "ap_path": str(ap_path), "lat_path": None})
+
+    first, bomb, odd, last = runner_module.run_analysis_batch(messages)
+    assert "result" in first and "result" in last
+    assert "too many pixels" in bomb["error"]
+    assert odd == {"error": "unexpected image shape"}
@@ -0,0 +1,124 @@
+# tests/test_ingest.py
+import io
+import os
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from fastapi import status, HTTPException
+
+from app.main import app
+from app.config import settings
+from app.ingest import UploadValidationMiddleware
+from app.models import Analysis, ImageBlob
+from app.jobs import get_job_runner
+from app.storage import get_storage
+
+from tests.conftest import TestingSessionLocal, image_bytes
+
+client = TestClient(app)
+
+def post(content, filename="ap.jpg"):
+    files = {"ap_image": (filename, io.BytesIO(content), "image/jpeg")}
+    return client.post("/api/analyses", files=files, data={"patient_id": "ingest-patient"})
+
+def staged_files():
+    return set(os.listdir(settings.UPLOAD_TMP_DIR)) if os.path.isdir(settings.UPLOAD_TMP_DIR) else set()
+
+def test_rejects_non_images_without_storing_them():
+    before = staged_files()
+
+    response = post(b"%PDF-1.7 definitely not a radiograph")
+    assert response.status_code == status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+    assert "ap_image" in response.json()["detail"]
+
+    # A known signature followed by garbage fails the header check
+    response = post(b"\x89PNG\r\n\x1a\n" + os.urandom(64))
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    assert staged_files() == before
+
+def test_rejects_oversized_uploads(monkeypatch):
+    monkeypatch.setattr(settings, "MAX_UPLOAD_BYTES", 1024)
+    response = post(image_bytes(size=(256, 256)))
+    assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+    monkeypatch.setattr(settings, "MAX_UPLOAD_BYTES", 50 * 1024 * 1024)
+    monkeypatch.setattr(settings, "MAX_IMAGE_PIXELS", 100 * 100)
+    response = post(image_bytes(size=(200, 200)))
+    assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    assert "pixels" in response.json()["detail"]
+
+def test_rejects_oversized_request_bodies():
+    body = b"x" * (settings.MAX_REQUEST_BYTES + 1)
+    response = client.post(
+        "/api/analyses",
+        content=body,
+        headers={"Content-Type": "multipart/form-data; boundary=x"}
+    )
+    assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+def test_rejects_uploads_while_they_arrive():
+    boundary = "upload-boundary"
+    head = (
+        f"--{boundary}\r\n"
+        'Content-Disposition: form-data; name="ap_image"; filename="ap.jpg"\r\n'
+        "Content-Type: image/jpeg\r\n\r\n"
+    ).encode() + b"%PDF-1.7 definitely not a radiograph"
+    chunks = [head] + [b"x" * 65536] * 16 + [f"\r\n--{boundary}--\r\n".encode()]
+    received = []
+
+    async def receive():
+        chunk = chunks[len(received)]
+        received.append(chunk)
+        return {"type": "http.request", "body": chunk, "more_body": len(received) < len(chunks)}
+
+    async def endpoint(scope, receive, send):
+        while (await receive())["more_body"]:
+            pass
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/api/analyses",
+        "headers": [(b"content-type", f"multipart/form-data; boundary={boundary}".encode())]
+    }
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(UploadValidationMiddleware(endpoint, ["/api/analyses"])(scope, receive, None))
+    assert exc_info.value.status_code == status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+    assert "ap_image" in exc_info.value.detail
+
+    # Rejected once enough bytes arrived to tell the format; the rest was never read
+    assert len(received) == 2
+
+def test_png_upload_is_recorded_and_decoded_once():
+    get_job_runner().drain()
+    content = image_bytes("PNG", size=(120, 90))
+
+    # The sniffed format wins over the client's file name and content type
+    response = post(content, filename="ap.jpg")
+    assert response.status_code == status.HTTP_201_CREATED
+    analysis_id = response.json()["analysis_id"]
+    assert get_job_runner().drain() == 1
+
+    db = TestingSessionLocal()
+    try:
+        analysis = db.get(Analysis, analysis_id)
+        blob = db.get(ImageBlob, analysis.ap_image_hash)
+        assert analysis.status == "done"
+        assert blob.path.endswith(".png")
+        assert (blob.format, blob.width, blob.height, blob.bit_depth) == ("PNG", 120, 90, 8)
+        result = get_storage().read_json(analysis.result_path)
+    finally:
+        db.close()
+
+    # The mock engine placed landmarks on the decoded pixels
+    landmarks = result["ap_landmarks"]
+    assert landmarks and all(0 <= point["x"] <= 120 and 0 <= point["y"] <= 90 for point in landmarks)
+
+    response = client.get(f"/api/images/{analysis_id}/ap/original")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"] == "image/png"
+    assert response.content == content
+
+    response = client.get(f"/api/images/{analysis_id}/ap/thumb")
+    assert response.status_code == status.HTTP_200_OK
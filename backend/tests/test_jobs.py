@@ -0,0 +1,107 @@
+# tests/test_jobs.py
+import time
+from fastapi.testclient import TestClient
+from fastapi import status
+
+from app.main import app
+from app.jobs import get_job_runner, JobRunner, InProcessBroker, SQLiteBroker
+from app.jobs import runner as runner_module
+
+from tests.conftest import create_analysis
+
+client = TestClient(app)
+
+def submit(patient_id="jobs-patient"):
+    # Start from an empty queue
+    get_job_runner().drain()
+    # Distinct content so the result cache never answers for the job
+    created = create_analysis(patient_id, view="lat_image")
+    assert created["status"] == "queued"
+    return created["analysis_id"]
+
+def get_status(analysis_id):
+    response = client.get(f"/api/analyses/{analysis_id}/status")
+    assert response.status_code == status.HTTP_200_OK
+    return response.json()
+
+def test_job_moves_from_queued_to_done():
+    analysis_id = submit()
+    assert get_status(analysis_id)["status"] == "queued"
+
+    # Detail is available while pending, without results
+    response = client.get(f"/api/analyses/{analysis_id}")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["measurements"] == []
+
+    assert get_job_runner().drain() == 1
+    assert get_status(analysis_id) == {"analysis_id": analysis_id, "status": "done", "error": None}
+
+    response = client.get(f"/api/analyses/{analysis_id}")
+    assert response.json()["has_lat"] is True
+    assert [m["label"] for m in response.json()["measurements"]] == ["Palmar Tilt", "Dorsal Shift"]
+
+def test_failed_job_records_error(monkeypatch):
+    def broken_batch(messages):
+        raise RuntimeError("model crashed")
+
+    monkeypatch.setattr(runner_module, "run_analysis_batch", broken_batch)
+
+    analysis_id = submit()
+    get_job_runner().drain()
+
+    assert get_status(analysis_id) == {"analysis_id": analysis_id, "status": "failed", "error": "model crashed"}
+
+def test_status_of_unknown_analysis():
+    response = client.get("/api/analyses/does-not-exist/status")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+def test_dispatcher_runs_jobs_on_process_pool():
+    runner = JobRunner(InProcessBroker(), max_workers=1)
+    analysis_id = submit()
+    # Move the job over from the application's queue
+    runner.broker.publish(get_job_runner().broker.fetch(timeout=0)[1])
+
+    runner.start()
+    try:
+        deadline = time.monotonic() + 30
+        while get_status(analysis_id)["status"] != "done" and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        runner.stop()
+
+    assert get_status(analysis_id)["status"] == "done"
+
+def test_sqlite_broker_claims_acks_and_requeues(tmp_path):
+    broker = SQLiteBroker(str(tmp_path / "jobs.db"))
+    broker.publish({"analysis_id": "a"})
+    broker.publish({"analysis_id": "b"})
+
+    tag, message = broker.fetch(timeout=0)
+    assert message == {"analysis_id": "a"}
+    assert broker.pending() == 1
+
+    broker.requeue(tag)
+    assert broker.pending() == 2
+
+    tag, message = broker.fetch(timeout=0)
+    broker.ack(tag)
+    tag, message = broker.fetch(timeout=0)
+    assert message == {"analysis_id": "b"}
+    broker.ack(tag)
+
+    assert broker.fetch(timeout=0) is None
+    assert broker.pending() == 0
+
+def test_sqlite_broker_delivers_expired_claims_again(tmp_path):
+    broker = SQLiteBroker(str(tmp_path / "jobs.db"), lease_seconds=0.1)
+    broker.publish({"analysis_id": "a"})
+
+    # Claimed by a consumer that dies without acking
+    tag, message = broker.fetch(timeout=0)
+    assert broker.fetch(timeout=0) is None
+
+    time.sleep(0.2)
+    redelivered = broker.fetch(timeout=0)
+    assert redelivered == (tag, {"analysis_id": "a"})
+    broker.ack(tag)
+    assert broker.fetch(timeout=0) is None
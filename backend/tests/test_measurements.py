@@ -0,0 +1,95 @@
+# tests/test_measurements.py
+import numpy as np
+import pytest
+
+from app import file_io
+from app.measurements import compute_ap_measurements, compute_lat_measurements, compute_measurements
+from app.maintenance import recompute_measurements
+from app.inference import cache as inference_cache
+from app.models import Analysis
+from app.utils import generate_mock_analysis
+
+from tests.conftest import TEST_USER_ID
+
+# Vertical shaft, articular surface rising 10 px over 10 px towards the styloid
+AP = [[0, 100], [0, 50], [-10, 0], [10, 20], [15, 18]]
+LAT = [[0, 100], [0, 50], [-10, 10], [10, 14]]
+
+def test_ap_geometry():
+    values = compute_ap_measurements(np.array([AP]), pixel_spacing=0.5)
+
+    assert values["Radial Angle"][0] == pytest.approx(45.0)
+    assert values["Radial Length"][0] == pytest.approx(9.0)   # 18 px * 0.5 mm
+    assert values["Ulnar Variance"][0] == pytest.approx(1.0)  # ulnar head 2 px distal
+    assert values["Radial Shift"][0] == pytest.approx(0.0)
+
+def test_lat_geometry():
+    values = compute_lat_measurements(np.array([LAT]), pixel_spacing=1.0)
+
+    assert values["Palmar Tilt"][0] == pytest.approx(np.degrees(np.arctan2(4, 20)))
+    assert values["Dorsal Shift"][0] == pytest.approx(0.0)
+
+def test_batch_is_rotation_invariant_and_spacing_aware():
+    theta = np.radians(30)
+    rotation = np.array([[np.cos(theta), -np.sin(theta)], [np.sin(theta), np.cos(theta)]])
+    rotated = np.array(AP) @ rotation.T
+
+    # Second study is the first one rotated, third is imaged at twice the resolution
+    batch = np.stack([AP, rotated, np.array(AP) * 2])
+    values = compute_ap_measurements(batch, pixel_spacing=[1.0, 1.0, 0.5])
+
+    for label in values:
+        np.testing.assert_allclose(values[label], values[label][0], atol=1e-9)
+
+def test_spacing_of_two_studies_must_be_unambiguous():
+    batch = np.stack([AP, np.array(AP) * 2])
+    with pytest.raises(ValueError):
+        compute_ap_measurements(batch, pixel_spacing=[1.0, 0.5])
+
+    # Per-study scalars as a column
+    values = compute_ap_measurements(batch, pixel_spacing=[[1.0], [0.5]])
+    np.testing.assert_allclose(values["Radial Length"], values["Radial Length"][0])
+
+    # One (row, column) pair for both, or equal values either way
+    assert compute_ap_measurements(batch, pixel_spacing=[0.5, 0.5])["Radial Length"][1] == pytest.approx(18.0)
+
+def test_missing_view_yields_nan():
+    ap = np.array([AP, np.full((5, 2), np.nan)])
+    lat = np.array([np.full((4, 2), np.nan), LAT])
+
+    values = compute_measurements(ap, lat)
+
+    assert np.isfinite(values["Radial Angle"][0]) and np.isnan(values["Radial Angle"][1])
+    assert np.isnan(values["Palmar Tilt"][0]) and np.isfinite(values["Palmar Tilt"][1])
+
+def test_recompute_updates_rows_and_files(db_session, tmp_path):
+    result = generate_mock_analysis("ap.jpg", "lat.jpg")
+    result["measurements"] = [{"label": "Radial Angle", "value": "0.0", "unit": "°"}]
+    result_path = file_io.write_json(str(tmp_path / "recompute.json"), result)
+
+    db_session.add(Analysis(
+        id="recompute-analysis",
+        patient_id="recompute-patient",
+        result_path=result_path,
+        status="done",
+        user_id=TEST_USER_ID
+    ))
+    db_session.commit()
+
+    assert recompute_measurements(db_session, batch_size=10) >= 1
+
+    analysis = db_session.query(Analysis).filter(Analysis.id == "recompute-analysis").first()
+    db_session.refresh(analysis)
+    assert len(analysis.measurements) == 6
+    assert file_io.read_json(result_path)["measurements"] == analysis.measurements
+
+def test_recompute_updates_cached_results(db_session):
+    result = generate_mock_analysis("ap.jpg", "lat.jpg")
+    result["measurements"] = [{"label": "Radial Angle", "value": "0.0", "unit": "°"}]
+    inference_cache.store(db_session, "recompute-ap:recompute-lat", result)
+
+    recompute_measurements(db_session, batch_size=10)
+
+    cached = inference_cache.lookup(db_session, "recompute-ap:recompute-lat")
+    assert len(cached["measurements"]) == 6
+    assert cached["ap_landmarks"] == result["ap_landmarks"]
@@ -0,0 +1,79 @@
+# tests/test_pagination.py
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from fastapi import status
+
+from app.main import app
+from app.models import Analysis, User
+
+from tests.conftest import TEST_USER_ID
+
+client = TestClient(app)
+
+PATIENT = "paging-patient"
+
+def setup_module():
+    from tests.conftest import TestingSessionLocal
+    db = TestingSessionLocal()
+    start = datetime(2024, 1, 1)
+    # Pairs of analyses share a timestamp, so the id has to break ties
+    for i in range(25):
+        db.add(Analysis(
+            id=f"paging-{i:02d}",
+            patient_id=PATIENT,
+            timestamp=start + timedelta(hours=i // 2),
+            status="done",
+            user_id=TEST_USER_ID
+        ))
+    for i in range(5):
+        db.add(User(email=f"paging{i}@wristsight.ai", username=f"paging{i}", password="x"))
+    db.commit()
+    db.close()
+
+def fetch(cursor=None, **params):
+    params = {"patient_id": PATIENT, "limit": 10, **params}
+    if cursor:
+        params["cursor"] = cursor
+    response = client.get("/api/history", params=params)
+    assert response.status_code == status.HTTP_200_OK
+    return [record["id"] for record in response.json()], response.headers
+
+def test_cursor_walks_forward_and_back():
+    expected = [f"paging-{i:02d}" for i in reversed(range(25))]
+
+    first, headers = fetch(include_total=True)
+    assert headers["X-Total-Count"] == "25"
+    assert "X-Prev-Cursor" not in headers
+
+    second, second_headers = fetch(headers["X-Next-Cursor"])
+    third, third_headers = fetch(second_headers["X-Next-Cursor"])
+    assert first + second + third == expected
+    assert "X-Next-Cursor" not in third_headers
+    assert "X-Total-Count" not in second_headers
+
+    back, back_headers = fetch(third_headers["X-Prev-Cursor"])
+    assert back == second
+    back, back_headers = fetch(back_headers["X-Prev-Cursor"])
+    assert back == first
+    assert "X-Prev-Cursor" not in back_headers
+
+def test_skip_still_supported():
+    records, _ = fetch(skip=20)
+    assert records == [f"paging-{i:02d}" for i in reversed(range(5))]
+
+def test_invalid_cursor_is_rejected():
+    response = client.get("/api/history", params={"cursor": "not-a-cursor"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+def test_users_cursor_pagination():
+    response = client.get("/api/auth/users", params={"limit": 2, "include_total": True})
+    assert response.status_code == status.HTTP_200_OK
+    total = int(response.headers["X-Total-Count"])
+
+    seen = [user["id"] for user in response.json()]
+    while "X-Next-Cursor" in response.headers:
+        response = client.get("/api/auth/users", params={"limit": 2, "cursor": response.headers["X-Next-Cursor"]})
+        seen += [user["id"] for user in response.json()]
+
+    assert seen == sorted(seen)
+    assert len(seen) == total
@@ -0,0 +1,122 @@
+# tests/test_response_cache.py
+import time
+from sqlalchemy import event
+from fastapi.testclient import TestClient
+from fastapi import status
+
+from app.main import app
+from app.jobs import get_job_runner
+from app.models import Analysis
+from app.cache import TTLCache
+from app.response_cache import ResponseCache, analysis_key, create_shared_cache, get_response_cache
+
+from tests.conftest import engine, create_analysis, TEST_USER_ID
+
+client = TestClient(app)
+
+def analysis_queries(fn):
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if "FROM analyses" in statement:
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        result = fn()
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    return result, statements
+
+def test_finished_analysis_is_served_from_cache_with_etag():
+    analysis_id = create_analysis("etag-detail")["analysis_id"]
+    get_job_runner().drain()
+    get_response_cache().clear()
+
+    first = client.get(f"/api/analyses/{analysis_id}")
+    assert first.status_code == status.HTTP_200_OK
+    assert first.json()["status"] == "done"
+    etag = first.headers["ETag"]
+
+    # Hits only read the row version, and an unchanged copy is not sent again
+    second, statements = analysis_queries(lambda: client.get(f"/api/analyses/{analysis_id}"))
+    assert len(statements) == 1 and "analyses.updated_at" in statements[0]
+    assert second.content == first.content and second.headers["ETag"] == etag
+
+    not_modified, statements = analysis_queries(
+        lambda: client.get(f"/api/analyses/{analysis_id}", headers={"If-None-Match": etag})
+    )
+    assert len(statements) == 1
+    assert not_modified.status_code == status.HTTP_304_NOT_MODIFIED
+    assert not_modified.content == b""
+
+    # Deleted analyses are not served from the cache, in any process
+    assert client.delete(f"/api/analyses/{analysis_id}").status_code == status.HTTP_204_NO_CONTENT
+    assert client.get(f"/api/analyses/{analysis_id}").status_code == status.HTTP_404_NOT_FOUND
+
+def test_changed_analysis_is_not_served_from_cache(db_session):
+    analysis_id = create_analysis("etag-changed")["analysis_id"]
+    get_job_runner().drain()
+    first = client.get(f"/api/analyses/{analysis_id}")
+
+    # Changed by another worker, whose cache this process knows nothing of
+    analysis = db_session.get(Analysis, analysis_id)
+    analysis.notes = "Reviewed"
+    db_session.commit()
+
+    changed = client.get(f"/api/analyses/{analysis_id}", headers={"If-None-Match": first.headers["ETag"]})
+    assert changed.status_code == status.HTTP_200_OK
+    assert changed.json()["notes"] == "Reviewed"
+
+def test_pending_analysis_is_not_cached(db_session):
+    analysis = Analysis(id="etag-pending-1", patient_id="etag-pending", status="queued", user_id=TEST_USER_ID)
+    db_session.add(analysis)
+    db_session.commit()
+
+    response = client.get(f"/api/analyses/{analysis.id}")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["status"] == "queued"
+    assert get_response_cache().get(analysis_key(analysis.id, analysis.updated_at)) is None
+
+    db_session.delete(analysis)
+    db_session.commit()
+
+def test_history_pages_answer_not_modified():
+    create_analysis("etag-history")
+    get_job_runner().drain()
+
+    first = client.get("/api/history", params={"patient_id": "etag-history"})
+    assert first.status_code == status.HTTP_200_OK
+    etag = first.headers["ETag"]
+
+    unchanged = client.get("/api/history", params={"patient_id": "etag-history"}, headers={"If-None-Match": etag})
+    assert unchanged.status_code == status.HTTP_304_NOT_MODIFIED
+
+    create_analysis("etag-history")
+    get_job_runner().drain()
+    changed = client.get("/api/patients/etag-history/history", headers={"If-None-Match": etag})
+    assert changed.status_code == status.HTTP_200_OK
+    assert len(changed.json()) == 2
+
+def test_shared_tier_is_seen_by_other_processes(tmp_path):
+    url = f"sqlite:///{tmp_path / 'cache.db'}"
+    writer, reader = create_shared_cache(url), create_shared_cache(url)
+
+    writer.set("analysis:a", {"body": "{}", "etag": '"x"', "user_id": 1}, ttl=60)
+    value, left = reader.get("analysis:a")
+    assert value == {"body": "{}", "etag": '"x"', "user_id": 1}
+    assert 0 < left <= 60
+
+    writer.delete_many(["analysis:a"])
+    assert reader.get("analysis:a") is None
+
+def test_shared_hits_keep_their_expiry_locally(tmp_path):
+    shared = create_shared_cache(f"sqlite:///{tmp_path / 'cache.db'}")
+    cache = ResponseCache(TTLCache(maxsize=10, ttl=60), shared)
+
+    # Rendered by another process a while ago
+    shared.set("analysis:a", {"body": "{}"}, ttl=0.2)
+    assert cache.get("analysis:a") == {"body": "{}"}
+
+    time.sleep(0.3)
+    assert cache.get("analysis:a") is None
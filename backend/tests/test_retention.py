@@ -0,0 +1,70 @@
+# tests/test_retention.py
+import os
+import hashlib
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from fastapi import status
+
+from app.main import app
+from app import counters
+from app.models import Analysis, ImageBlob, PendingFileDeletion
+from app.jobs import get_job_runner
+from app.retention import purge_analyses, get_file_cleaner
+
+from tests.conftest import TEST_USER_ID, create_analysis, image_bytes
+
+client = TestClient(app)
+
+def test_purge_deletes_old_analyses_in_batches_and_queues_files(db_session):
+    get_job_runner().drain()
+    old = [create_analysis("retention-old")["analysis_id"] for _ in range(3)]
+    recent = create_analysis("retention-old")["analysis_id"]
+    get_job_runner().drain()
+
+    db_session.query(Analysis).filter(Analysis.id.in_(old)).update(
+        {"timestamp": datetime.utcnow() - timedelta(days=400)}, synchronize_session=False
+    )
+    db_session.commit()
+    paths = [db_session.get(Analysis, analysis_id).ap_image_path for analysis_id in old]
+    results = [db_session.get(Analysis, analysis_id).result_path for analysis_id in old]
+
+    cutoff = datetime.utcnow() - timedelta(days=365)
+    deleted = purge_analyses(db_session, older_than=cutoff, patient_id="retention-old", batch_size=2, pause=0)
+    assert deleted == 3
+    assert db_session.query(Analysis).filter(Analysis.patient_id == "retention-old").count() == 1
+    assert db_session.get(Analysis, recent) is not None
+
+    # Files stay until the cleaner gets to them
+    assert all(os.path.exists(path) for path in results)
+    assert get_file_cleaner().drain() >= 6
+    assert db_session.query(PendingFileDeletion).count() == 0
+    assert not any(os.path.exists(path) for path in paths + results)
+
+    # Counters were kept in step by the set-based delete
+    assert counters.read_stats(db_session)["by_patient"]["retention-old"] == 1
+
+def test_cleaner_keeps_blobs_uploaded_again(db_session):
+    content = image_bytes()
+    first = create_analysis("retention-reupload", content)["analysis_id"]
+    path = db_session.get(Analysis, first).ap_image_path
+
+    assert client.delete(f"/api/analyses/{first}").status_code == status.HTTP_204_NO_CONTENT
+    assert db_session.get(ImageBlob, hashlib.sha256(content).hexdigest()) is None
+
+    # Uploaded again before the cleaner ran
+    create_analysis("retention-reupload", content)
+    get_file_cleaner().drain()
+    assert os.path.exists(path)
+
+def test_bulk_delete_by_patient_and_user(db_session):
+    for _ in range(2):
+        create_analysis("retention-bulk")
+    create_analysis("retention-other")
+
+    assert client.delete("/api/analyses").status_code == status.HTTP_400_BAD_REQUEST
+
+    response = client.delete("/api/analyses", params={"patient_id": "retention-bulk", "user_id": TEST_USER_ID})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"deleted": 2}
+    assert db_session.query(Analysis).filter(Analysis.patient_id == "retention-bulk").count() == 0
+    assert db_session.query(Analysis).filter(Analysis.patient_id == "retention-other").count() == 1
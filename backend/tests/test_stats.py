@@ -0,0 +1,53 @@
+# tests/test_stats.py
+from fastapi.testclient import TestClient
+from fastapi import status
+
+from app.main import app
+from app import counters
+from app.jobs import get_job_runner
+
+from tests.conftest import TestingSessionLocal, create_analysis
+
+client = TestClient(app)
+
+def recompute():
+    db = TestingSessionLocal()
+    try:
+        return counters.recompute(db)
+    finally:
+        db.close()
+
+def get_stats():
+    response = client.get("/api/analyses/stats")
+    assert response.status_code == status.HTTP_200_OK
+    return response.json()
+
+def test_stats_route_is_not_shadowed_by_analysis_detail():
+    recompute()
+    stats = get_stats()
+    assert set(stats) == {"total_analyses", "by_user", "by_patient", "by_status"}
+
+def test_counters_follow_create_job_and_delete():
+    get_job_runner().drain()
+    before = recompute()
+
+    first = create_analysis("stats-patient")["analysis_id"]
+    create_analysis("stats-patient")
+    stats = get_stats()
+    assert stats["total_analyses"] == before["total_analyses"] + 2
+    assert stats["by_patient"]["stats-patient"] == 2
+    assert stats["by_user"]["tester"] == before["by_user"].get("tester", 0) + 2
+    assert stats["by_status"]["queued"] == before["by_status"].get("queued", 0) + 2
+
+    get_job_runner().drain()
+    stats = get_stats()
+    assert stats["by_status"].get("queued", 0) == 0
+    assert stats["by_status"]["done"] == before["by_status"].get("done", 0) + 2
+
+    assert client.delete(f"/api/analyses/{first}").status_code == status.HTTP_204_NO_CONTENT
+    stats = get_stats()
+    assert stats["by_patient"]["stats-patient"] == 1
+    assert stats["total_analyses"] == before["total_analyses"] + 1
+
+    # Incremental counters agree with a full recompute
+    assert recompute() == stats
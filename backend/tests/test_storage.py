@@ -0,0 +1,153 @@
+# tests/test_storage.py
+"""
+Storage backends and image serving.
+
+The S3 backend runs against moto's S3-compatible server (a local MinIO-style
+stand-in) and is skipped when moto or boto3 are not installed.
+"""
+import io
+import uuid
+import pytest
+from PIL import Image
+from fastapi.testclient import TestClient
+from fastapi import status
+
+from app.main import app
+from app import storage as storage_module
+from app.storage import FileSystemStorage, create_storage
+from app.jobs import get_job_runner
+from app.retention import get_file_cleaner
+
+client = TestClient(app)
+
+@pytest.fixture(scope="module")
+def s3_endpoint():
+    pytest.importorskip("boto3")
+    server_module = pytest.importorskip("moto.server")
+
+    server = server_module.ThreadedMotoServer(ip_address="127.0.0.1", port=0)
+    server.start()
+    host, port = server.get_host_and_port()
+    yield f"http://{host}:{port}"
+    server.stop()
+
+@pytest.fixture
+def s3_storage(s3_endpoint, monkeypatch):
+    import boto3
+
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    bucket = f"wristsight-{uuid.uuid4().hex[:8]}"
+    boto3.client("s3", endpoint_url=s3_endpoint, region_name="us-east-1").create_bucket(Bucket=bucket)
+
+    return create_storage(f"s3://{bucket}/replica?endpoint_url={s3_endpoint}&region=us-east-1")
+
+@pytest.fixture(params=["filesystem", "s3"])
+def backend(request, tmp_path):
+    if request.param == "filesystem":
+        return FileSystemStorage(str(tmp_path))
+    return request.getfixturevalue("s3_storage")
+
+def test_backend_round_trip(backend, tmp_path):
+    backend.write_json("static/results/a.json", {"summary": "ok"})
+    assert backend.read_json("static/results/a.json") == {"summary": "ok"}
+
+    source = tmp_path / "upload.bin"
+    source.write_bytes(b"0123456789")
+    backend.put_file("static/images/x/ap.jpg", str(source), move=True)
+    assert not source.exists()
+
+    assert backend.exists("static/images/x/ap.jpg")
+    info = backend.stat("static/images/x/ap.jpg")
+    assert info.size == 10 and info.etag
+    assert b"".join(backend.iter_range("static/images/x/ap.jpg", 2, 5)) == b"2345"
+
+    with backend.local_path("static/images/x/ap.jpg") as path:
+        with open(path, "rb") as f:
+            assert f.read() == b"0123456789"
+
+    backend.write_bytes("static/images/x/derived/ap_thumb.jpg", b"thumb")
+    assert backend.delete_prefix("static/images/x/") == 2
+    assert not backend.exists("static/images/x/ap.jpg")
+
+    backend.delete("static/results/a.json")
+    backend.delete("static/results/a.json")
+    with pytest.raises(FileNotFoundError):
+        backend.read_bytes("static/results/a.json")
+    with pytest.raises(FileNotFoundError):
+        backend.stat("static/results/a.json")
+
+def test_create_storage_urls():
+    assert isinstance(create_storage("file://."), FileSystemStorage)
+    with pytest.raises(ValueError):
+        create_storage("ftp://example.com")
+
+def jpeg_bytes():
+    buffer = io.BytesIO()
+    Image.new("L", (600, 400), color=(uuid.uuid4().int % 200) + 20).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+def create_analysis(content):
+    get_job_runner().drain()
+    files = {"ap_image": ("ap.jpg", io.BytesIO(content), "image/jpeg")}
+    response = client.post("/api/analyses", files=files, data={"patient_id": "storage-patient"})
+    assert response.status_code == status.HTTP_201_CREATED
+    get_job_runner().drain()
+    return response.json()["analysis_id"]
+
+def test_app_runs_on_s3_storage(s3_storage, monkeypatch):
+    monkeypatch.setattr(storage_module, "_storage", s3_storage)
+    content = jpeg_bytes()
+    analysis_id = create_analysis(content)
+
+    detail = client.get(f"/api/analyses/{analysis_id}").json()
+    assert detail["status"] == "done"
+    assert client.get(detail["ap_image_url"]).content == content
+    assert client.get(detail["ap_thumbnail_url"]).status_code == status.HTTP_200_OK
+    assert s3_storage.exists(f"static/results/{analysis_id}.json")
+
+    assert client.delete(f"/api/analyses/{analysis_id}").status_code == status.HTTP_204_NO_CONTENT
+    get_file_cleaner().drain()
+    assert not s3_storage.exists(f"static/results/{analysis_id}.json")
+    assert not s3_storage.exists(f"static/images/{analysis_id}/derived/ap_thumb.jpg")
+
+def test_image_etag_and_cache_headers():
+    analysis_id = create_analysis(jpeg_bytes())
+    url = f"/api/images/{analysis_id}/ap/thumb"
+
+    response = client.get(url)
+    assert response.status_code == status.HTTP_200_OK
+    etag = response.headers["etag"]
+    assert "immutable" in response.headers["cache-control"]
+    assert response.headers["accept-ranges"] == "bytes"
+
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+    assert client.get(url, headers={"If-None-Match": '"stale"'}).status_code == status.HTTP_200_OK
+
+def test_image_range_requests():
+    content = jpeg_bytes()
+    url = f"/api/images/{create_analysis(content)}/ap/original"
+    etag = client.get(url).headers["etag"]
+
+    response = client.get(url, headers={"Range": "bytes=10-19"})
+    assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+    assert response.content == content[10:20]
+    assert response.headers["content-range"] == f"bytes 10-19/{len(content)}"
+
+    response = client.get(url, headers={"Range": "bytes=-5"})
+    assert response.content == content[-5:]
+
+    response = client.get(url, headers={"Range": f"bytes={len(content)}-"})
+    assert response.status_code == status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+    assert response.headers["content-range"] == f"bytes */{len(content)}"
+
+    # A stale validator turns the range request into a full response
+    response = client.get(url, headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.content == content
+    response = client.get(url, headers={"Range": "bytes=0-9", "If-Range": etag})
+    assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
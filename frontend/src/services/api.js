@@ -101,6 +101,32 @@ export const getCurrentUser = async () => {
   }
 };
 
+/**
+ * Poll the status of a queued analysis until it has finished
+ * @param {string} analysisId - Analysis ID returned on submission
+ * @param {number} intervalMs - Delay between polls
+ * @param {number} timeoutMs - Maximum time to wait
+ * @returns {Promise<Object>} - Final status response
+ */
+const waitForAnalysis = async (analysisId, intervalMs = 500, timeoutMs = 120000) => {
+  const deadline = Date.now() + timeoutMs;
+  
+  while (Date.now() < deadline) {
+    const response = await api.get(`/analyses/${analysisId}/status`);
+    
+    if (response.data.status === 'done') {
+      return response.data;
+    }
+    if (response.data.status === 'failed') {
+      throw new Error(`Analysis failed: ${response.data.error}`);
+    }
+    
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+  }
+  
+  throw new Error('Timed out waiting for analysis results');
+};
+
 /**
  * Run analysis on X-ray images
  * @param {FormData} formData - Form data containing patient ID, notes, and images
@@ -125,7 +151,12 @@ export const runAnalysis = async (formData) => {
     const submitData = await submitResponse.json();
     console.log('Submit response:', submitData);
     
-    // Step 2: Get the full analysis results using the returned ID
+    // Step 2: Wait for the background analysis job to finish
+    if (submitData.analysis_id) {
+      await waitForAnalysis(submitData.analysis_id);
+    }
+    
+    // Step 3: Get the full analysis results using the returned ID
     if (submitData.analysis_id) {
       console.log('Fetching full analysis results for ID:', submitData.analysis_id);
       const analysisResponse = await fetch(`${API_BASE_URL}/analyses/${submitData.analysis_id}`, {